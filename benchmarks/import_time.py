@@ -0,0 +1,51 @@
+"""Cold-start import cost of multi_ai_handler.
+
+Each scenario runs in a fresh interpreter so nothing is cached in ``sys.modules``.
+The "eager" scenario imports every provider SDK up front, which is what
+``import multi_ai_handler`` used to do.
+
+    python benchmarks/import_time.py [--runs 10]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "eager (all SDKs)": "import dotenv, anthropic, openai, requests; from google import genai\n"
+                        "try:\n    import ollama\nexcept ImportError:\n    pass\n"
+                        "import multi_ai_handler",
+    "import multi_ai_handler": "import multi_ai_handler",
+    "cerebras only": "from multi_ai_handler import CerebrasProvider",
+    "anthropic only": "from multi_ai_handler import AnthropicProvider",
+}
+
+
+def measure(code: str, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    baseline = statistics.median(measure("pass", args.runs))
+    print(f"interpreter startup: {baseline:.1f} ms (subtracted below)\n")
+    print(f"{'scenario':<26}{'median ms':>12}{'min ms':>10}")
+    for name, code in SCENARIOS.items():
+        timings = measure(code, args.runs)
+        print(f"{name:<26}{statistics.median(timings) - baseline:>12.1f}{min(timings) - baseline:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""Local mock server speaking the OpenAI, Anthropic, Gemini and Ollama wire protocols.
+
+One asyncio server answers all four APIs (their paths don't overlap), so the SDKs and the
+providers can be pointed at it with ``base_url``. Every response waits ``latency`` seconds
+before its first token and then produces ``output_tokens`` tokens of ``token_chars`` characters
+at ``tokens_per_second`` (0 for as fast as possible); streams send one token per chunk.
+
+    python benchmarks/mock_servers.py [--port 8765] [--latency 0.05] [--tokens-per-second 200] [--output-tokens 100] [--token-chars 6]
+
+Base URLs for a server on ``http://127.0.0.1:PORT``: OpenAI ``.../v1``, Anthropic, Gemini
+and Ollama the bare URL.
+"""
+import argparse
+import asyncio
+import json
+import re
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.05
+    tokens_per_second: float = 0.0
+    output_tokens: int = 100
+    token_chars: int = 6
+    input_tokens: int = 20
+
+    @property
+    def token(self) -> str:
+        return "x" * (self.token_chars - 1) + " "
+
+
+class MockServer:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        # Ollama models asked for so far, reported as loaded by /api/ps.
+        self.loaded: set[str] = set()
+
+    async def _tokens(self):
+        """Yield the response tokens, paced by the configured latency and token rate."""
+        config = self.config
+        await asyncio.sleep(config.latency)
+        start = time.monotonic()
+        for index in range(config.output_tokens):
+            if config.tokens_per_second:
+                delay = start + index / config.tokens_per_second - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield config.token
+
+    async def _text(self) -> str:
+        return "".join([token async for token in self._tokens()])
+
+    # OpenAI chat completions
+
+    def _openai_usage(self) -> dict:
+        return {"prompt_tokens": self.config.input_tokens, "completion_tokens": self.config.output_tokens, "total_tokens": self.config.input_tokens + self.config.output_tokens}
+
+    async def openai(self, body: dict, writer: asyncio.StreamWriter) -> None:
+        base = {"id": "chatcmpl-mock", "created": 0, "model": body.get("model", "mock")}
+        if not body.get("stream"):
+            text = await self._text()
+            return await _send_json(writer, {**base, "object": "chat.completion", "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}], "usage": self._openai_usage()})
+
+        await _start_stream(writer, "text/event-stream")
+        chunk = {**base, "object": "chat.completion.chunk"}
+        async for token in self._tokens():
+            await _send_chunk(writer, _sse({**chunk, "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}))
+        await _send_chunk(writer, _sse({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await _send_chunk(writer, _sse({**chunk, "choices": [], "usage": self._openai_usage()}))
+        await _send_chunk(writer, "data: [DONE]\n\n")
+        await _end_stream(writer)
+
+    # Anthropic messages
+
+    async def anthropic(self, body: dict, writer: asyncio.StreamWriter) -> None:
+        message = {"id": "msg_mock", "type": "message", "role": "assistant", "model": body.get("model", "mock"), "stop_sequence": None}
+        usage = {"input_tokens": self.config.input_tokens, "output_tokens": self.config.output_tokens}
+        if not body.get("stream"):
+            text = await self._text()
+            return await _send_json(writer, {**message, "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "usage": usage})
+
+        await _start_stream(writer, "text/event-stream")
+        await _send_chunk(writer, _sse({"type": "message_start", "message": {**message, "content": [], "stop_reason": None, "usage": {**usage, "output_tokens": 1}}}, "message_start"))
+        await _send_chunk(writer, _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start"))
+        async for token in self._tokens():
+            await _send_chunk(writer, _sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": token}}, "content_block_delta"))
+        await _send_chunk(writer, _sse({"type": "content_block_stop", "index": 0}, "content_block_stop"))
+        await _send_chunk(writer, _sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": self.config.output_tokens}}, "message_delta"))
+        await _send_chunk(writer, _sse({"type": "message_stop"}, "message_stop"))
+        await _end_stream(writer)
+
+    # Gemini generateContent
+
+    def _gemini_response(self, text: str, final: bool) -> dict:
+        candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+        response = {"candidates": [candidate], "modelVersion": "mock"}
+        if final:
+            candidate["finishReason"] = "STOP"
+            response["usageMetadata"] = {"promptTokenCount": self.config.input_tokens, "candidatesTokenCount": self.config.output_tokens, "totalTokenCount": self.config.input_tokens + self.config.output_tokens}
+        return response
+
+    async def gemini(self, body: dict, writer: asyncio.StreamWriter, stream: bool) -> None:
+        if not stream:
+            return await _send_json(writer, self._gemini_response(await self._text(), True))
+
+        await _start_stream(writer, "text/event-stream")
+        tokens = self.config.output_tokens
+        index = 0
+        async for token in self._tokens():
+            index += 1
+            await _send_chunk(writer, "data: " + json.dumps(self._gemini_response(token, index == tokens)) + "\r\n\r\n")
+        await _end_stream(writer)
+
+    # Ollama chat
+
+    def _ollama_message(self, body: dict, content: str, done: bool) -> dict:
+        message = {"model": body.get("model", "mock"), "created_at": "2025-01-01T00:00:00Z", "message": {"role": "assistant", "content": content}, "done": done}
+        if done:
+            message.update(done_reason="stop", total_duration=int(self.config.latency * 1e9), prompt_eval_count=self.config.input_tokens, eval_count=self.config.output_tokens)
+        return message
+
+    async def ollama(self, body: dict, writer: asyncio.StreamWriter) -> None:
+        self.loaded.add(body.get("model", "mock"))
+        if not body.get("stream", True):
+            return await _send_json(writer, self._ollama_message(body, await self._text(), True))
+
+        await _start_stream(writer, "application/x-ndjson")
+        async for token in self._tokens():
+            await _send_chunk(writer, json.dumps(self._ollama_message(body, token, False)) + "\n")
+        await _send_chunk(writer, json.dumps(self._ollama_message(body, "", True)) + "\n")
+        await _end_stream(writer)
+
+    async def handle(self, method: str, path: str, body: dict, writer: asyncio.StreamWriter) -> None:
+        route = path.split("?", 1)[0]
+        if method == "POST" and route.endswith("/chat/completions"):
+            return await self.openai(body, writer)
+        if method == "POST" and route == "/v1/messages":
+            return await self.anthropic(body, writer)
+        gemini = re.fullmatch(r"/v1beta/models/[^:]+:(generateContent|streamGenerateContent)", route)
+        if method == "POST" and gemini:
+            return await self.gemini(body, writer, gemini.group(1) == "streamGenerateContent")
+        if method == "POST" and route == "/api/chat":
+            return await self.ollama(body, writer)
+        if route == "/api/tags":
+            return await _send_json(writer, {"models": [{"name": "mock"}]})
+        if route == "/api/ps":
+            return await _send_json(writer, {"models": [{"name": name if ":" in name else f"{name}:latest"} for name in sorted(self.loaded)]})
+        if route in ("/", "/api/version"):
+            return await _send_json(writer, {"version": "mock"})
+        await _send_json(writer, {"error": {"message": f"Unknown route {method} {path}"}}, status="404 Not Found")
+
+    async def connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # HTTP/1.1 with keep-alive, as the SDKs pool their connections.
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                headers = {name.strip().lower(): value.strip() for name, _, value in (line.partition(":") for line in header_lines if line)}
+                length = int(headers.get("content-length", 0))
+                raw = await reader.readexactly(length) if length else b""
+                body = json.loads(raw) if raw else {}
+                await self.handle(method, path, body, writer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 0, ready=None) -> None:
+        server = await asyncio.start_server(self.connection, host, port, backlog=1024)
+        if ready is not None:
+            ready(server.sockets[0].getsockname()[1])
+        async with server:
+            await server.serve_forever()
+
+
+def _sse(data: dict, event: str | None = None) -> str:
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+
+
+async def _send_json(writer: asyncio.StreamWriter, data: dict, status: str = "200 OK") -> None:
+    body = json.dumps(data).encode()
+    writer.write(f"HTTP/1.1 {status}\r\ncontent-type: application/json\r\ncontent-length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+
+
+async def _start_stream(writer: asyncio.StreamWriter, content_type: str) -> None:
+    writer.write(f"HTTP/1.1 200 OK\r\ncontent-type: {content_type}\r\ntransfer-encoding: chunked\r\n\r\n".encode())
+    await writer.drain()
+
+
+async def _send_chunk(writer: asyncio.StreamWriter, data: str) -> None:
+    encoded = data.encode()
+    writer.write(b"%x\r\n%s\r\n" % (len(encoded), encoded))
+    await writer.drain()
+
+
+async def _end_stream(writer: asyncio.StreamWriter) -> None:
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+def start_process(config: MockConfig) -> tuple[subprocess.Popen, str]:
+    """Run a mock server in a separate process (so it doesn't compete with the client being measured); returns it and its URL."""
+    process = subprocess.Popen(
+        [sys.executable, __file__, "--port", "0", "--latency", str(config.latency), "--tokens-per-second", str(config.tokens_per_second), "--output-tokens", str(config.output_tokens), "--token-chars", str(config.token_chars)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    port = int(process.stdout.readline())
+    return process, f"http://127.0.0.1:{port}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--output-tokens", type=int, default=100)
+    parser.add_argument("--token-chars", type=int, default=6)
+    args = parser.parse_args()
+
+    server = MockServer(MockConfig(args.latency, args.tokens_per_second, args.output_tokens, args.token_chars))
+    # The port goes to stdout first so start_process can read it.
+    asyncio.run(server.serve(port=args.port, ready=lambda port: print(port, flush=True)))
+
+
+if __name__ == "__main__":
+    main()
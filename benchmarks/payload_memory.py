@@ -0,0 +1,82 @@
+"""Time and memory of building a request payload plus its history for a large file.
+
+For each provider format this builds the payload once, resolves its file references into
+the inline data that is sent, and keeps the history the way the providers do. It reports
+the build time, the peak memory while the request exists, and the memory the history
+still holds once the request payload is dropped. The file is never sent anywhere.
+
+    python benchmarks/payload_memory.py [--size-mb 50]
+"""
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# Run against the working tree, installed or not.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from multi_ai_handler.generate_payload import (
+    extend_history,
+    generate_claude_payload,
+    generate_google_payload,
+    generate_openai_payload,
+    resolve_claude_payload,
+    resolve_google_payload,
+    resolve_openai_payload,
+)
+
+ASSISTANT = {"role": "assistant", "content": "ok"}
+
+FORMATS = {
+    "claude": (lambda path: generate_claude_payload("Summarize", path), resolve_claude_payload),
+    "openai": (lambda path: generate_openai_payload("Summarize", "You are helpful.", path), resolve_openai_payload),
+    "google": (lambda path: generate_google_payload("Summarize", path), resolve_google_payload),
+}
+
+
+def run(path: str, generate, resolve) -> tuple[float, float, float]:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    payload = generate(path)
+    request_payload = resolve(payload)
+    history = extend_history(None, payload[-1], ASSISTANT)
+
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+
+    del payload, request_payload
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del history
+
+    return elapsed * 1000, peak / (1 << 20), retained / (1 << 20)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=50)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(b"%PDF-1.7\n" + os.urandom(args.size_mb << 20))
+
+    try:
+        print(f"{args.size_mb} MB PDF\n")
+        print(f"{'format':<8}{'time ms':>10}{'peak MB':>10}{'history MB':>12}")
+        for name, (generate, resolve) in FORMATS.items():
+            elapsed, peak, retained = run(path, generate, resolve)
+            print(f"{name:<8}{elapsed:>10.1f}{peak:>10.1f}{retained:>12.3f}")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""Throughput, time to first token and memory of multi_ai_handler against direct SDK calls.
+
+A mock server (see ``mock_servers.py``) plays the OpenAI, Anthropic, Gemini and Ollama APIs
+locally, so no network access or API keys are needed. Every scenario (provider, mode,
+concurrency, client) runs in a fresh interpreter: ``requests`` calls are spread over
+``concurrency`` threads (``request_ai``/``stream_ai``) or tasks (``arequest_ai``/``astream_ai``),
+and the same calls are made with the provider's SDK directly for comparison. The overhead
+column is the library's median latency minus the SDK's.
+
+    python benchmarks/throughput.py [--providers openai anthropic google ollama] [--modes request_ai stream_ai]
+        [--concurrency 1 16 64] [--requests 200] [--latency 0.05] [--tokens-per-second 0]
+        [--output-tokens 100] [--token-chars 6] [--json results.jsonl]
+
+With ``--json`` each run is appended as one JSON line (with the git commit), so results can be
+compared over time.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from mock_servers import MockConfig, start_process
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODEL = "mock"
+PROMPT = "Write a short poem about benchmarks."
+MODES = ("request_ai", "arequest_ai", "stream_ai", "astream_ai")
+
+# Registered provider path and its constructor config for a mock server at ``url``.
+PROVIDERS = {
+    "openai": ("multi_ai_handler.providers.openai:OpenAIProvider", lambda url: {"base_url": url + "/v1", "api_key": "bench", "max_retries": 0}),
+    "anthropic": ("multi_ai_handler.providers.anthropic:AnthropicProvider", lambda url: {"base_url": url, "api_key": "bench", "max_retries": 0}),
+    "google": ("multi_ai_handler.providers.google:GoogleProvider", lambda url: {"base_url": url, "api_key": "bench"}),
+    "ollama": ("multi_ai_handler.providers.ollama:OllamaProvider", lambda url: {"base_url": url}),
+}
+
+
+def library_calls(provider: str, url: str) -> dict:
+    from multi_ai_handler import arequest_ai, astream_ai, get_manager, request_ai, stream_ai
+
+    path, config = PROVIDERS[provider]
+    get_manager().register_provider(provider, path, **config(url))
+    kwargs = {"provider": provider, "model": MODEL, "user_text": PROMPT}
+    return {
+        "request_ai": lambda: request_ai(**kwargs).content,
+        "stream_ai": lambda: stream_ai(**kwargs),
+        "arequest_ai": lambda: arequest_ai(**kwargs),
+        "astream_ai": lambda: astream_ai(**kwargs),
+    }
+
+
+def sdk_calls(provider: str, url: str) -> dict:
+    messages = [{"role": "user", "content": PROMPT}]
+    # Async clients are created on first use, inside the event loop they belong to.
+
+    if provider == "openai":
+        from openai import AsyncOpenAI, OpenAI
+
+        client = OpenAI(base_url=url + "/v1", api_key="bench", max_retries=0)
+        async_client = functools.cache(lambda: AsyncOpenAI(base_url=url + "/v1", api_key="bench", max_retries=0))
+
+        def stream():
+            for chunk in client.chat.completions.create(model=MODEL, messages=messages, stream=True):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        async def astream():
+            async for chunk in await async_client().chat.completions.create(model=MODEL, messages=messages, stream=True):
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        async def agenerate():
+            return (await async_client().chat.completions.create(model=MODEL, messages=messages)).choices[0].message.content
+
+        return {"request_ai": lambda: client.chat.completions.create(model=MODEL, messages=messages).choices[0].message.content, "stream_ai": stream, "arequest_ai": agenerate, "astream_ai": astream}
+
+    if provider == "anthropic":
+        from anthropic import Anthropic, AsyncAnthropic
+
+        client = Anthropic(base_url=url, api_key="bench", max_retries=0)
+        async_client = functools.cache(lambda: AsyncAnthropic(base_url=url, api_key="bench", max_retries=0))
+
+        def stream():
+            with client.messages.stream(model=MODEL, max_tokens=20000, messages=messages) as response:
+                yield from response.text_stream
+
+        async def astream():
+            async with async_client().messages.stream(model=MODEL, max_tokens=20000, messages=messages) as response:
+                async for text in response.text_stream:
+                    yield text
+
+        async def agenerate():
+            return (await async_client().messages.create(model=MODEL, max_tokens=20000, messages=messages)).content[0].text
+
+        return {"request_ai": lambda: client.messages.create(model=MODEL, max_tokens=20000, messages=messages).content[0].text, "stream_ai": stream, "arequest_ai": agenerate, "astream_ai": astream}
+
+    if provider == "google":
+        from google import genai
+        from google.genai import types
+
+        http_options = types.HttpOptions(base_url=url)
+        client = genai.Client(api_key="bench", http_options=http_options)
+        async_client = functools.cache(lambda: genai.Client(api_key="bench", http_options=http_options).aio)
+
+        def stream():
+            for chunk in client.models.generate_content_stream(model=MODEL, contents=PROMPT):
+                if chunk.text:
+                    yield chunk.text
+
+        async def astream():
+            async for chunk in await async_client().models.generate_content_stream(model=MODEL, contents=PROMPT):
+                if chunk.text:
+                    yield chunk.text
+
+        async def agenerate():
+            return (await async_client().models.generate_content(model=MODEL, contents=PROMPT)).text
+
+        return {"request_ai": lambda: client.models.generate_content(model=MODEL, contents=PROMPT).text, "stream_ai": stream, "arequest_ai": agenerate, "astream_ai": astream}
+
+    if provider == "ollama":
+        import ollama
+
+        client = ollama.Client(host=url)
+        async_client = functools.cache(lambda: ollama.AsyncClient(host=url))
+
+        def stream():
+            for chunk in client.chat(model=MODEL, messages=messages, stream=True):
+                if chunk["message"]["content"]:
+                    yield chunk["message"]["content"]
+
+        async def astream():
+            async for chunk in await async_client().chat(model=MODEL, messages=messages, stream=True):
+                if chunk["message"]["content"]:
+                    yield chunk["message"]["content"]
+
+        async def agenerate():
+            return (await async_client().chat(model=MODEL, messages=messages))["message"]["content"]
+
+        return {"request_ai": lambda: client.chat(model=MODEL, messages=messages)["message"]["content"], "stream_ai": stream, "arequest_ai": agenerate, "astream_ai": astream}
+
+    raise ValueError(f"Unknown provider: {provider}")
+
+
+def _timed(call, stream: bool) -> tuple[float, float]:
+    start = time.perf_counter()
+    ttft = None
+    if stream:
+        for _ in call():
+            if ttft is None:
+                ttft = time.perf_counter() - start
+    else:
+        call()
+    latency = time.perf_counter() - start
+    return latency, ttft if ttft is not None else latency
+
+
+async def _atimed(call, stream: bool) -> tuple[float, float]:
+    start = time.perf_counter()
+    ttft = None
+    if stream:
+        async for _ in call():
+            if ttft is None:
+                ttft = time.perf_counter() - start
+    else:
+        await call()
+    latency = time.perf_counter() - start
+    return latency, ttft if ttft is not None else latency
+
+
+def run_sync(call, stream: bool, concurrency: int, requests: int) -> tuple[list, int, float]:
+    samples, errors = [], 0
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker() -> None:
+        nonlocal errors
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            try:
+                sample = _timed(call, stream)
+            except Exception:
+                with lock:
+                    errors += 1
+                continue
+            with lock:
+                samples.append(sample)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    return samples, errors, time.perf_counter() - start
+
+
+async def run_async(call, stream: bool, concurrency: int, requests: int) -> tuple[list, int, float]:
+    samples, errors = [], 0
+    remaining = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        while next(remaining, None) is not None:
+            try:
+                samples.append(await _atimed(call, stream))
+            except Exception:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, errors, time.perf_counter() - start
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1 << 20 if sys.platform == "darwin" else 1 << 10)
+
+
+def worker(scenario: dict) -> dict:
+    os.environ["OLLAMA_HOST"] = scenario["url"]
+    calls = (library_calls if scenario["client"] == "library" else sdk_calls)(scenario["provider"], scenario["url"])
+    mode = scenario["mode"]
+    call, stream = calls[mode], mode.endswith("stream_ai")
+
+    # One warm-up call loads the SDK and opens a connection before anything is measured.
+    if mode.startswith("a"):
+        async def main():
+            await _atimed(call, stream)
+            baseline = _peak_rss_mb()
+            return baseline, await run_async(call, stream, scenario["concurrency"], scenario["requests"])
+        baseline, (samples, errors, elapsed) = asyncio.run(main())
+    else:
+        _timed(call, stream)
+        baseline = _peak_rss_mb()
+        samples, errors, elapsed = run_sync(call, stream, scenario["concurrency"], scenario["requests"])
+
+    latencies = sorted(latency for latency, _ in samples)
+    ttfts = sorted(ttft for _, ttft in samples)
+    peak = _peak_rss_mb()
+    return {
+        **{key: scenario[key] for key in ("provider", "mode", "concurrency", "client", "requests")},
+        "errors": errors,
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "latency_p50_ms": statistics.median(latencies) * 1000 if latencies else None,
+        "ttft_p50_ms": statistics.median(ttfts) * 1000 if ttfts else None,
+        "ttft_p95_ms": ttfts[min(len(ttfts) - 1, int(0.95 * len(ttfts)))] * 1000 if ttfts else None,
+        "peak_rss_mb": peak,
+        "rss_growth_mb": peak - baseline,
+    }
+
+
+def run_scenario(scenario: dict) -> dict:
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(ROOT), os.environ.get("PYTHONPATH")]))}
+    result = subprocess.run([sys.executable, __file__, "--worker", json.dumps(scenario)], capture_output=True, text=True, env=env)
+    if result.returncode:
+        raise RuntimeError(f"Scenario {scenario} failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _ms(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--providers", nargs="+", default=list(PROVIDERS), choices=list(PROVIDERS))
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 16, 64])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--output-tokens", type=int, default=100)
+    parser.add_argument("--token-chars", type=int, default=6)
+    parser.add_argument("--json", help="Append the results as a JSON line to this file")
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(json.loads(args.worker))))
+        return
+
+    config = MockConfig(args.latency, args.tokens_per_second, args.output_tokens, args.token_chars)
+    server, url = start_process(config)
+    results = []
+    try:
+        print(f"mock latency {config.latency * 1000:.0f} ms, {config.output_tokens} tokens of {config.token_chars} chars at {config.tokens_per_second or 'unlimited'} tokens/s\n")
+        print(f"{'provider':<10}{'mode':<12}{'conc':>5}  {'client':<8}{'req/s':>9}{'p50 ms':>9}{'ttft p50':>10}{'ttft p95':>10}{'overhead':>10}{'peak MB':>9}{'+MB':>7}{'errors':>7}")
+        for provider in args.providers:
+            for mode in args.modes:
+                for concurrency in args.concurrency:
+                    sdk = None
+                    for client in ("sdk", "library"):
+                        result = run_scenario({"provider": provider, "mode": mode, "concurrency": concurrency, "client": client, "requests": max(args.requests, concurrency), "url": url})
+                        results.append(result)
+                        overhead = None
+                        if client == "sdk":
+                            sdk = result
+                        elif sdk["latency_p50_ms"] is not None and result["latency_p50_ms"] is not None:
+                            overhead = result["latency_p50_ms"] - sdk["latency_p50_ms"]
+                        print(f"{provider:<10}{mode:<12}{concurrency:>5}  {client:<8}{result['rps']:>9.1f}{_ms(result['latency_p50_ms']):>9}{_ms(result['ttft_p50_ms']):>10}{_ms(result['ttft_p95_ms']):>10}{_ms(overhead):>10}{result['peak_rss_mb']:>9.1f}{result['rss_growth_mb']:>7.1f}{result['errors']:>7}", flush=True)
+    finally:
+        server.terminate()
+        server.wait()
+
+    if args.json:
+        with open(args.json, "a") as f:
+            f.write(json.dumps({"time": time.time(), "commit": _git_commit(), "python": sys.version.split()[0], "config": vars(config), "results": results}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
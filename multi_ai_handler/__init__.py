@@ -1,9 +1,8 @@
-from dotenv import load_dotenv
-
-load_dotenv()
+import importlib
+from typing import TYPE_CHECKING
 
 from multi_ai_handler.multi_ai_handler import AIProviderManager
-from multi_ai_handler.utils import AIResponse, parse_ai_response, Conversation
+from multi_ai_handler.utils import AIResponse, AsyncStreamResult, RequestResult, StreamResult, Usage, parse_ai_response, Conversation
 from multi_ai_handler.interface import (
     request_ai,
     stream_ai,
@@ -11,16 +10,53 @@ from multi_ai_handler.interface import (
     list_models,
     arequest_ai,
     astream_ai,
+    request_many,
+    arequest_many,
+    get_manager,
 )
 
-from multi_ai_handler.providers.anthropic import AnthropicProvider
-from multi_ai_handler.providers.cerebras import CerebrasProvider
-from multi_ai_handler.providers.google import GoogleProvider
-from multi_ai_handler.providers.ollama import OllamaProvider
-from multi_ai_handler.providers.openai import OpenAIProvider
-from multi_ai_handler.providers.openrouter import OpenrouterProvider
-
 from multi_ai_handler.ai_provider import AIProvider
+from multi_ai_handler.batch import BatchJob
+from multi_ai_handler.circuit_breaker import CircuitBreaker, CircuitBreakers, CircuitOpenError
+from multi_ai_handler.hedging import HedgePolicy
+from multi_ai_handler.json_stream import AsyncJSONStreamResult, JSONStreamResult
+from multi_ai_handler.metrics import MetricsRegistry
+from multi_ai_handler.rate_limit import RateLimit, RateLimiter
+from multi_ai_handler.retry import RetryBudget, RetryPolicy
+from multi_ai_handler.routing import Router
+
+if TYPE_CHECKING:
+    from multi_ai_handler.providers.anthropic import AnthropicProvider
+    from multi_ai_handler.providers.cerebras import CerebrasProvider
+    from multi_ai_handler.providers.google import GoogleProvider
+    from multi_ai_handler.providers.ollama import OllamaProvider
+    from multi_ai_handler.providers.openai import OpenAIProvider
+    from multi_ai_handler.providers.openrouter import OpenrouterProvider
+    from multi_ai_handler.providers.replay import ReplayProvider
+
+# Provider classes are imported on first access so that only the SDKs actually used get loaded.
+_LAZY_PROVIDERS = {
+    "AnthropicProvider": "multi_ai_handler.providers.anthropic",
+    "CerebrasProvider": "multi_ai_handler.providers.cerebras",
+    "GoogleProvider": "multi_ai_handler.providers.google",
+    "OllamaProvider": "multi_ai_handler.providers.ollama",
+    "OpenAIProvider": "multi_ai_handler.providers.openai",
+    "OpenrouterProvider": "multi_ai_handler.providers.openrouter",
+    "ReplayProvider": "multi_ai_handler.providers.replay",
+}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_PROVIDERS:
+        value = getattr(importlib.import_module(_LAZY_PROVIDERS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(_LAZY_PROVIDERS))
+
 
 __all__ = [
     # Main unified interface
@@ -28,12 +64,32 @@ __all__ = [
     "stream_ai",
     "arequest_ai",
     "astream_ai",
+    "request_many",
+    "arequest_many",
     "AIProviderManager",
     "AIResponse",
+    "Usage",
+    "StreamResult",
+    "AsyncStreamResult",
+    "JSONStreamResult",
+    "AsyncJSONStreamResult",
+    "RequestResult",
+    "BatchJob",
+    "RetryPolicy",
+    "RetryBudget",
+    "RateLimiter",
+    "RateLimit",
+    "CircuitBreaker",
+    "CircuitBreakers",
+    "CircuitOpenError",
+    "HedgePolicy",
+    "Router",
+    "MetricsRegistry",
     "Conversation",
     "parse_ai_response",
     "get_model_info",
     "list_models",
+    "get_manager",
     # Provider-specific classes
     "AnthropicProvider",
     "CerebrasProvider",
@@ -41,5 +97,6 @@ __all__ = [
     "OllamaProvider",
     "OpenAIProvider",
     "OpenrouterProvider",
+    "ReplayProvider",
     "AIProvider"
 ]
\ No newline at end of file
@@ -2,16 +2,24 @@ from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Iterator, AsyncIterator, TYPE_CHECKING
 
+from multi_ai_handler import retry
+
 if TYPE_CHECKING:
+    from multi_ai_handler.metrics import MetricsRegistry
     from multi_ai_handler.utils import AIResponse
 
 class AIProvider(ABC):
+    # Set by the manager: payload build, file encoding and extraction times are recorded here under ``metrics_label``.
+    metrics: "MetricsRegistry | None" = None
+    metrics_label: str | None = None
+
     @abstractmethod
     def generate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> "AIResponse":
         pass
 
     @abstractmethod
     def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> Iterator[str]:
+        """Yield text chunks. To report usage, return a ``StreamResult`` over the chunks followed by a ``StreamInfo``."""
         pass
 
     @abstractmethod
@@ -29,3 +37,29 @@ class AIProvider(ABC):
     @abstractmethod
     def get_model_info(self, model: str) -> dict:
         pass
+
+    def submit_batch(self, requests: list[dict], model: str) -> str:
+        """Submit requests (generate kwargs plus a ``custom_id``) to the provider's batch endpoint and return the batch ID."""
+        raise NotImplementedError(f"{type(self).__name__} does not support batch requests")
+
+    def batch_status(self, batch_id: str) -> str:
+        """Return "in_progress", "ended" or "failed"."""
+        raise NotImplementedError(f"{type(self).__name__} does not support batch requests")
+
+    def batch_results(self, batch_id: str) -> dict[str, "str | Exception"]:
+        """Map each ``custom_id`` of an ended batch to its response text or error."""
+        raise NotImplementedError(f"{type(self).__name__} does not support batch requests")
+
+    def is_retryable(self, exc: Exception) -> bool:
+        """Whether a failed request is worth retrying; override to refine the generic status/transport classification."""
+        return retry.is_retryable(exc)
+
+    def is_missing_upload(self, exc: Exception) -> bool:
+        """Whether a request failed because a file uploaded in ``upload_files`` mode is gone on the provider's side; see ``reupload_missing_files``."""
+        return False
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        self.close()
@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+# Normalized batch statuses reported by providers' batch_status().
+IN_PROGRESS = "in_progress"
+ENDED = "ended"
+FAILED = "failed"
+
+
+class BatchRequestError(RuntimeError):
+    pass
+
+
+@dataclass
+class BatchJob:
+    """A submitted provider batch, persisted so polling can resume after a restart."""
+    provider: str
+    model: str
+    batch_id: str
+    size: int
+    json_output: bool = False
+    status: str = IN_PROGRESS
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    created_at: float = field(default_factory=time.time)
+
+    @property
+    def done(self) -> bool:
+        return self.status != IN_PROGRESS
+
+
+class BatchStore:
+    """Keeps one JSON file per pending batch job in a directory."""
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path).expanduser()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, job: BatchJob) -> Path:
+        return self.path / f"{job.id}.json"
+
+    def save(self, job: BatchJob) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(asdict(job), f)
+        os.replace(tmp, self._file(job))
+
+    def remove(self, job: BatchJob) -> None:
+        self._file(job).unlink(missing_ok=True)
+
+    def load_all(self) -> list[BatchJob]:
+        jobs = []
+        for file in sorted(self.path.glob("*.json")):
+            with open(file, "r", encoding="utf-8") as f:
+                jobs.append(BatchJob(**json.load(f)))
+        return sorted(jobs, key=lambda job: job.created_at)
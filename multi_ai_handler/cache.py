@@ -0,0 +1,255 @@
+import contextlib
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, Protocol
+
+
+def hash_key(*parts: str | bytes) -> str:
+    """Stable sha256 hex key for a tuple of parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode() if isinstance(part, str) else part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> str | None: ...
+
+    def set(self, key: str, value: str) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU, bounded by entry count and optionally by total characters."""
+
+    def __init__(self, max_entries: int = 128, max_bytes: int | None = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: OrderedDict[str, str] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        if self.max_bytes is not None and len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._data[key] = value
+            self._size += len(value)
+            while self._data and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes is not None and self._size > self.max_bytes)
+            ):
+                _, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class DirectoryCache:
+    """One file per key in a directory, shared by every process pointing at it.
+
+    Writes are atomic (temp file + rename); reads bump the file's mtime so eviction
+    removes the least recently used files once the directory exceeds ``max_bytes``.
+    The directory is only scanned when this process's running total crosses the limit,
+    and eviction then frees down to ``low_water`` of it so the next writes don't scan again.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 1 << 30, low_water: float = 0.9):
+        self.path = Path(path).expanduser()
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._size = sum(size for _, size, _ in self._entries())
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.cache"
+
+    def _entries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        for file in self.path.glob("*.cache"):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, file))
+        return entries
+
+    def get(self, key: str) -> str | None:
+        file = self._file(key)
+        try:
+            value = file.read_text(encoding="utf-8")
+            os.utime(file)
+        except FileNotFoundError:
+            return None
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        file = self._file(key)
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(value)
+            size = os.path.getsize(tmp)
+            try:
+                replaced = file.stat().st_size
+            except FileNotFoundError:
+                replaced = 0
+            os.replace(tmp, file)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._size += size - replaced
+            if self._size <= self.max_bytes:
+                return
+            self._evict()
+
+    def _evict(self) -> None:
+        # Rescanning also picks up what other processes wrote since the last count.
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water if total > self.max_bytes else total
+        entries.sort()
+        for _, size, file in entries:
+            if total <= target:
+                break
+            file.unlink(missing_ok=True)
+            total -= size
+        self._size = total
+
+    def clear(self) -> None:
+        with self._lock:
+            for file in self.path.glob("*.cache"):
+                file.unlink(missing_ok=True)
+            self._size = 0
+
+
+class SQLiteCache:
+    """Single-file SQLite store, safe to share between threads and processes.
+
+    The total size is kept in a meta row, so a write only touches the least recently
+    used rows (by the ``accessed`` index) once the store crosses ``max_bytes``; it is then
+    trimmed to ``low_water`` of the limit.
+    """
+
+    def __init__(self, path: str | Path, max_bytes: int = 1 << 30, low_water: float = 0.9):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        # Stores written before the meta table existed get their total counted once.
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) SELECT 'size', COALESCE(SUM(size), 0) FROM cache")
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock, self._transaction():
+            old = self._conn.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, size, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            total = self._add_size(len(value) - (old[0] if old else 0))
+            if total > self.max_bytes:
+                self._evict(total)
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[None]:
+        # IMMEDIATE takes the write lock up front, so concurrent processes can't both update the total from a stale read.
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _add_size(self, delta: int) -> int:
+        self._conn.execute("UPDATE meta SET value = value + ? WHERE name = 'size'", (delta,))
+        return self._conn.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+    def _evict(self, total: int) -> None:
+        target = self.max_bytes * self.low_water
+        stale = []
+        freed = 0
+        for key, size in self._conn.execute("SELECT key, size FROM cache ORDER BY accessed"):
+            if total - freed <= target:
+                break
+            stale.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", stale)
+        self._add_size(-freed)
+
+    def clear(self) -> None:
+        with self._lock, self._transaction():
+            self._conn.execute("DELETE FROM cache")
+            self._conn.execute("UPDATE meta SET value = 0 WHERE name = 'size'")
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class TieredCache:
+    """In-memory LRU in front of an optional persistent backend."""
+
+    def __init__(self, memory: LRUCache | None = None, backend: CacheBackend | None = None):
+        self.memory = memory if memory is not None else LRUCache()
+        self.backend = backend
+
+    def get(self, key: str) -> str | None:
+        value = self.memory.get(key)
+        if value is None and self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self.memory.set(key, value)
+        if self.backend is not None:
+            self.backend.set(key, value)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.backend is not None:
+            self.backend.clear()
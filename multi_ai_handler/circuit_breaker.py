@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class CircuitBreaker:
+    """Stops sending requests to a provider that is failing or too slow.
+
+    Calls from the last ``window`` seconds are tracked; once there are at least ``min_requests``,
+    the circuit opens if the share of failures reaches ``failure_rate`` or the share of calls
+    slower than ``slow_call_duration`` reaches ``slow_call_rate``. After ``open_duration`` seconds
+    it half-opens and lets ``half_open_requests`` probes through: a healthy probe closes it again,
+    a failed or slow one reopens it.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, min_requests: int = 10, window: float = 60.0, open_duration: float = 30.0, slow_call_duration: float | None = None, slow_call_rate: float = 0.5, half_open_requests: int = 1):
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.open_duration = open_duration
+        self.slow_call_duration = slow_call_duration
+        self.slow_call_rate = slow_call_rate
+        self.half_open_requests = half_open_requests
+        self._calls: deque[tuple[float, bool, bool]] = deque()
+        self._failures = 0
+        self._slow = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_duration:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now; in half-open state this claims one of the probe slots."""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_requests:
+                self._probes += 1
+                return True
+            return False
+
+    def release(self) -> None:
+        """Give back a half-open probe slot claimed by ``allow`` for a call that ended without an outcome (e.g. cancelled)."""
+        with self._lock:
+            if self._current_state() == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def _reset(self) -> None:
+        self._calls.clear()
+        self._failures = 0
+        self._slow = 0
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._reset()
+
+    def record(self, success: bool, latency: float) -> None:
+        slow = self.slow_call_duration is not None and latency >= self.slow_call_duration
+        with self._lock:
+            state = self._current_state()
+            if state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if success and not slow:
+                    self._state = CLOSED
+                    self._reset()
+                else:
+                    self._trip()
+                return
+            if state == OPEN:
+                # A call that started before the circuit opened.
+                return
+
+            now = time.monotonic()
+            self._calls.append((now, not success, slow))
+            self._failures += not success
+            self._slow += slow
+            while self._calls and self._calls[0][0] < now - self.window:
+                _, failed, was_slow = self._calls.popleft()
+                self._failures -= failed
+                self._slow -= was_slow
+
+            total = len(self._calls)
+            if total >= self.min_requests and (self._failures / total >= self.failure_rate or self._slow / total >= self.slow_call_rate):
+                self._trip()
+
+
+class CircuitBreakers:
+    """One ``CircuitBreaker`` per provider, created on first use from ``settings`` (CircuitBreaker keyword arguments)."""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(provider)
+            if breaker is None:
+                breaker = self._breakers[provider] = CircuitBreaker(**self.settings)
+            return breaker
+
+    def states(self) -> dict[str, str]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {provider: breaker.state for provider, breaker in breakers.items()}
@@ -1,63 +1,295 @@
 from pathlib import Path
 import base64
+import hashlib
+import importlib.util
 import io
 import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, TYPE_CHECKING
 
-try:
-    from docling.document_converter import DocumentConverter, PdfFormatOption
-    from docling.datamodel.base_models import InputFormat, DocumentStream
-    from docling.datamodel.pipeline_options import (
-        PdfPipelineOptions,
-        TableStructureOptions,
-        TableFormerMode,
-        EasyOcrOptions
-    )
-    from six import BytesIO
-    DOCLING_AVAILABLE = True
-except ImportError:
-    DOCLING_AVAILABLE = False
+from multi_ai_handler.cache import CacheBackend, LRUCache, TieredCache, hash_key
+from multi_ai_handler.metrics import timed
+
+if TYPE_CHECKING:
+    from docling.document_converter import DocumentConverter
+
+# Docling pulls in torch and its models, so it is only imported once a file is actually extracted.
+DOCLING_AVAILABLE = importlib.util.find_spec("docling") is not None
+# Page counts for page-parallel extraction; without it PDFs are converted in one piece.
+PYPDFIUM_AVAILABLE = importlib.util.find_spec("pypdfium2") is not None
 
 logging.getLogger("docling").setLevel(logging.ERROR)
 
-def extract_structured_md(filename: str, encoded_data: str,  ocr_threshold:float = 0.1) -> str:
+# Converters are expensive to build (TableFormer and EasyOCR models are loaded per pipeline),
+# so one initialized converter is kept per option set and shared by all extractions in the process.
+_converters: dict[tuple, "DocumentConverter"] = {}
+_converter_locks: dict[tuple, threading.Lock] = {}
+_converters_lock = threading.Lock()
+
+# Extracted markdown keyed by sha256 of the file bytes plus extraction options.
+_extraction_cache = TieredCache(LRUCache(max_entries=128))
+
+
+def configure_extraction_cache(max_entries: int = 128, max_bytes: int | None = None, backend: CacheBackend | None = None) -> None:
+    """Resize the in-memory extraction cache and optionally add a persistent tier.
+
+    ``backend`` is typically a ``DirectoryCache`` or ``SQLiteCache`` from ``multi_ai_handler.cache``,
+    which lets repeated documents skip OCR across processes and restarts.
+    """
+    global _extraction_cache
+    _extraction_cache = TieredCache(LRUCache(max_entries=max_entries, max_bytes=max_bytes), backend)
+
+
+def clear_extraction_cache() -> None:
+    _extraction_cache.clear()
+
+
+# Page-parallel PDF extraction runs page ranges in a pool of worker processes, each holding its
+# own cached converter. It is opt-in because the pool uses the "spawn" start method.
+_page_pool: ProcessPoolExecutor | None = None
+_page_pool_workers = 0
+_page_pool_lock = threading.Lock()
+_page_parallelism: dict | None = None
+
+
+def enable_page_parallelism(workers: int | None = None, min_pages: int = 64, pages_per_chunk: int = 8) -> None:
+    """Convert PDFs with at least ``min_pages`` pages in parallel page ranges across ``workers`` processes.
+
+    Applies to every ``extract_structured_md`` call, including local-mode and Ollama file requests.
+    Scripts using it must guard their entry point with ``if __name__ == "__main__":``.
+    """
+    global _page_parallelism
+    shutdown_page_pool()
+    _page_parallelism = {"workers": workers, "min_pages": min_pages, "pages_per_chunk": pages_per_chunk}
+
+
+def disable_page_parallelism() -> None:
+    global _page_parallelism
+    _page_parallelism = None
+    shutdown_page_pool()
+
+
+def _get_page_pool(workers: int | None) -> ProcessPoolExecutor:
+    global _page_pool, _page_pool_workers
+    workers = workers or os.cpu_count()
+    with _page_pool_lock:
+        if _page_pool is not None and _page_pool_workers != workers:
+            # Work already submitted to the old pool still finishes; it exits once that is done.
+            _page_pool.shutdown(wait=False)
+            _page_pool = None
+        if _page_pool is None:
+            _page_pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _page_pool_workers = workers
+        return _page_pool
+
+
+def shutdown_page_pool() -> None:
+    global _page_pool
+    with _page_pool_lock:
+        pool, _page_pool = _page_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def count_pdf_pages(file_bytes: bytes) -> int:
+    if not PYPDFIUM_AVAILABLE:
+        raise ImportError("pypdfium2 is not installed (used to split PDFs into page ranges). Install it with: pip install multi-ai-handler[docling]")
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(file_bytes)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _convert_page_range(path: str, ocr_threshold: float, table_mode: str, start: int, end: int) -> str:
+    converter = get_converter(".pdf", ocr_threshold, table_mode)
+    result = converter.convert(path, page_range=(start, end))
+    return result.document.export_to_markdown()
+
+
+def _require_docling() -> None:
     if not DOCLING_AVAILABLE:
         raise ImportError(
             "Docling is not installed (used for local file processing). Install it with: pip install multi-ai-handler[docling]"
         )
 
-    file_like = io.BytesIO(base64.b64decode(encoded_data))
-    ext = Path(filename).suffix.lower()
-    filename = filename
 
-    format_options = None
+def _converter_key(ext: str, ocr_threshold: float, table_mode: str) -> tuple:
+    if ext == ".pdf":
+        return ext, ocr_threshold, table_mode
+    return ("default",)
 
-    if ext == '.pdf':
-        table_opts = TableStructureOptions(
-            mode=TableFormerMode.ACCURATE,
-            do_cell_matching=True
-        )
 
-        ocr_opts = EasyOcrOptions(
-            lang=["en"],
-            force_full_page_ocr=False,
-            # confidence_threshold=0.5,
-            bitmap_area_threshold=ocr_threshold
-        )
+def _build_converter(ext: str, ocr_threshold: float, table_mode: str) -> "DocumentConverter":
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import (
+        PdfPipelineOptions,
+        TableStructureOptions,
+        TableFormerMode,
+        EasyOcrOptions
+    )
 
-        pipeline_opts = PdfPipelineOptions(
-            do_table_structure=True,
-            table_structure_options=table_opts,
-            ocr_options=ocr_opts
-        )
+    if ext != ".pdf":
+        return DocumentConverter()
+
+    table_opts = TableStructureOptions(
+        mode=TableFormerMode(table_mode),
+        do_cell_matching=True
+    )
 
-        format_options = {InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_opts)}
+    ocr_opts = EasyOcrOptions(
+        lang=["en"],
+        force_full_page_ocr=False,
+        # confidence_threshold=0.5,
+        bitmap_area_threshold=ocr_threshold
+    )
+
+    pipeline_opts = PdfPipelineOptions(
+        do_table_structure=True,
+        table_structure_options=table_opts,
+        ocr_options=ocr_opts
+    )
 
     converter = DocumentConverter(
-        format_options=format_options
+        format_options={InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_opts)}
     )
+    converter.initialize_pipeline(InputFormat.PDF)
+    return converter
+
+
+def get_converter(ext: str = ".pdf", ocr_threshold: float = 0.1, table_mode: str = "accurate") -> "DocumentConverter":
+    """Return the shared converter for a file extension and option set, building it on first use.
+
+    Concurrent callers asking for the same option set wait for a single initialization.
+    """
+    _require_docling()
+
+    key = _converter_key(ext.lower(), ocr_threshold, table_mode)
+    converter = _converters.get(key)
+    if converter is not None:
+        return converter
+
+    with _converters_lock:
+        lock = _converter_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        converter = _converters.get(key)
+        if converter is None:
+            converter = _build_converter(ext.lower(), ocr_threshold, table_mode)
+            _converters[key] = converter
+
+    return converter
+
+
+def warmup(extensions: tuple[str, ...] = (".pdf",), ocr_threshold: float = 0.1, table_mode: str = "accurate") -> None:
+    """Load the Docling models ahead of the first extraction (e.g. at worker start-up)."""
+    for ext in extensions:
+        get_converter(ext, ocr_threshold, table_mode)
+
+
+def clear_converters() -> None:
+    with _converters_lock:
+        _converters.clear()
+        _converter_locks.clear()
 
-    file_bytes = file_like.read()
-    doc_stream = DocumentStream(name=filename,stream=BytesIO(file_bytes))
+
+def _convert(filename: str, file_bytes: bytes, ocr_threshold: float, table_mode: str) -> str:
+    from docling.datamodel.base_models import DocumentStream
+
+    converter = get_converter(Path(filename).suffix.lower(), ocr_threshold, table_mode)
+
+    doc_stream = DocumentStream(name=filename, stream=io.BytesIO(file_bytes))
     result = converter.convert(doc_stream)
-    md = result.document.export_to_markdown()
+    return result.document.export_to_markdown()
+
+
+def iter_structured_md_pages(filename: str, encoded_data: str, ocr_threshold: float = 0.1, table_mode: str = "accurate", pages_per_chunk: int = 8, workers: int | None = None, page_count: int | None = None) -> Iterator[str]:
+    """Convert a PDF in page ranges on a process pool, yielding each range's markdown in page order.
+
+    Earlier ranges are yielded as soon as they finish while later ones are still converting.
+    Non-PDF files, and PDFs when pypdfium2 isn't installed, are converted in one piece.
+    Pass ``page_count`` if it is already known.
+    """
+    _require_docling()
+
+    ext = Path(filename).suffix.lower()
+    file_bytes = base64.b64decode(encoded_data)
+    if ext != ".pdf" or (page_count is None and not PYPDFIUM_AVAILABLE):
+        yield _convert(filename, file_bytes, ocr_threshold, table_mode)
+        return
+
+    digest = hashlib.sha256(file_bytes).digest()
+    if page_count is None:
+        page_count = count_pdf_pages(file_bytes)
+
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as f:
+        f.write(file_bytes)
+    del file_bytes
+
+    pool = _get_page_pool(workers)
+    # Page ranges are only kept in the persistent tier, where they let a large document's extraction
+    # resume across processes; in the in-memory LRU they would evict whole documents.
+    ranges = _extraction_cache.backend
+    chunks: list[tuple[str, str | Future]] = []
+    try:
+        for start in range(1, page_count + 1, pages_per_chunk):
+            end = min(start + pages_per_chunk - 1, page_count)
+            cache_key = hash_key(digest, ext, str(ocr_threshold), table_mode, f"{start}-{end}")
+            md = ranges.get(cache_key) if ranges is not None else None
+            if md is None:
+                md = pool.submit(_convert_page_range, path, ocr_threshold, table_mode, start, end)
+            chunks.append((cache_key, md))
+
+        for cache_key, md in chunks:
+            if isinstance(md, Future):
+                md = md.result()
+                if ranges is not None:
+                    ranges.set(cache_key, md)
+            yield md
+    finally:
+        for _, md in chunks:
+            if isinstance(md, Future):
+                md.cancel()
+        Path(path).unlink(missing_ok=True)
+
+
+def extract_structured_md(filename: str, encoded_data: str,  ocr_threshold:float = 0.1, table_mode: str = "accurate") -> str:
+    _require_docling()
+
+    ext = Path(filename).suffix.lower()
+    file_bytes = base64.b64decode(encoded_data)
+    cache_key = hash_key(hashlib.sha256(file_bytes).digest(), ext, str(ocr_threshold), table_mode)
+
+    md = _extraction_cache.get(cache_key)
+    if md is not None:
+        return md
+
+    settings = _page_parallelism
+    with timed("file_extraction_seconds"):
+        page_count = count_pdf_pages(file_bytes) if ext == ".pdf" and settings and PYPDFIUM_AVAILABLE else None
+        if page_count is not None and page_count >= settings["min_pages"]:
+            md = "\n\n".join(iter_structured_md_pages(
+                filename,
+                encoded_data,
+                ocr_threshold,
+                table_mode,
+                pages_per_chunk=settings["pages_per_chunk"],
+                workers=settings["workers"],
+                page_count=page_count,
+            ))
+        else:
+            md = _convert(filename, file_bytes, ocr_threshold, table_mode)
+
+    _extraction_cache.set(cache_key, md)
     return md
@@ -0,0 +1,200 @@
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+from multi_ai_handler.generate_payload import _read_file
+from multi_ai_handler.retry import status_code
+
+
+class FileUploadCache:
+    """Maps file content hashes to uploaded file IDs so each file is uploaded once.
+
+    Entries are namespaced per provider account and expire after their TTL. With ``path``,
+    the mapping is persisted as JSON so it survives restarts.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path).expanduser() if path else None
+        self._entries: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+        if self.path and self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = {key: (file_id, expires_at) for key, (file_id, expires_at) in json.load(f).items()}
+
+    def get(self, namespace: str, digest: str) -> str | None:
+        key = f"{namespace}:{digest}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            file_id, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            return file_id
+
+    def set(self, namespace: str, digest: str, file_id: str, ttl: float) -> None:
+        with self._lock:
+            now = time.time()
+            self._entries = {key: entry for key, entry in self._entries.items() if entry[1] > now}
+            self._entries[f"{namespace}:{digest}"] = (file_id, now + ttl)
+            self._save()
+
+    def discard(self, namespace: str, digest: str) -> None:
+        with self._lock:
+            if self._entries.pop(f"{namespace}:{digest}", None) is not None:
+                self._save()
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+
+
+default_upload_cache = FileUploadCache()
+
+
+def upload_namespace(provider: str, base_url: str | None, api_key: str | None) -> str:
+    """Uploaded files belong to an account on an endpoint, so cache entries are scoped to both."""
+    account = hashlib.sha256((api_key or "").encode()).hexdigest()[:16]
+    return f"{provider}:{base_url or ''}:{account}"
+
+
+def is_missing_file(exc: Exception) -> bool:
+    """Whether an Anthropic- or OpenAI-style API answered 404 ``not_found_error`` for a file the request references.
+
+    Other rejections of an attachment (too large, unreadable, unsupported type) aren't fixed by uploading it again.
+    """
+    if status_code(exc) != 404:
+        return False
+    body = getattr(exc, "body", None)
+    # Anthropic errors carry the whole response body, OpenAI errors only its "error" object.
+    error = body.get("error", body) if isinstance(body, dict) else None
+    if not isinstance(error, dict):
+        return False
+    return "not_found_error" in (error.get("type"), error.get("code")) and "file" in str(error.get("message", "")).lower()
+
+
+class CachedUpload:
+    """Wraps a provider upload function so identical file contents are only uploaded once per TTL."""
+
+    def __init__(self, cache: FileUploadCache, namespace: str, ttl: float, upload: Callable[[str, bytes, str], str]):
+        self.cache = cache
+        self.namespace = namespace
+        self.ttl = ttl
+        self.upload = upload
+
+    def __call__(self, filename: str, data: bytes, mime_type: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        file_id = self.cache.get(self.namespace, digest)
+        if file_id is None:
+            file_id = self.upload(filename, data, mime_type)
+            self.cache.set(self.namespace, digest, file_id, self.ttl)
+        return file_id
+
+    def forget(self, file: str | Path | dict) -> bool:
+        """Drop the cached upload of ``file`` so the next request uploads it again; False if it wasn't cached."""
+        _, data = _read_file(file)
+        if data is None:
+            return False
+        digest = hashlib.sha256(data).hexdigest()
+        if self.cache.get(self.namespace, digest) is None:
+            return False
+        self.cache.discard(self.namespace, digest)
+        return True
+
+
+def reupload_missing_files(method: Callable) -> Callable:
+    """Run a provider request once more, with the attachment uploaded again, if the provider no longer has the cached copy.
+
+    For ``generate``/``agenerate`` and the ``_stream``/``_astream`` generators of providers with
+    ``upload_files`` and a ``CachedUpload`` in ``_upload``; the provider's ``is_missing_upload`` decides
+    which errors mean the file is gone. Streams are only retried before their first chunk.
+    """
+    signature = inspect.signature(method)
+
+    def missing(provider, exc: Exception, args: tuple, kwargs: dict) -> str | Path | dict | None:
+        """The attachment, if ``exc`` says the provider lost its upload."""
+        if not provider.upload_files or not provider.is_missing_upload(exc):
+            return None
+        return signature.bind(provider, *args, **kwargs).arguments.get("file")
+
+    if inspect.isasyncgenfunction(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            iterator = method(self, *args, **kwargs)
+            try:
+                try:
+                    first = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                except Exception as e:
+                    await iterator.aclose()
+                    file = missing(self, e, args, kwargs)
+                    # Forgetting the upload reads and hashes the file.
+                    if file is None or not await asyncio.to_thread(self._upload.forget, file):
+                        raise
+                    iterator = method(self, *args, **kwargs)
+                    first = await anext(iterator)
+                yield first
+                async for chunk in iterator:
+                    yield chunk
+            finally:
+                # Also when the consumer stops early, so the provider's HTTP stream is released now.
+                await iterator.aclose()
+    elif inspect.isgeneratorfunction(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            iterator = method(self, *args, **kwargs)
+            try:
+                try:
+                    first = next(iterator)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    iterator.close()
+                    file = missing(self, e, args, kwargs)
+                    if file is None or not self._upload.forget(file):
+                        raise
+                    iterator = method(self, *args, **kwargs)
+                    first = next(iterator)
+                yield first
+                yield from iterator
+            finally:
+                iterator.close()
+    elif inspect.iscoroutinefunction(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await method(self, *args, **kwargs)
+            except Exception as e:
+                file = missing(self, e, args, kwargs)
+                if file is None or not await asyncio.to_thread(self._upload.forget, file):
+                    raise
+            return await method(self, *args, **kwargs)
+    else:
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except Exception as e:
+                file = missing(self, e, args, kwargs)
+                if file is None or not self._upload.forget(file):
+                    raise
+            return method(self, *args, **kwargs)
+
+    return wrapper
@@ -1,16 +1,23 @@
 import mimetypes
-from typing import Any
+from typing import Any, Callable
 import base64
+import mmap
 from pathlib import Path
 
 from multi_ai_handler.extract_md import extract_structured_md
+from multi_ai_handler.metrics import timed
 
-def _process_file(file: str | Path | dict | None) -> tuple[str | None, str | None]:
+# Uploads a file through a provider's files endpoint: (filename, data, mime_type) -> file ID or URI.
+Uploader = Callable[[str, bytes, str], str]
+
+
+def _read_file(file: str | Path | dict | None) -> tuple[str | None, bytes | None]:
     if file is None:
         return None, None
 
     if isinstance(file, dict):
-        return file.get("filename"), file.get("encoded_data")
+        encoded_data = file.get("encoded_data")
+        return file.get("filename"), base64.b64decode(encoded_data) if encoded_data else None
 
     file_path = Path(file)
     if not file_path.exists():
@@ -21,8 +28,27 @@ def _process_file(file: str | Path | dict | None) -> tuple[str | None, str | Non
     with open(file_path, "rb") as f:
         file_data = f.read()
 
-    encoded = base64.b64encode(file_data).decode()
-    return file_path.name, encoded
+    return file_path.name, file_data
+
+
+def _process_file(file: str | Path | dict | None) -> tuple[str | None, str | None]:
+    if isinstance(file, dict):
+        return file.get("filename"), file.get("encoded_data")
+
+    filename, file_data = _read_file(file)
+    if file_data is None:
+        return filename, None
+
+    with timed("file_encode_seconds"):
+        encoded = base64.b64encode(file_data).decode()
+    return filename, encoded
+
+
+def _guess_mime_type(filename: str) -> str:
+    mime_type, _ = mimetypes.guess_type(filename)
+    if not mime_type:
+        raise ValueError("Could not detect MIME type from filename.")
+    return mime_type
 
 
 def process_local_file(filename: str, encoded_data: str) -> str:
@@ -34,8 +60,107 @@ def process_local_file(filename: str, encoded_data: str) -> str:
 """)
 
 
-def build_openai_user_content(user_text: str | None, file: str | Path | dict | None=None, local: bool=False) -> list[dict[str, Any]]:
-    """Build user message content for OpenAI format."""
+def extend_history(messages: list[dict] | None, user_message: dict, assistant_message: dict) -> list[dict]:
+    """Return the conversation history after a turn.
+
+    ``user_message`` should be the last message of the generated payload (before
+    ``resolve_*_payload``), so the history keeps file references instead of base64 data.
+    """
+    history = list(messages) if messages else []
+    history.append(user_message)
+    history.append(assistant_message)
+    return history
+
+
+class AttachmentChangedError(ValueError):
+    """A file referenced by the history was modified or deleted, so the earlier turn can no longer be sent as it was."""
+
+
+def _file_ref(file: str | Path) -> dict[str, Any]:
+    """Lightweight handle to a file on disk, stored in payloads and history instead of its encoded contents."""
+    file_path = Path(file)
+    if not file_path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+    if not file_path.is_file():
+        raise ValueError(f"Path is not a file: {file_path}")
+
+    stat = file_path.stat()
+    return {
+        "file_ref": {
+            "path": str(file_path.resolve()),
+            "filename": file_path.name,
+            "mime_type": _guess_mime_type(file_path.name),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        }
+    }
+
+
+def _encode_file_ref(ref: dict[str, Any]) -> str:
+    file_path = Path(ref["path"])
+    try:
+        stat = file_path.stat()
+    except FileNotFoundError:
+        raise AttachmentChangedError(f"{file_path} was deleted after it was attached; clear the history that references it and attach the file again") from None
+    if stat.st_size != ref["size"] or stat.st_mtime_ns != ref["mtime_ns"]:
+        raise AttachmentChangedError(f"{file_path} was modified after it was attached; clear the history that references it and attach the file again")
+
+    if not stat.st_size:
+        return ""
+
+    # Encode straight from the page cache rather than reading the file into a bytes copy first.
+    with timed("file_encode_seconds"), open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return base64.b64encode(mapped).decode()
+
+
+def has_file_refs(messages: list[dict] | None) -> bool:
+    return any(
+        isinstance(block, dict) and "file_ref" in block
+        for message in messages or []
+        for key in ("content", "parts")
+        if isinstance(message.get(key), list)
+        for block in message[key]
+    )
+
+
+def _resolve_file_refs(payload: list[dict], key: str, build_block: Callable[[dict], dict | None]) -> list[dict]:
+    resolved = []
+
+    for message in payload:
+        blocks = message.get(key)
+        if isinstance(blocks, list) and any(isinstance(block, dict) and "file_ref" in block for block in blocks):
+            blocks = [build_block(block["file_ref"]) if "file_ref" in block else block for block in blocks]
+            message = {**message, key: [block for block in blocks if block is not None]}
+        resolved.append(message)
+
+    return resolved
+
+
+def _openai_file_block(filename: str, mime_type: str, encoded_data: str) -> dict[str, Any] | None:
+    data_url = f"data:{mime_type};base64,{encoded_data}"
+
+    if mime_type.startswith("image/"):
+        return {
+            "type": "image_url",
+            "image_url": {"url": data_url}
+        }
+    elif mime_type == "application/pdf":
+        return {
+            "type": "file",
+            "file": {
+                "filename": filename,
+                "file_data": data_url
+            }
+        }
+    return None
+
+
+def build_openai_user_content(user_text: str | None, file: str | Path | dict | None=None, local: bool=False, upload: Uploader | None=None) -> list[dict[str, Any]]:
+    """Build user message content for OpenAI format.
+
+    Files given by path are added as ``file_ref`` blocks; ``resolve_openai_payload`` inlines them.
+    With ``upload``, PDFs are referenced by file ID instead (images are always inlined).
+    """
     if not file and not user_text:
         raise ValueError("Either filename or user_text must be provided.")
 
@@ -48,17 +173,15 @@ def build_openai_user_content(user_text: str | None, file: str | Path | dict | N
         })
 
     if file:
-        filename, encoded_data = _process_file(file)
-
         if local:
+            filename, encoded_data = _process_file(file)
             content.append({
                 "type": "text",
                 "text": (user_text + "\n" if user_text else "") + process_local_file(filename, encoded_data)
             })
-        else:
-            mime_type, _ = mimetypes.guess_type(filename)
-            if not mime_type:
-                raise ValueError("Could not detect MIME type from filename.")
+        elif upload is not None:
+            filename, file_data = _read_file(file)
+            mime_type = _guess_mime_type(filename)
 
             if user_text:
                 content.append({
@@ -66,30 +189,52 @@ def build_openai_user_content(user_text: str | None, file: str | Path | dict | N
                     "text": user_text
                 })
 
-            data_url = f"data:{mime_type};base64,{encoded_data}"
+            if mime_type == "application/pdf":
+                block = {
+                    "type": "file",
+                    "file": {"file_id": upload(filename, file_data, mime_type)}
+                }
+            else:
+                block = _openai_file_block(filename, mime_type, base64.b64encode(file_data).decode())
+
+            if block is not None:
+                content.append(block)
+        elif isinstance(file, dict):
+            filename, encoded_data = _process_file(file)
+            mime_type = _guess_mime_type(filename)
 
-            if mime_type.startswith("image/"):
+            if user_text:
                 content.append({
-                    "type": "image_url",
-                    "image_url": {"url": data_url}
+                    "type": "text",
+                    "text": user_text
                 })
-            elif mime_type == "application/pdf":
+
+            block = _openai_file_block(filename, mime_type, encoded_data)
+            if block is not None:
+                content.append(block)
+        else:
+            ref = _file_ref(file)
+
+            if user_text:
                 content.append({
-                    "type": "file",
-                    "file": {
-                        "filename": filename,
-                        "file_data": data_url
-                    }
+                    "type": "text",
+                    "text": user_text
                 })
 
+            mime_type = ref["file_ref"]["mime_type"]
+            if mime_type.startswith("image/") or mime_type == "application/pdf":
+                content.append(ref)
+
     return content
 
 
-def generate_openai_payload(user_text: str | None, system_prompt: str, file: str | Path | dict | None=None, local: bool=False, messages: list[dict] | None=None) -> list[dict[str, Any]]:
+def generate_openai_payload(user_text: str | None, system_prompt: str, file: str | Path | dict | None=None, local: bool=False, messages: list[dict] | None=None, upload: Uploader | None=None) -> list[dict[str, Any]]:
     """Generate full message payload for OpenAI API.
 
     If messages is provided, it should contain the conversation history (without system message).
     The system message will be prepended, and the new user message will be appended.
+
+    Files attached by path come back as ``file_ref`` blocks; pass the payload through ``resolve_openai_payload`` before sending it.
     """
     result = []
 
@@ -104,7 +249,7 @@ def generate_openai_payload(user_text: str | None, system_prompt: str, file: str
         result.extend(messages)
 
     # Add new user message
-    content = build_openai_user_content(user_text, file, local)
+    content = build_openai_user_content(user_text, file, local, upload)
     result.append({
         "role": "user",
         "content": content
@@ -112,8 +257,27 @@ def generate_openai_payload(user_text: str | None, system_prompt: str, file: str
 
     return result
 
-def build_google_user_parts(user_text: str | None, file: str | Path | dict | None=None, local: bool=False) -> list[dict[str, Any]]:
-    """Build user message parts for Google format."""
+
+def resolve_openai_payload(payload: list[dict]) -> list[dict]:
+    """Replace ``file_ref`` blocks with inline data, right before the payload is sent."""
+    return _resolve_file_refs(payload, "content", lambda ref: _openai_file_block(ref["filename"], ref["mime_type"], _encode_file_ref(ref)))
+
+
+def _google_file_part(mime_type: str, encoded_data: str) -> dict[str, Any]:
+    return {
+        "inline_data": {
+            "mime_type": mime_type,
+            "data": encoded_data
+        }
+    }
+
+
+def build_google_user_parts(user_text: str | None, file: str | Path | dict | None=None, local: bool=False, upload: Uploader | None=None) -> list[dict[str, Any]]:
+    """Build user message parts for Google format.
+
+    Files given by path are added as ``file_ref`` parts; ``resolve_google_payload`` inlines them.
+    With ``upload``, the file is referenced by its uploaded URI instead.
+    """
     if not file and not user_text:
         raise ValueError("Either filename or user_text must be provided.")
 
@@ -123,35 +287,49 @@ def build_google_user_parts(user_text: str | None, file: str | Path | dict | Non
         parts.append({"text": user_text})
 
     if file:
-        filename, encoded_data = _process_file(file)
-
         if local:
+            filename, encoded_data = _process_file(file)
             parts.append({
                 "text": (user_text + "\n" if user_text else "") + process_local_file(filename, encoded_data)
             })
-        else:
+        elif upload is not None:
             if user_text:
                 parts.append({"text": user_text})
 
-            mime_type, _ = mimetypes.guess_type(filename)
-            if not mime_type:
-                raise ValueError("Could not detect MIME type from filename.")
+            filename, file_data = _read_file(file)
+            mime_type = _guess_mime_type(filename)
 
             parts.append({
-                "inline_data": {
+                "file_data": {
                     "mime_type": mime_type,
-                    "data": encoded_data
+                    "file_uri": upload(filename, file_data, mime_type)
                 }
             })
+        elif isinstance(file, dict):
+            filename, encoded_data = _process_file(file)
+
+            if user_text:
+                parts.append({"text": user_text})
+
+            parts.append(_google_file_part(_guess_mime_type(filename), encoded_data))
+        else:
+            ref = _file_ref(file)
+
+            if user_text:
+                parts.append({"text": user_text})
+
+            parts.append(ref)
 
     return parts
 
 
-def generate_google_payload(user_text: str | None, file: str | Path | dict | None=None, local: bool=False, messages: list[dict] | None=None) -> list[dict[str, Any]]:
+def generate_google_payload(user_text: str | None, file: str | Path | dict | None=None, local: bool=False, messages: list[dict] | None=None, upload: Uploader | None=None) -> list[dict[str, Any]]:
     """Generate full contents payload for Google API.
 
     If messages is provided, it should contain the conversation history.
     Format: [{"role": "user", "parts": [...]}, {"role": "model", "parts": [...]}]
+
+    Files attached by path come back as ``file_ref`` blocks; pass the payload through ``resolve_google_payload`` before sending it.
     """
     contents = []
 
@@ -160,7 +338,7 @@ def generate_google_payload(user_text: str | None, file: str | Path | dict | Non
         contents.extend(messages)
 
     # Add new user message
-    parts = build_google_user_parts(user_text, file, local)
+    parts = build_google_user_parts(user_text, file, local, upload)
     contents.append({
         "role": "user",
         "parts": parts
@@ -168,8 +346,35 @@ def generate_google_payload(user_text: str | None, file: str | Path | dict | Non
 
     return contents
 
-def build_claude_user_content(user_text: str | None, file: str | Path | dict | None=None, local: bool=False) -> list[dict[str, Any]]:
-    """Build user message content for Claude format."""
+
+def resolve_google_payload(payload: list[dict]) -> list[dict]:
+    """Replace ``file_ref`` parts with inline data, right before the payload is sent."""
+    return _resolve_file_refs(payload, "parts", lambda ref: _google_file_part(ref["mime_type"], _encode_file_ref(ref)))
+
+
+def _claude_content_type(mime_type: str) -> str:
+    if mime_type.startswith("image/"):
+        return "image"
+    return "document"
+
+
+def _claude_file_block(mime_type: str, encoded_data: str) -> dict[str, Any]:
+    return {
+        "type": _claude_content_type(mime_type),
+        "source": {
+            "type": "base64",
+            "media_type": mime_type,
+            "data": encoded_data
+        }
+    }
+
+
+def build_claude_user_content(user_text: str | None, file: str | Path | dict | None=None, local: bool=False, upload: Uploader | None=None) -> list[dict[str, Any]]:
+    """Build user message content for Claude format.
+
+    Files given by path are added as ``file_ref`` blocks; ``resolve_claude_payload`` inlines them.
+    With ``upload``, the file is referenced by file ID instead.
+    """
     if not file and not user_text:
         raise ValueError("Either filename or user_text must be provided.")
 
@@ -182,17 +387,28 @@ def build_claude_user_content(user_text: str | None, file: str | Path | dict | N
         })
 
     if file:
-        filename, encoded_data = _process_file(file)
-
         if local:
+            filename, encoded_data = _process_file(file)
             content.append({
                 "type": "text",
                 "text": (user_text + "\n" if user_text else "") + process_local_file(filename, encoded_data)
             })
         else:
-            mime_type, _ = mimetypes.guess_type(filename)
-            if not mime_type:
-                raise ValueError("Could not detect MIME type from filename.")
+            if upload is not None:
+                filename, file_data = _read_file(file)
+                mime_type = _guess_mime_type(filename)
+                block = {
+                    "type": _claude_content_type(mime_type),
+                    "source": {
+                        "type": "file",
+                        "file_id": upload(filename, file_data, mime_type)
+                    }
+                }
+            elif isinstance(file, dict):
+                filename, encoded_data = _process_file(file)
+                block = _claude_file_block(_guess_mime_type(filename), encoded_data)
+            else:
+                block = _file_ref(file)
 
             if user_text:
                 content.append({
@@ -200,28 +416,18 @@ def build_claude_user_content(user_text: str | None, file: str | Path | dict | N
                     "text": user_text
                 })
 
-            if mime_type.startswith("image/"):
-                content_type = "image"
-            else:
-                content_type = "document"
-
-            content.append({
-                "type": content_type,
-                "source": {
-                    "type": "base64",
-                    "media_type": mime_type,
-                    "data": encoded_data
-                }
-            })
+            content.append(block)
 
     return content
 
 
-def generate_claude_payload(user_text: str | None, file: str | Path | dict | None=None, local: bool=False, messages: list[dict] | None=None) -> list[dict[str, Any]]:
+def generate_claude_payload(user_text: str | None, file: str | Path | dict | None=None, local: bool=False, messages: list[dict] | None=None, upload: Uploader | None=None) -> list[dict[str, Any]]:
     """Generate full messages payload for Claude API.
 
     If messages is provided, it should contain the conversation history.
     Format: [{"role": "user", "content": [...]}, {"role": "assistant", "content": "..."}]
+
+    Files attached by path come back as ``file_ref`` blocks; pass the payload through ``resolve_claude_payload`` before sending it.
     """
     result = []
 
@@ -230,7 +436,7 @@ def generate_claude_payload(user_text: str | None, file: str | Path | dict | Non
         result.extend(messages)
 
     # Add new user message
-    content = build_claude_user_content(user_text, file, local)
+    content = build_claude_user_content(user_text, file, local, upload)
     result.append({
         "role": "user",
         "content": content
@@ -238,6 +444,11 @@ def generate_claude_payload(user_text: str | None, file: str | Path | dict | Non
 
     return result
 
+
+def resolve_claude_payload(payload: list[dict]) -> list[dict]:
+    """Replace ``file_ref`` blocks with inline data, right before the payload is sent."""
+    return _resolve_file_refs(payload, "content", lambda ref: _claude_file_block(ref["mime_type"], _encode_file_ref(ref)))
+
 def build_ollama_user_content(user_text: str | None, file: str | Path | dict | None=None) -> str:
     """Build user message content for Ollama format (plain text)."""
     if not file and not user_text:
@@ -0,0 +1,69 @@
+import threading
+from collections import deque
+from typing import Any, Callable
+
+
+class LatencyTracker:
+    """Rolling window of the most recent latencies per (provider, model)."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: dict[tuple[str, str], deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get((provider, model))
+            if samples is None:
+                samples = self._samples[(provider, model)] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def count(self, provider: str, model: str) -> int:
+        with self._lock:
+            return len(self._samples.get((provider, model), ()))
+
+    def percentile(self, provider: str, model: str, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get((provider, model), ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+class HedgePolicy:
+    """When and where ``agenerate``/``astream`` send duplicate requests.
+
+    If no response (or first stream chunk) arrives within the ``percentile`` latency observed for
+    the provider/model (``delay`` seconds until ``min_samples`` calls have been seen), another copy
+    is sent, up to ``max_hedges`` extra copies. With ``alternate`` the copies go to the request's
+    fallback chain in order, otherwise to the same provider/model. The first successful response
+    that passes ``validate`` wins and the others are cancelled.
+
+    With ``race`` all copies are sent at once.
+    """
+
+    def __init__(self, percentile: float = 0.95, delay: float = 2.0, max_hedges: int = 1, alternate: bool = True, race: bool = False, validate: Callable[[Any], bool] | None = None, min_samples: int = 20, window: int = 200):
+        self.percentile = percentile
+        self.delay = delay
+        self.max_hedges = max_hedges
+        self.alternate = alternate
+        self.race = race
+        self.validate = validate
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker(window)
+
+    def hedge_delay(self, provider: str, model: str) -> float:
+        if self.race:
+            return 0.0
+        if self.latencies.count(provider, model) < self.min_samples:
+            return self.delay
+        return self.latencies.percentile(provider, model, self.percentile)
+
+    def targets(self, candidates: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """(provider, model) for the original request and each hedge."""
+        if not self.alternate:
+            candidates = candidates[:1]
+        return [candidates[index % len(candidates)] for index in range(1 + self.max_hedges)]
+
+    def accepts(self, response: Any) -> bool:
+        return self.validate is None or self.validate(response)
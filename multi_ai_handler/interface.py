@@ -1,11 +1,16 @@
 from pathlib import Path
-from typing import Iterator, AsyncIterator
+from typing import AsyncIterable, Iterable, Iterator, AsyncIterator
 
 from multi_ai_handler.multi_ai_handler import AIProviderManager
-from multi_ai_handler.utils import AIResponse
+from multi_ai_handler.json_stream import AsyncJSONStreamResult, JSONStreamResult
+from multi_ai_handler.utils import AIResponse, AsyncStreamResult, RequestResult, StreamResult
 
 _handler = AIProviderManager()
 
+def get_manager() -> AIProviderManager:
+    """The manager behind the module-level functions, e.g. to register providers or enable caching."""
+    return _handler
+
 def request_ai(
     provider: str | None = None,
     model: str | None = None,
@@ -38,8 +43,9 @@ def stream_ai(
     file: str | Path | dict | None = None,
     temperature: float = 0.2,
     local: bool = False,
-) -> Iterator[str]:
-    yield from _handler.stream(
+    json_output: bool = False,
+) -> StreamResult | JSONStreamResult:
+    return _handler.stream(
         provider=provider,
         model=model,
         system_prompt=system_prompt,
@@ -48,6 +54,7 @@ def stream_ai(
         file=file,
         temperature=temperature,
         local=local,
+        json_output=json_output,
     )
 
 def get_model_info(provider: str, model: str) -> dict:
@@ -79,7 +86,7 @@ async def arequest_ai(
         local=local,
     )
 
-async def astream_ai(
+def astream_ai(
     provider: str | None = None,
     model: str | None = None,
     system_prompt: str | None = None,
@@ -88,8 +95,9 @@ async def astream_ai(
     file: str | Path | dict | None = None,
     temperature: float = 0.2,
     local: bool = False,
-) -> AsyncIterator[str]:
-    async for chunk in _handler.astream(
+    json_output: bool = False,
+) -> AsyncStreamResult | AsyncJSONStreamResult:
+    return _handler.astream(
         provider=provider,
         model=model,
         system_prompt=system_prompt,
@@ -98,5 +106,28 @@ async def astream_ai(
         file=file,
         temperature=temperature,
         local=local,
+        json_output=json_output,
+    )
+
+def request_many(
+    requests: Iterable[dict],
+    concurrency: int = 16,
+    provider_concurrency: int | dict[str, int] | None = None,
+) -> Iterator[RequestResult]:
+    yield from _handler.generate_many(
+        requests,
+        concurrency=concurrency,
+        provider_concurrency=provider_concurrency,
+    )
+
+async def arequest_many(
+    requests: Iterable[dict] | AsyncIterable[dict],
+    concurrency: int = 16,
+    provider_concurrency: int | dict[str, int] | None = None,
+) -> AsyncIterator[RequestResult]:
+    async for result in _handler.agenerate_many(
+        requests,
+        concurrency=concurrency,
+        provider_concurrency=provider_concurrency,
     ):
-        yield chunk
+        yield result
\ No newline at end of file
@@ -0,0 +1,270 @@
+import json
+import re
+from collections import deque
+from typing import Any
+
+from multi_ai_handler.utils import AsyncStreamResult, StreamInfo, StreamResult, Usage
+
+# Outside strings only these characters change the structure; inside one only quotes and escapes matter.
+_STRUCTURE = re.compile(r'["{}\[\],]')
+_STRING = re.compile(r'["\\]')
+# Letters are left out so prose before a fence isn't taken for true/false/null.
+_VALUE_START = set('{["-0123456789')
+_FENCE = "```"
+
+
+class JSONStreamParser:
+    """Incremental parser for a JSON value arriving in chunks, optionally inside a markdown fence.
+
+    ``feed`` returns the top-level fields completed by each chunk: ``(key, value)`` pairs for an
+    object, ``(index, item)`` for an array. A top-level scalar comes out of ``finish`` as
+    ``(None, value)``. ``value`` holds the object (or array) parsed so far. Malformed JSON raises
+    ``json.JSONDecodeError`` as soon as the offending field closes.
+    """
+
+    def __init__(self):
+        self.value: Any = None
+        # Unparsed JSON text: the field in progress once inside an object or array.
+        self.text = ""
+        self._preamble = ""
+        self._started = False
+        self._done = False
+        self._pos = 0
+        self._in_string = False
+        self._stack: list[str] = []
+        self._member_start = 0
+
+    def feed(self, chunk: str) -> list[tuple[Any, Any]]:
+        if self._done:
+            return []
+        if not self._started:
+            self._preamble += chunk
+            if not self._skip_preamble():
+                return []
+        else:
+            self.text += chunk
+        return self._scan()
+
+    def _skip_preamble(self) -> bool:
+        """Drop fences and prose before the value; whether the value has started."""
+        while True:
+            preamble = self._preamble.lstrip()
+            if not preamble:
+                return False
+            if preamble.startswith(_FENCE):
+                newline = preamble.find("\n")
+                if newline == -1:
+                    return False
+                self._preamble = preamble[newline + 1:]
+            elif _FENCE.startswith(preamble):
+                return False
+            elif preamble[0] in _VALUE_START:
+                self._started = True
+                self.text = preamble
+                self._preamble = ""
+                return True
+            else:
+                # Prose before a fenced block; wait for the fence.
+                fence = preamble.find(_FENCE)
+                if fence == -1:
+                    return False
+                self._preamble = preamble[fence:]
+
+    def _scan(self) -> list[tuple[Any, Any]]:
+        events = []
+        text = self.text
+        i = self._pos
+        while i < len(text) and not self._done:
+            if self._in_string:
+                match = _STRING.search(text, i)
+                if match is None:
+                    i = len(text)
+                elif match.group() == '"':
+                    self._in_string = False
+                    i = match.end()
+                elif match.end() < len(text):
+                    i = match.end() + 1
+                else:
+                    # Escape split across chunks: look at it again with the next one.
+                    i = match.start()
+                    break
+                continue
+
+            if not self._stack and text[i] not in "{[":
+                # A top-level scalar is parsed whole by ``finish``.
+                i = len(text)
+                break
+
+            match = _STRUCTURE.search(text, i)
+            if match is None:
+                i = len(text)
+                break
+            char = match.group()
+            i = match.end()
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._stack.append(char)
+                if len(self._stack) == 1:
+                    self.value = {} if char == "{" else []
+                    self._member_start = i
+            elif char in "}]":
+                if not self._stack or self._stack[-1] != ("{" if char == "}" else "["):
+                    raise json.JSONDecodeError(f"Unexpected {char!r}", text, match.start())
+                if len(self._stack) == 1:
+                    self._member(match.start(), events, last=True)
+                    self._done = True
+                self._stack.pop()
+            elif len(self._stack) == 1:
+                self._member(match.start(), events, last=False)
+                self._member_start = i
+
+        self._pos = i
+        if self._stack and self._member_start:
+            # Completed fields are parsed already; keep only the one in progress.
+            self.text = text[self._member_start:]
+            self._pos -= self._member_start
+            self._member_start = 0
+        return events
+
+    def _member(self, end: int, events: list, last: bool) -> None:
+        member = self.text[self._member_start:end]
+        if not member.strip():
+            # Only an empty container may close right after its opening bracket.
+            if last and not self.value:
+                return
+            raise json.JSONDecodeError("Expecting value", self.text, end)
+
+        try:
+            if isinstance(self.value, dict):
+                parsed = json.loads("{" + member + "}")
+                if len(parsed) != 1:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", self.text, end)
+                key, value = next(iter(parsed.items()))
+                self.value[key] = value
+            else:
+                key, value = len(self.value), json.loads(member)
+                self.value.append(value)
+        except json.JSONDecodeError as e:
+            raise json.JSONDecodeError(e.msg, self.text, self._member_start) from None
+        events.append((key, value))
+
+    def finish(self) -> list[tuple[Any, Any]]:
+        """Call once the text has ended; raises if it didn't hold a complete value."""
+        if self._done:
+            return []
+        if not self._started:
+            if self._preamble.strip() in ("true", "false", "null"):
+                self.value = json.loads(self._preamble)
+                self._done = True
+                return [(None, self.value)]
+            raise json.JSONDecodeError("No JSON value in response", self._preamble, 0)
+        if self._stack or self._in_string:
+            raise json.JSONDecodeError("Unterminated JSON value", self.text, len(self.text))
+
+        text = self.text.strip()
+        fence = text.find(_FENCE)
+        self.value = json.loads(text[:fence] if fence != -1 else text)
+        self._done = True
+        return [(None, self.value)]
+
+
+class JSONStreamResult:
+    """Iterates over the top-level fields of a streamed JSON response as they complete.
+
+    Yields ``(key, value)`` for each field of an object (``(index, item)`` for an array) as soon as
+    it closes; ``value`` is the partial object so far and the whole one at the end. On malformed JSON
+    the upstream stream is closed and ``json.JSONDecodeError`` raised.
+    """
+
+    def __init__(self, stream: StreamResult):
+        self._stream = stream
+        self._parser = JSONStreamParser()
+        self._events: deque[tuple[Any, Any]] = deque()
+        self._finished = False
+
+    @property
+    def value(self) -> Any:
+        return self._parser.value
+
+    @property
+    def info(self) -> StreamInfo | None:
+        return self._stream.info
+
+    @property
+    def usage(self) -> Usage | None:
+        return self._stream.usage
+
+    @property
+    def finish_reason(self) -> str | None:
+        return self._stream.finish_reason
+
+    @property
+    def timing(self) -> dict[str, float] | None:
+        return self._stream.timing
+
+    def __iter__(self) -> "JSONStreamResult":
+        return self
+
+    def __next__(self) -> tuple[Any, Any]:
+        while not self._events:
+            if self._finished:
+                raise StopIteration
+            try:
+                chunk = next(self._stream)
+            except StopIteration:
+                self._finished = True
+                self._events.extend(self._parser.finish())
+                continue
+            try:
+                self._events.extend(self._parser.feed(chunk))
+            except json.JSONDecodeError:
+                self._finished = True
+                self._stream.close()
+                raise
+        return self._events.popleft()
+
+    def close(self) -> None:
+        self._finished = True
+        self._stream.close()
+
+
+class AsyncJSONStreamResult:
+    """Async counterpart of ``JSONStreamResult``."""
+
+    def __init__(self, stream: AsyncStreamResult):
+        self._stream = stream
+        self._parser = JSONStreamParser()
+        self._events: deque[tuple[Any, Any]] = deque()
+        self._finished = False
+
+    value = JSONStreamResult.value
+    info = JSONStreamResult.info
+    usage = JSONStreamResult.usage
+    finish_reason = JSONStreamResult.finish_reason
+    timing = JSONStreamResult.timing
+
+    def __aiter__(self) -> "AsyncJSONStreamResult":
+        return self
+
+    async def __anext__(self) -> tuple[Any, Any]:
+        while not self._events:
+            if self._finished:
+                raise StopAsyncIteration
+            try:
+                chunk = await anext(self._stream)
+            except StopAsyncIteration:
+                self._finished = True
+                self._events.extend(self._parser.finish())
+                continue
+            try:
+                self._events.extend(self._parser.feed(chunk))
+            except json.JSONDecodeError:
+                self._finished = True
+                await self._stream.aclose()
+                raise
+        return self._events.popleft()
+
+    async def aclose(self) -> None:
+        self._finished = True
+        await self._stream.aclose()
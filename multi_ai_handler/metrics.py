@@ -0,0 +1,175 @@
+import bisect
+import contextlib
+import contextvars
+import threading
+import time
+from typing import Callable, Iterator
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+RATE_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0)
+
+# Labels for timings recorded deep inside payload building (extraction, encoding), set by the provider.
+_scope: contextvars.ContextVar[tuple["MetricsRegistry", str, str] | None] = contextvars.ContextVar("metrics_scope", default=None)
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative buckets as in Prometheus) with interpolated percentiles."""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+            largest = self.max
+        if total == 0:
+            return None
+
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else largest
+                return min(largest, lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return largest
+
+
+class MetricsRegistry:
+    """Per (provider, model) counters and histograms.
+
+    Histograms ending in ``_seconds`` use ``LATENCY_BUCKETS``, others ``RATE_BUCKETS``. Every
+    recorded value is also passed to ``callback(name, labels, value)`` if given.
+    """
+
+    def __init__(self, callback: Callable[[str, dict[str, str], float], None] | None = None, namespace: str = "multi_ai_handler"):
+        self.callback = callback
+        self.namespace = namespace
+        self._histograms: dict[tuple[str, str, str], Histogram] = {}
+        self._counters: dict[tuple[str, str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, provider: str, model: str, value: float) -> None:
+        key = (name, provider, model)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(LATENCY_BUCKETS if name.endswith("_seconds") else RATE_BUCKETS)
+        histogram.observe(value)
+        if self.callback is not None:
+            self.callback(name, {"provider": provider, "model": model}, value)
+
+    def increment(self, name: str, provider: str, model: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[(name, provider, model)] = self._counters.get((name, provider, model), 0) + amount
+        if self.callback is not None:
+            self.callback(name, {"provider": provider, "model": model}, amount)
+
+    def histogram(self, name: str, provider: str, model: str) -> Histogram | None:
+        return self._histograms.get((name, provider, model))
+
+    def counter(self, name: str, provider: str, model: str) -> float:
+        return self._counters.get((name, provider, model), 0)
+
+    def snapshot(self, percentiles: tuple[float, ...] = (0.5, 0.9, 0.99)) -> dict[tuple[str, str], dict[str, dict | float]]:
+        """``{(provider, model): {histogram: {"count", "sum", "p50", ...}, counter: value}}``."""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+
+        snapshot: dict[tuple[str, str], dict] = {}
+        for (name, provider, model), histogram in sorted(histograms.items()):
+            summary = {"count": histogram.count, "sum": histogram.sum}
+            for q in percentiles:
+                summary[f"p{q * 100:g}"] = histogram.percentile(q)
+            snapshot.setdefault((provider, model), {})[name] = summary
+        for (name, provider, model), value in sorted(counters.items()):
+            snapshot.setdefault((provider, model), {})[name] = value
+        return snapshot
+
+    def to_prometheus(self) -> str:
+        """Text exposition format snapshot of every metric."""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+
+        lines = []
+        typed = set()
+        for (name, provider, model), histogram in sorted(histograms.items()):
+            metric = f"{self.namespace}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            labels = f'provider="{_escape(provider)}",model="{_escape(model)}"'
+            with histogram._lock:
+                counts = list(histogram.counts)
+                total, value_sum = histogram.count, histogram.sum
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {value_sum}")
+            lines.append(f"{metric}_count{{{labels}}} {total}")
+
+        for (name, provider, model), value in sorted(counters.items()):
+            metric = f"{self.namespace}_{name}"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f'{metric}{{provider="{_escape(provider)}",model="{_escape(model)}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+@contextlib.contextmanager
+def scope(registry: "MetricsRegistry | None", provider: str | None, model: str | None) -> Iterator[None]:
+    """Attribute ``timed`` sections in this (synchronous) block to ``provider``/``model``."""
+    if registry is None:
+        yield
+        return
+    token = _scope.set((registry, provider or "", model or ""))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+@contextlib.contextmanager
+def timed(name: str) -> Iterator[None]:
+    """Record the duration of the block as ``name`` if a metrics ``scope`` is active."""
+    current = _scope.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry, provider, model = current
+        registry.observe(name, provider, model, time.perf_counter() - start)
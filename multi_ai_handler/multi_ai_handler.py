@@ -1,51 +1,710 @@
+import asyncio
+import contextlib
+import dataclasses
+import functools
+import importlib
+import inspect
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Iterator, AsyncIterator, TYPE_CHECKING
+from typing import Any, AsyncContextManager, AsyncIterable, Awaitable, Callable, ContextManager, Iterable, Iterator, AsyncIterator, TYPE_CHECKING
 
 from multi_ai_handler.ai_provider import AIProvider
-from multi_ai_handler.utils import AIResponse
+from multi_ai_handler.batch import FAILED, BatchJob, BatchRequestError, BatchStore
+from multi_ai_handler.circuit_breaker import CircuitBreaker, CircuitBreakers, CircuitOpenError
+from multi_ai_handler.hedging import HedgePolicy
+from multi_ai_handler.metrics import MetricsRegistry
+from multi_ai_handler.response_cache import ResponseCache, request_key
+from multi_ai_handler.rate_limit import RateLimiter, estimate_tokens
+from multi_ai_handler.retry import RetryPolicy
+from multi_ai_handler.json_stream import AsyncJSONStreamResult, JSONStreamResult
+from multi_ai_handler.routing import Router
+from multi_ai_handler.singleflight import SingleFlight
+from multi_ai_handler.utils import AIResponse, AsyncStreamResult, RequestResult, StreamInfo, StreamResult, Usage, load_env, parse_ai_response
 
 if TYPE_CHECKING:
     from multi_ai_handler.utils import Conversation
-from multi_ai_handler.providers.openrouter import OpenrouterProvider
-from multi_ai_handler.providers.anthropic import AnthropicProvider
-from multi_ai_handler.providers.cerebras import CerebrasProvider
-from multi_ai_handler.providers.google import GoogleProvider
-from multi_ai_handler.providers.ollama import OllamaProvider
-from multi_ai_handler.providers.openai import OpenAIProvider
+
+
+def _import_provider(path: str) -> type[AIProvider]:
+    module_name, _, class_name = path.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+@functools.cache
+def _sdk_retries(Provider: type[AIProvider]) -> bool:
+    """Whether the provider's SDK client retries on its own (it takes ``max_retries``)."""
+    return "max_retries" in inspect.signature(Provider).parameters
+
+
+def _config_key(value: Any) -> Any:
+    # Unhashable config values (e.g. a list of hosts) are keyed by their repr.
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def _provider_limit(provider_concurrency: int | dict[str, int] | None, provider: str) -> int | None:
+    if isinstance(provider_concurrency, dict):
+        return provider_concurrency.get(provider)
+    return provider_concurrency
+
+
+class _ProviderSlots:
+    """Per-provider caps for ``generate_many``: requests for a provider at its cap are queued instead of holding a slot."""
+
+    def __init__(self, provider_concurrency: int | dict[str, int] | None, lookahead: int):
+        self.provider_concurrency = provider_concurrency
+        self.lookahead = lookahead
+        self.running: dict[str | None, int] = {}
+        self.waiting: dict[str | None, deque[tuple[int, dict]]] = {}
+        self.queued = 0
+
+    def _free(self, provider: str | None) -> bool:
+        limit = _provider_limit(self.provider_concurrency, provider)
+        return limit is None or self.running.get(provider, 0) < limit
+
+    @property
+    def full(self) -> bool:
+        return self.queued >= self.lookahead
+
+    def admit(self, index: int, request: dict) -> bool:
+        """Whether the request can start now; if not it is queued until its provider has a free slot."""
+        provider = request.get("provider")
+        if self._free(provider) and not self.waiting.get(provider):
+            return True
+        self.waiting.setdefault(provider, deque()).append((index, request))
+        self.queued += 1
+        return False
+
+    def ready(self) -> tuple[int, dict] | None:
+        """The earliest queued request whose provider now has a free slot."""
+        queues = [queue for provider, queue in self.waiting.items() if queue and self._free(provider)]
+        if not queues:
+            return None
+        self.queued -= 1
+        return min(queues, key=lambda queue: queue[0][0]).popleft()
+
+    def start(self, request: dict) -> None:
+        provider = request.get("provider")
+        self.running[provider] = self.running.get(provider, 0) + 1
+
+    def finish(self, request: dict) -> None:
+        self.running[request.get("provider")] -= 1
+
+
+async def _aiter_requests(requests: Iterable[dict] | AsyncIterable[dict]) -> AsyncIterator[dict]:
+    if hasattr(requests, "__aiter__"):
+        async for request in requests:
+            yield request
+    else:
+        for request in requests:
+            yield request
+
+
+def _own_copy(response: AIResponse) -> AIResponse:
+    """Callers sharing a coalesced response each get their own history list."""
+    return dataclasses.replace(response, history=list(response.history) if response.history is not None else None)
+
+
+async def _settle(tasks: Iterable[asyncio.Future]) -> None:
+    """Wait until ``tasks`` are done, ignoring their errors.
+
+    If the caller is cancelled meanwhile the wait still runs to the end, and the cancellation is raised after it.
+    """
+    settled = asyncio.gather(*tasks, return_exceptions=True)
+    cancelled = None
+    while not settled.done():
+        try:
+            await asyncio.shield(settled)
+        except asyncio.CancelledError as e:
+            cancelled = e
+    if cancelled is not None:
+        raise cancelled
+
+
+async def _cancel_and_wait(tasks: Iterable[asyncio.Future]) -> None:
+    """Cancel ``tasks`` and wait until they have unwound, so their limiter slots and breaker probes are released."""
+    tasks = list(tasks)
+    for task in tasks:
+        task.cancel()
+    await _settle(tasks)
+
+
+def _record_latencies(policy: HedgePolicy, winner: tuple[str, str, float], losers: Iterable[tuple[str, str, float]]) -> None:
+    """Feed a hedged call's latencies to the policy: the winner's, and for copies about to be cancelled the time they ran.
+
+    That time is only a lower bound, but leaving slow copies out would make the tracked percentile, and so the
+    hedge delay, shrink with every hedge.
+    """
+    now = time.monotonic()
+    for provider, model, started in (winner, *losers):
+        policy.latencies.record(provider, model, now - started)
+
+
+def _content_length(response: AIResponse) -> int:
+    return len(response.content) if isinstance(response.content, str) else 0
+
+
+class _Attempt:
+    """Feeds one call to a candidate into its circuit breaker, the router's statistics, the metrics registry and the TPM limiter."""
+
+    def __init__(self, client: AIProvider, breaker: CircuitBreaker | None, router: Router | None, metrics: MetricsRegistry | None, rate_limiter: RateLimiter | None, provider: str, model: str, tokens: int):
+        self.client = client
+        self.breaker = breaker
+        self.router = router
+        self.metrics = metrics
+        self.rate_limiter = rate_limiter
+        self.provider = provider
+        self.model = model
+        self.tokens = tokens
+        self.ttft = None
+        self.finished = False
+        self.start = time.monotonic()
+        if router is not None:
+            router.start(provider, model)
+        if metrics is not None:
+            metrics.increment("requests_total", provider, model)
+
+    def first_chunk(self) -> None:
+        self.ttft = time.monotonic() - self.start
+        if self.breaker is not None:
+            self.breaker.record(True, self.ttft)
+        if self.metrics is not None:
+            self.metrics.observe("ttft_seconds", self.provider, self.model, self.ttft)
+
+    def record_usage(self, usage: Usage | None) -> None:
+        if usage is None:
+            return
+        used = (usage.input_tokens or 0) + (usage.output_tokens or 0)
+        if self.rate_limiter is not None and used:
+            self.rate_limiter.settle(self.provider, self.model, self.tokens, used)
+        if self.metrics is not None:
+            for name, count in (("input_tokens_total", usage.input_tokens), ("output_tokens_total", usage.output_tokens), ("cached_tokens_total", usage.cached_tokens)):
+                if count:
+                    self.metrics.increment(name, self.provider, self.model, count)
+
+    def retried(self, error: Exception) -> None:
+        if self.metrics is not None:
+            self.metrics.increment("retries_total", self.provider, self.model)
+
+    def _finish(self, chars: int | None, error: bool, chunks: int = 0, abandoned: bool = False) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        duration = time.monotonic() - self.start
+        # Streams were already judged by the breaker on their first chunk; an abandoned call says nothing about health.
+        if self.breaker is not None and self.ttft is None:
+            if abandoned:
+                self.breaker.release()
+            else:
+                self.breaker.record(not error, duration)
+        if self.router is not None:
+            self.router.finish(self.provider, self.model, duration, self.ttft, chars, error)
+        if self.metrics is not None and chars is not None:
+            self.metrics.observe("latency_seconds", self.provider, self.model, duration)
+            if chunks > 1 and duration > self.ttft:
+                self.metrics.observe("chunks_per_second", self.provider, self.model, (chunks - 1) / (duration - self.ttft))
+
+    def done(self, chars: int | None, chunks: int = 0) -> None:
+        """The call completed with ``chars`` of output (``chunks`` chunks if streamed), or (None) its result was abandoned."""
+        self._finish(chars, False, chunks, abandoned=chars is None)
+
+    def failed(self, error: Exception) -> bool:
+        """Record a failure; True if it reflects provider health (so the next candidate should be tried)."""
+        unhealthy = self.client.is_retryable(error)
+        if self.metrics is not None and not self.finished:
+            self.metrics.increment("errors_total", self.provider, self.model)
+        self._finish(None, unhealthy)
+        return unhealthy
+
+
+class _ManagedProvider:
+    """Provider-shaped view of the manager for one provider, so conversations go through its rate limiting, retries, breakers, cache and metrics."""
+
+    def __init__(self, manager: "AIProviderManager", provider: str):
+        self.manager = manager
+        self.provider = provider
+
+    def generate(self, system_prompt: str | None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
+        return self.manager.generate(self.provider, model, system_prompt, user_text, messages, file, temperature, local, json_output)
+
+    def stream(self, system_prompt: str | None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> StreamResult:
+        return self.manager.stream(self.provider, model, system_prompt, user_text, messages, file, temperature, local)
+
+    async def agenerate(self, system_prompt: str | None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
+        return await self.manager.agenerate(self.provider, model, system_prompt, user_text, messages, file, temperature, local, json_output)
+
+    def astream(self, system_prompt: str | None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncStreamResult:
+        return self.manager.astream(self.provider, model, system_prompt, user_text, messages, file, temperature, local)
 
 
 class AIProviderManager:
-    def __init__(self):
-        self.providers: dict[str, type[AIProvider]] = {
-            "google": GoogleProvider,
-            "anthropic": AnthropicProvider,
-            "openai": OpenAIProvider,
-            "openrouter": OpenrouterProvider,
-            "ollama": OllamaProvider,
-            "cerebras": CerebrasProvider,
+    def __init__(self, batch_dir: str | Path | None = None, response_cache: ResponseCache | None = None, retry_policy: RetryPolicy | None = None, rate_limiter: RateLimiter | None = None, fallbacks: dict[str | tuple[str, str], list[tuple[str, str]]] | None = None, circuit_breakers: CircuitBreakers | None = None, hedge_policy: HedgePolicy | None = None, router: Router | None = None, coalesce: bool = False, metrics: MetricsRegistry | None = None):
+        # Providers may be registered as "module:Class" strings; the module (and its SDK) is imported on first use.
+        self.providers: dict[str, type[AIProvider] | str] = {
+            "google": "multi_ai_handler.providers.google:GoogleProvider",
+            "anthropic": "multi_ai_handler.providers.anthropic:AnthropicProvider",
+            "openai": "multi_ai_handler.providers.openai:OpenAIProvider",
+            "openrouter": "multi_ai_handler.providers.openrouter:OpenrouterProvider",
+            "ollama": "multi_ai_handler.providers.ollama:OllamaProvider",
+            "cerebras": "multi_ai_handler.providers.cerebras:CerebrasProvider",
         }
+        self.provider_configs: dict[str, dict] = {}
+        self._instances: dict[tuple, AIProvider] = {}
+        self._lock = threading.Lock()
+        # Pending batch jobs are persisted here (if set) so polling can resume after a restart.
+        self.batch_store = BatchStore(batch_dir) if batch_dir else None
+        # Opt-in: identical requests are answered from this cache instead of the network.
+        self.response_cache = response_cache
+        # Opt-in: transient provider errors (rate limits, overloads, dropped connections) are retried with backoff.
+        self.retry_policy = retry_policy
+        # Opt-in: every request (and retry) waits for its provider/model's RPM, TPM and concurrency limits.
+        self.rate_limiter = rate_limiter
+        # Ordered (provider, model) pairs to fail over to, keyed by provider or (provider, model).
+        self.fallbacks: dict[str | tuple[str, str], list[tuple[str, str]]] = dict(fallbacks or {})
+        # Opt-in: providers whose circuit is open are skipped until they recover.
+        self.circuit_breakers = circuit_breakers
+        # Opt-in: agenerate/astream send duplicate requests when the first one is slow.
+        self.hedge_policy = hedge_policy
+        # Opt-in: named pools of (provider, model) candidates usable as a provider (e.g. "auto").
+        self.router = router
+        # Opt-in: concurrent identical requests share one upstream call (streams fan out to every caller).
+        self.singleflight = SingleFlight() if coalesce else None
+        # Opt-in: per provider/model latency histograms and counters.
+        self.metrics = metrics
+
+    def register_provider(self, name: str, provider: type[AIProvider] | str, **config) -> None:
+        """Register a provider class (or a lazy "module:Class" path); ``config`` is passed to its constructor (e.g. base_url, api_key)."""
+        with self._lock:
+            self.providers[name] = provider
+            self.provider_configs[name] = config
+            for key in [key for key in self._instances if key[0] == name]:
+                del self._instances[key]
+
+    def get_provider(self, provider: str, **config) -> AIProvider:
+        """Return the shared provider instance for ``provider`` and its constructor config.
+
+        Instances (and the SDK clients and connection pools they own) are created once
+        and reused across calls, threads and event loops until ``close()``/``aclose()``.
+        """
+        config = {**self.provider_configs.get(provider, {}), **config}
+
+        with self._lock:
+            Provider = self.providers[provider]
+            if isinstance(Provider, str):
+                Provider = self.providers[provider] = _import_provider(Provider)
+            if self.retry_policy is not None and "max_retries" not in config and _sdk_retries(Provider):
+                # The retry policy owns retries; SDK retries underneath each attempt would multiply them.
+                config["max_retries"] = 0
+
+            key = (provider, tuple(sorted((name, _config_key(value)) for name, value in config.items())))
+            client = self._instances.get(key)
+            if client is None:
+                load_env()
+                client = Provider(**config)
+                client.metrics_label = provider
+                self._instances[key] = client
+
+        client.metrics = self.metrics
+        return client
+
+    def _pop_instances(self) -> list[AIProvider]:
+        with self._lock:
+            instances = list(self._instances.values())
+            self._instances.clear()
+        return instances
+
+    def close(self) -> None:
+        for client in self._pop_instances():
+            client.close()
+
+    async def aclose(self) -> None:
+        for client in self._pop_instances():
+            await client.aclose()
+
+    def __enter__(self) -> "AIProviderManager":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    async def __aenter__(self) -> "AIProviderManager":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def _request_key(self, provider: str, model: str, system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, temperature: float, json_output: bool, local: bool) -> str | None:
+        """Key identifying a request for the response cache and request coalescing (None if neither is enabled)."""
+        if self.response_cache is None and self.singleflight is None:
+            return None
+        return request_key(provider, self.provider_configs.get(provider, {}), model, system_prompt, user_text, messages, file, temperature, json_output, local)
+
+    async def _arequest_key(self, provider: str, model: str, system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, temperature: float, json_output: bool, local: bool) -> str | None:
+        if file is None or (self.response_cache is None and self.singleflight is None):
+            return self._request_key(provider, model, system_prompt, user_text, messages, file, temperature, json_output, local)
+        # Keys hash the attachment's content, so that runs off the event loop.
+        return await asyncio.to_thread(self._request_key, provider, model, system_prompt, user_text, messages, file, temperature, json_output, local)
+
+    def _tokens(self, system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None) -> int:
+        return estimate_tokens(system_prompt, user_text, messages, file) if self.rate_limiter is not None else 0
+
+    def _limit(self, provider: str, model: str, tokens: int) -> ContextManager:
+        if self.rate_limiter is None:
+            return contextlib.nullcontext()
+        return self.rate_limiter.acquire(provider, model, tokens)
+
+    def _alimit(self, provider: str, model: str, tokens: int) -> AsyncContextManager:
+        if self.rate_limiter is None:
+            return contextlib.nullcontext()
+        return self.rate_limiter.aacquire(provider, model, tokens)
+
+    def set_fallbacks(self, provider: str, chain: list[tuple[str, str]], model: str | None = None) -> None:
+        """Fail over to ``chain`` (ordered (provider, model) pairs) when ``provider`` (or just its ``model``) is unhealthy."""
+        self.fallbacks[(provider, model) if model else provider] = list(chain)
+
+    def _candidates(self, provider: str, model: str) -> list[tuple[str, str]]:
+        if self.router is not None and provider in self.router.pools:
+            return self.router.route(provider)
+        chain = self.fallbacks.get((provider, model)) or self.fallbacks.get(provider) or []
+        return [(provider, model)] + [candidate for candidate in chain if candidate != (provider, model)]
+
+    def _open(self, provider: str) -> bool:
+        return self.circuit_breakers is not None and not self.circuit_breakers.get(provider).allow()
+
+    def _attempt(self, client: AIProvider, provider: str, model: str, tokens: int) -> "_Attempt":
+        breaker = self.circuit_breakers.get(provider) if self.circuit_breakers is not None else None
+        return _Attempt(client, breaker, self.router, self.metrics, self.rate_limiter, provider, model, tokens)
+
+    def _dispatch(self, provider: str, model: str, tokens: int, call: Callable[[AIProvider, str], AIResponse]) -> AIResponse:
+        """Run ``call(client, model)`` on the first candidate whose circuit is closed, with rate limiting and retries.
+
+        Provider errors (those the provider considers retryable) move on to the next fallback;
+        other errors are raised straight away.
+        """
+        error = None
+        for candidate, candidate_model in self._candidates(provider, model):
+            if self._open(candidate):
+                error = error or CircuitOpenError(f"Circuit breaker for {candidate} is open")
+                continue
+
+            client = self.get_provider(candidate)
+
+            def attempt() -> AIResponse:
+                with self._limit(candidate, candidate_model, tokens):
+                    return call(client, candidate_model)
+
+            tracker = self._attempt(client, candidate, candidate_model, tokens)
+            try:
+                response = self.retry_policy.call(attempt, client.is_retryable, tracker.retried) if self.retry_policy else attempt()
+            except Exception as e:
+                if not tracker.failed(e):
+                    raise
+                error = e
+                continue
+
+            tracker.done(_content_length(response))
+            tracker.record_usage(response.usage)
+            return response
+        raise error
 
-    def register_provider(self, name: str, provider: type[AIProvider]) -> None:
-        self.providers[name] = provider
+    async def _adispatch(self, provider: str, model: str, tokens: int, call: Callable[[AIProvider, str], Awaitable[AIResponse]]) -> AIResponse:
+        error = None
+        for candidate, candidate_model in self._candidates(provider, model):
+            if self._open(candidate):
+                error = error or CircuitOpenError(f"Circuit breaker for {candidate} is open")
+                continue
+
+            client = self.get_provider(candidate)
+
+            async def attempt() -> AIResponse:
+                async with self._alimit(candidate, candidate_model, tokens):
+                    return await call(client, candidate_model)
+
+            tracker = self._attempt(client, candidate, candidate_model, tokens)
+            try:
+                response = await (self.retry_policy.acall(attempt, client.is_retryable, tracker.retried) if self.retry_policy else attempt())
+            except Exception as e:
+                if not tracker.failed(e):
+                    raise
+                error = e
+                continue
+            except BaseException:
+                tracker.done(None)
+                raise
+
+            tracker.done(_content_length(response))
+            tracker.record_usage(response.usage)
+            return response
+        raise error
+
+    def _dispatch_stream(self, provider: str, model: str, tokens: int, call: Callable[[AIProvider, str], Iterator[str]]) -> Iterator[str | StreamInfo]:
+        """Like ``_dispatch`` for streams: failover happens only before the first chunk, whose latency the breaker records."""
+        error = None
+        for candidate, candidate_model in self._candidates(provider, model):
+            if self._open(candidate):
+                error = error or CircuitOpenError(f"Circuit breaker for {candidate} is open")
+                continue
+
+            client = self.get_provider(candidate)
+
+            def attempt() -> Iterator[str | StreamInfo]:
+                with self._limit(candidate, candidate_model, tokens):
+                    result = call(client, candidate_model)
+                    yield from result
+                    # Pass the provider's end-of-stream usage on to the caller's StreamResult.
+                    if isinstance(result, StreamResult) and result.info is not None:
+                        yield result.info
+
+            tracker = self._attempt(client, candidate, candidate_model, tokens)
+            iterator = self.retry_policy.stream(attempt, client.is_retryable, tracker.retried) if self.retry_policy else attempt()
+            try:
+                first = next(iterator, None)
+            except Exception as e:
+                if not tracker.failed(e):
+                    raise
+                error = e
+                continue
+
+            tracker.first_chunk()
+            chars = None
+            chunks = 0
+            try:
+                if first is not None:
+                    yield first
+                    chars = chunks = 0
+                    if isinstance(first, str):
+                        chars, chunks = len(first), 1
+                    else:
+                        tracker.record_usage(first.usage)
+                    for chunk in iterator:
+                        if isinstance(chunk, str):
+                            chars += len(chunk)
+                            chunks += 1
+                        else:
+                            tracker.record_usage(chunk.usage)
+                        yield chunk
+                chars = chars or 0
+            except Exception as e:
+                tracker.failed(e)
+                raise
+            finally:
+                tracker.done(chars, chunks)
+            return
+        raise error
+
+    async def _adispatch_stream(self, provider: str, model: str, tokens: int, call: Callable[[AIProvider, str], AsyncIterator[str]]) -> AsyncIterator[str | StreamInfo]:
+        error = None
+        for candidate, candidate_model in self._candidates(provider, model):
+            if self._open(candidate):
+                error = error or CircuitOpenError(f"Circuit breaker for {candidate} is open")
+                continue
+
+            client = self.get_provider(candidate)
+
+            async def attempt() -> AsyncIterator[str | StreamInfo]:
+                async with self._alimit(candidate, candidate_model, tokens):
+                    result = call(client, candidate_model)
+                    async for chunk in result:
+                        yield chunk
+                    if isinstance(result, AsyncStreamResult) and result.info is not None:
+                        yield result.info
+
+            tracker = self._attempt(client, candidate, candidate_model, tokens)
+            iterator = self.retry_policy.astream(attempt, client.is_retryable, tracker.retried) if self.retry_policy else attempt()
+            try:
+                first = await anext(iterator, None)
+            except Exception as e:
+                if not tracker.failed(e):
+                    raise
+                error = e
+                continue
+            except BaseException:
+                tracker.done(None)
+                raise
+
+            tracker.first_chunk()
+            chars = None
+            chunks = 0
+            try:
+                if first is not None:
+                    yield first
+                    chars = chunks = 0
+                    if isinstance(first, str):
+                        chars, chunks = len(first), 1
+                    else:
+                        tracker.record_usage(first.usage)
+                    async for chunk in iterator:
+                        if isinstance(chunk, str):
+                            chars += len(chunk)
+                            chunks += 1
+                        else:
+                            tracker.record_usage(chunk.usage)
+                        yield chunk
+                chars = chars or 0
+            except Exception as e:
+                tracker.failed(e)
+                raise
+            finally:
+                tracker.done(chars, chunks)
+                # Release the rate limiter slot now rather than when the generator is garbage collected.
+                await iterator.aclose()
+            return
+        raise error
+
+    async def _ahedge(self, provider: str, model: str, call: Callable[[str, str], Awaitable[AIResponse]]) -> AIResponse:
+        """Run ``call(provider, model)`` with hedged copies as configured by ``hedge_policy``; first accepted response wins."""
+        policy = self.hedge_policy
+        targets = deque(policy.targets(self._candidates(provider, model)))
+        delay = policy.hedge_delay(*targets[0])
+        tasks: dict[asyncio.Task, tuple[str, str, float]] = {}
+        error = None
+
+        def launch() -> None:
+            target_provider, target_model = targets.popleft()
+            tasks[asyncio.ensure_future(call(target_provider, target_model))] = (target_provider, target_model, time.monotonic())
+
+        launch()
+        while policy.race and targets:
+            launch()
+
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, timeout=delay if targets else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+
+                for task in done:
+                    target_provider, target_model, started = tasks.pop(task)
+                    try:
+                        response = task.result()
+                        if not policy.accepts(response):
+                            raise ValueError(f"Response from {target_provider}/{target_model} failed validation")
+                    except Exception as e:
+                        error = e
+                        continue
+                    _record_latencies(policy, (target_provider, target_model, started), tasks.values())
+                    return response
+
+                # Every copy in flight failed; don't wait out the delay before trying the next one.
+                if not tasks and targets:
+                    launch()
+            raise error
+        finally:
+            await _cancel_and_wait(tasks)
+
+    async def _ahedge_stream(self, provider: str, model: str, open_stream: Callable[[str, str], AsyncIterator[str | StreamInfo]]) -> AsyncIterator[str | StreamInfo]:
+        """Hedge a stream on its first chunk, then continue with the stream that produced it."""
+        policy = self.hedge_policy
+        targets = deque(policy.targets(self._candidates(provider, model)))
+        delay = policy.hedge_delay(*targets[0])
+        tasks: dict[asyncio.Task, tuple[AsyncIterator[str], str, str, float]] = {}
+        winner = None
+        error = None
+
+        def launch() -> None:
+            target_provider, target_model = targets.popleft()
+            iterator = open_stream(target_provider, target_model)
+            tasks[asyncio.ensure_future(anext(iterator, None))] = (iterator, target_provider, target_model, time.monotonic())
+
+        launch()
+        while policy.race and targets:
+            launch()
+
+        try:
+            while tasks and winner is None:
+                done, _ = await asyncio.wait(tasks, timeout=delay if targets else None, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    launch()
+                    continue
+
+                for task in done:
+                    iterator, target_provider, target_model, started = tasks.pop(task)
+                    try:
+                        first = task.result()
+                    except Exception as e:
+                        error = e
+                        await iterator.aclose()
+                        continue
+                    _record_latencies(policy, (target_provider, target_model, started), [value[1:] for value in tasks.values()])
+                    winner = (iterator, first)
+                    break
+
+                if winner is None and not tasks and targets:
+                    launch()
+        finally:
+            try:
+                await _cancel_and_wait(tasks)
+            finally:
+                await _settle([asyncio.ensure_future(iterator.aclose()) for iterator, *_ in tasks.values()])
+
+        if winner is None:
+            raise error
+
+        iterator, first = winner
+        try:
+            if first is not None:
+                yield first
+                async for chunk in iterator:
+                    yield chunk
+        finally:
+            await iterator.aclose()
 
     def generate(self, provider: str, model: str, system_prompt: str | None=None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, temperature: float=0.2, local: bool=False, json_output: bool=False) -> AIResponse:
-        Provider = self.providers[provider]
-        client = Provider()
+        key = self._request_key(provider, model, system_prompt, user_text, messages, file, temperature, json_output, local)
+        if key is not None and self.response_cache is not None:
+            cached = self.response_cache.get(key)
+            if cached is not None and cached["history"] is not None:
+                return AIResponse(content=cached["content"], history=cached["history"])
+
+        def call() -> AIResponse:
+            return self._dispatch(provider, model, self._tokens(system_prompt, user_text, messages, file), lambda client, model: client.generate(system_prompt, user_text, messages, file, model, temperature, local=local, json_output=json_output))
+
+        response = _own_copy(self.singleflight.call(key, call)) if self.singleflight is not None else call()
+
+        if key is not None and self.response_cache is not None:
+            self.response_cache.set(key, response.content, response.history)
+        return response
+
+    def stream(self, provider: str, model: str, system_prompt: str | None=None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, temperature: float=0.2, local: bool=False, json_output: bool=False) -> StreamResult | JSONStreamResult:
+        """Stream text chunks; the returned ``StreamResult`` holds the usage, finish reason and timing once it is exhausted.
 
-        return client.generate(system_prompt, user_text, messages, file, model, temperature, local=local, json_output=json_output)
+        With ``json_output`` the response is parsed as it arrives and the ``JSONStreamResult`` yields its top-level fields as they complete.
+        """
+        result = StreamResult(self._stream(provider, model, system_prompt, user_text, messages, file, temperature, local))
+        return JSONStreamResult(result) if json_output else result
 
-    def stream(self, provider: str, model: str, system_prompt: str | None=None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, temperature: float=0.2, local: bool=False) -> Iterator[str]:
-        Provider = self.providers[provider]
-        client = Provider()
+    def _stream(self, provider: str, model: str, system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, temperature: float, local: bool) -> Iterator[str | StreamInfo]:
+        key = self._request_key(provider, model, system_prompt, user_text, messages, file, temperature, False, local)
+        if key is not None and self.response_cache is not None:
+            replay = self.response_cache.replay(key)
+            if replay is not None:
+                yield from replay
+                return
 
-        yield from client.stream(system_prompt, user_text, messages, file, model, temperature, local=local)
+        def open_stream() -> Iterator[str | StreamInfo]:
+            return self._dispatch_stream(provider, model, self._tokens(system_prompt, user_text, messages, file), lambda client, model: client.stream(system_prompt, user_text, messages, file, model, temperature, local=local))
+
+        chunks = []
+        for chunk in self.singleflight.stream(key, open_stream) if self.singleflight is not None else open_stream():
+            chunks.append(chunk)
+            yield chunk
+
+        if key is not None and self.response_cache is not None:
+            self.response_cache.set(key, "".join(chunk for chunk in chunks if isinstance(chunk, str)))
 
     def list_models(self) -> dict[str, list[str]]:
         models = {}
 
-        for name, Provider in self.providers.items():
+        for name in list(self.providers):
             try:
-                client = Provider()
+                client = self.get_provider(name)
                 models[name] = client.list_models()
             except Exception:
                 models[name] = []
@@ -53,30 +712,227 @@ class AIProviderManager:
         return models
 
     def get_model_info(self, provider: str, model: str) -> dict:
-        Provider = self.providers[provider]
-        client = Provider()
+        client = self.get_provider(provider)
 
         return client.get_model_info(model)
 
     async def agenerate(self, provider: str, model: str, system_prompt: str | None=None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, temperature: float=0.2, local: bool=False, json_output: bool=False) -> AIResponse:
-        Provider = self.providers[provider]
-        client = Provider()
+        key = await self._arequest_key(provider, model, system_prompt, user_text, messages, file, temperature, json_output, local)
+        if key is not None and self.response_cache is not None:
+            cached = self.response_cache.get(key)
+            if cached is not None and cached["history"] is not None:
+                return AIResponse(content=cached["content"], history=cached["history"])
+
+        tokens = self._tokens(system_prompt, user_text, messages, file)
+        generate = lambda client, model: client.agenerate(system_prompt, user_text, messages, file, model, temperature, local=local, json_output=json_output)
+
+        async def call() -> AIResponse:
+            if self.hedge_policy is not None:
+                return await self._ahedge(provider, model, lambda provider, model: self._adispatch(provider, model, tokens, generate))
+            return await self._adispatch(provider, model, tokens, generate)
 
-        return await client.agenerate(system_prompt, user_text, messages, file, model, temperature, local=local, json_output=json_output)
+        response = _own_copy(await self.singleflight.acall(key, call)) if self.singleflight is not None else await call()
 
-    async def astream(self, provider: str, model: str, system_prompt: str | None=None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, temperature: float=0.2, local: bool=False) -> AsyncIterator[str]:
-        Provider = self.providers[provider]
-        client = Provider()
+        if key is not None and self.response_cache is not None:
+            self.response_cache.set(key, response.content, response.history)
+        return response
 
-        async for chunk in client.astream(system_prompt, user_text, messages, file, model, temperature, local=local):
+    def astream(self, provider: str, model: str, system_prompt: str | None=None, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, temperature: float=0.2, local: bool=False, json_output: bool=False) -> AsyncStreamResult | AsyncJSONStreamResult:
+        result = AsyncStreamResult(self._astream(provider, model, system_prompt, user_text, messages, file, temperature, local))
+        return AsyncJSONStreamResult(result) if json_output else result
+
+    async def _astream(self, provider: str, model: str, system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, temperature: float, local: bool) -> AsyncIterator[str | StreamInfo]:
+        key = await self._arequest_key(provider, model, system_prompt, user_text, messages, file, temperature, False, local)
+        if key is not None and self.response_cache is not None:
+            replay = self.response_cache.replay(key)
+            if replay is not None:
+                for chunk in replay:
+                    yield chunk
+                return
+
+        tokens = self._tokens(system_prompt, user_text, messages, file)
+        stream = lambda client, model: client.astream(system_prompt, user_text, messages, file, model, temperature, local=local)
+
+        def open_stream() -> AsyncIterator[str | StreamInfo]:
+            if self.hedge_policy is not None:
+                return self._ahedge_stream(provider, model, lambda provider, model: self._adispatch_stream(provider, model, tokens, stream))
+            return self._adispatch_stream(provider, model, tokens, stream)
+
+        chunks = []
+        async for chunk in self.singleflight.astream(key, open_stream) if self.singleflight is not None else open_stream():
+            chunks.append(chunk)
             yield chunk
 
+        if key is not None and self.response_cache is not None:
+            self.response_cache.set(key, "".join(chunk for chunk in chunks if isinstance(chunk, str)))
+
+    def generate_many(self, requests: Iterable[dict], concurrency: int = 16, provider_concurrency: int | dict[str, int] | None = None) -> Iterator[RequestResult]:
+        """Run ``generate(**request)`` for each request on a thread pool, yielding results as they complete.
+
+        ``requests`` is consumed lazily, keeping at most ``concurrency`` requests in flight;
+        ``provider_concurrency`` caps in-flight requests per provider (one limit for all, or per name).
+        Requests for a provider at its cap wait without taking one of the ``concurrency`` slots, while
+        up to ``concurrency`` further requests are read ahead for other providers.
+        Errors are returned on the result instead of aborting the batch.
+        """
+        def run(index: int, request: dict) -> RequestResult:
+            try:
+                return RequestResult(index, response=self.generate(**request))
+            except Exception as e:
+                return RequestResult(index, error=e)
+
+        slots = _ProviderSlots(provider_concurrency, concurrency)
+        iterator = enumerate(requests)
+        exhausted = False
+        pending: dict[Future, dict] = {}
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        def submit(index: int, request: dict) -> None:
+            slots.start(request)
+            pending[executor.submit(run, index, request)] = request
+
+        try:
+            while True:
+                while len(pending) < concurrency:
+                    ready = slots.ready()
+                    if ready is not None:
+                        submit(*ready)
+                        continue
+                    if exhausted or slots.full:
+                        break
+                    item = next(iterator, None)
+                    if item is None:
+                        exhausted = True
+                    elif slots.admit(*item):
+                        submit(*item)
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    slots.finish(pending.pop(future))
+                    yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def agenerate_many(self, requests: Iterable[dict] | AsyncIterable[dict], concurrency: int = 16, provider_concurrency: int | dict[str, int] | None = None) -> AsyncIterator[RequestResult]:
+        """Run ``agenerate(**request)`` for each request concurrently, yielding results as they complete.
+
+        ``requests`` (a sync or async iterable) is consumed lazily, keeping at most ``concurrency``
+        requests in flight; ``provider_concurrency`` caps in-flight requests per provider (one limit
+        for all, or per name), as in ``generate_many``. Errors are returned on the result instead of aborting the batch.
+        """
+        async def run(index: int, request: dict) -> RequestResult:
+            try:
+                return RequestResult(index, response=await self.agenerate(**request))
+            except Exception as e:
+                return RequestResult(index, error=e)
+
+        slots = _ProviderSlots(provider_concurrency, concurrency)
+        iterator = _aiter_requests(requests)
+        index = 0
+        exhausted = False
+        pending: dict[asyncio.Task, dict] = {}
+
+        def submit(index: int, request: dict) -> None:
+            slots.start(request)
+            pending[asyncio.create_task(run(index, request))] = request
+
+        try:
+            while True:
+                while len(pending) < concurrency:
+                    ready = slots.ready()
+                    if ready is not None:
+                        submit(*ready)
+                        continue
+                    if exhausted or slots.full:
+                        break
+                    try:
+                        request = await anext(iterator)
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    if slots.admit(index, request):
+                        submit(index, request)
+                    index += 1
+
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    slots.finish(pending.pop(task))
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            # Wait for them to unwind, so their provider slots and rate-limit reservations are released before returning.
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def submit_batch(self, provider: str, model: str, requests: Iterable[dict], json_output: bool = False) -> BatchJob:
+        """Submit requests (``generate`` keyword arguments without provider/model) through the provider's batch API.
+
+        Batches are processed offline by the provider (OpenAI Batch API, Anthropic Message Batches),
+        trading latency for throughput and cost. Results are returned in input order by ``batch_results``.
+        """
+        client = self.get_provider(provider)
+        items = [{**request, "custom_id": str(index)} for index, request in enumerate(requests)]
+
+        batch_id = client.submit_batch(items, model)
+        job = BatchJob(provider=provider, model=model, batch_id=batch_id, size=len(items), json_output=json_output)
+
+        if self.batch_store:
+            self.batch_store.save(job)
+        return job
+
+    def poll_batch(self, job: BatchJob) -> BatchJob:
+        if not job.done:
+            job.status = self.get_provider(job.provider).batch_status(job.batch_id)
+            if self.batch_store:
+                self.batch_store.save(job)
+        return job
+
+    def batch_results(self, job: BatchJob) -> list[RequestResult]:
+        """Fetch the results of a finished batch as AIResponses (without history), one per input request."""
+        if not job.done:
+            raise RuntimeError(f"Batch {job.batch_id} is still in progress")
+
+        results = {} if job.status == FAILED else self.get_provider(job.provider).batch_results(job.batch_id)
+        missing = f"Batch {job.batch_id} failed" if job.status == FAILED else "No result returned for this request"
+
+        output = []
+        for index in range(job.size):
+            result = results.get(str(index), BatchRequestError(missing))
+            if isinstance(result, Exception):
+                output.append(RequestResult(index, error=result))
+                continue
+            try:
+                content = parse_ai_response(result) if job.json_output else result
+                output.append(RequestResult(index, response=AIResponse(content=content)))
+            except Exception as e:
+                output.append(RequestResult(index, error=e))
+
+        if self.batch_store:
+            self.batch_store.remove(job)
+        return output
+
+    def wait_batch(self, job: BatchJob, poll_interval: float = 30.0, timeout: float | None = None) -> list[RequestResult]:
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.poll_batch(job).done:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Batch {job.batch_id} did not finish within {timeout} seconds")
+            time.sleep(poll_interval)
+        return self.batch_results(job)
+
+    def resume_batches(self) -> list[BatchJob]:
+        """Return the batch jobs persisted in ``batch_dir`` whose results have not been collected yet."""
+        return self.batch_store.load_all() if self.batch_store else []
+
     def conversation(self, provider: str, model: str, system_prompt: str | None = None, temperature: float = 0.2, local: bool = False) -> "Conversation":
         from multi_ai_handler.utils import Conversation
-        Provider = self.providers[provider]
-        client = Provider()
         return Conversation(
-            handler=client,
+            handler=_ManagedProvider(self, provider),
             model=model,
             system_prompt=system_prompt,
             temperature=temperature,
@@ -0,0 +1,4 @@
+from multi_ai_handler.utils import load_env
+
+# Provider modules are imported lazily, so .env is only read once a provider is first used.
+load_env()
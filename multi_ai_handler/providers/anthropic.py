@@ -1,21 +1,86 @@
+import asyncio
+
 from anthropic import Anthropic, AsyncAnthropic
 
+from multi_ai_handler import metrics
 from multi_ai_handler.ai_provider import AIProvider
-from multi_ai_handler.utils import AIResponse, parse_ai_response
+from multi_ai_handler.batch import ENDED, IN_PROGRESS, BatchRequestError
+from multi_ai_handler.utils import AIResponse, AsyncStreamResult, LoopLocal, StreamInfo, StreamResult, Usage, parse_ai_response
 from pathlib import Path
 from typing import Iterator, AsyncIterator
 
-from multi_ai_handler.generate_payload import generate_claude_payload, build_claude_user_content
+from multi_ai_handler.file_uploads import CachedUpload, FileUploadCache, default_upload_cache, is_missing_file, reupload_missing_files, upload_namespace
+from multi_ai_handler.generate_payload import generate_claude_payload, resolve_claude_payload, extend_history, has_file_refs
+
+FILES_API_BETA = "files-api-2025-04-14"
+
+
+def _stream_info(message) -> StreamInfo:
+    usage = message.usage
+    cached = usage.cache_read_input_tokens or 0
+    # Anthropic reports cache reads and writes separately from the uncached input tokens.
+    input_tokens = usage.input_tokens + cached + (usage.cache_creation_input_tokens or 0)
+    return StreamInfo(usage=Usage(input_tokens=input_tokens, output_tokens=usage.output_tokens, cached_tokens=cached), finish_reason=message.stop_reason)
 
 
 class AnthropicProvider(AIProvider):
-    def __init__(self):
+    def __init__(self, base_url: str | None=None, api_key: str | None=None, upload_files: bool=False, upload_ttl: float=24 * 3600, upload_cache: FileUploadCache | None=None, max_retries: int=2) -> None:
         super().__init__()
-        self.client = Anthropic()
-        self.async_client = AsyncAnthropic()
-
+        # The manager passes max_retries=0 when its retry_policy owns retries.
+        self.client = Anthropic(base_url=base_url, api_key=api_key, max_retries=max_retries)
+        self._async_clients = LoopLocal(lambda: AsyncAnthropic(base_url=base_url, api_key=api_key, max_retries=max_retries), close=lambda client: client.close())
+
+        # In upload mode files go through the Files API once and payloads reference them by ID.
+        self.upload_files = upload_files
+        self._upload = CachedUpload(
+            upload_cache or default_upload_cache,
+            upload_namespace("anthropic", str(self.client.base_url), self.client.api_key),
+            upload_ttl,
+            self._upload_file,
+        )
+        self._extra_headers = {"anthropic-beta": FILES_API_BETA} if upload_files else None
+
+    @property
+    def async_client(self) -> AsyncAnthropic:
+        return self._async_clients.get()
+
+    def close(self) -> None:
+        self.client.close()
+        self._async_clients.clear()
+
+    async def aclose(self) -> None:
+        await self._async_clients.aclose()
+        self.client.close()
+
+    def is_retryable(self, exc: Exception) -> bool:
+        # Errors sent mid-stream arrive with the stream's 200 status; classify them by error type.
+        body = getattr(exc, "body", None)
+        if isinstance(body, dict) and isinstance(body.get("error"), dict):
+            if body["error"].get("type") in ("overloaded_error", "rate_limit_error", "api_error"):
+                return True
+        return super().is_retryable(exc)
+
+    def is_missing_upload(self, exc: Exception) -> bool:
+        return is_missing_file(exc)
+
+    def _upload_file(self, filename: str, data: bytes, mime_type: str) -> str:
+        return self.client.beta.files.upload(file=(filename, data, mime_type)).id
+
+    def _payload(self, user_text: str | None, file: str | Path | dict | None, local: bool, messages: list[dict] | None, model: str | None = None) -> tuple[list, list]:
+        """Return the payload kept in history (with file references) and the resolved one to send."""
+        with metrics.scope(self.metrics, self.metrics_label, model), metrics.timed("payload_build_seconds"):
+            payload = generate_claude_payload(user_text, file, local=local, messages=messages, upload=self._upload if self.upload_files else None)
+            return payload, resolve_claude_payload(payload)
+
+    async def _apayload(self, user_text: str | None, file: str | Path | dict | None, local: bool, messages: list[dict] | None, model: str | None = None) -> tuple[list, list]:
+        if file is None and not has_file_refs(messages):
+            return self._payload(user_text, file, local, messages, model)
+        # Reading, encoding and uploading files blocks, so it runs off the event loop.
+        return await asyncio.to_thread(self._payload, user_text, file, local, messages, model)
+
+    @reupload_missing_files
     def generate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model:str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
-        payload: list = generate_claude_payload(user_text, file, local=local, messages=messages)
+        payload, request_payload = self._payload(user_text, file, local, messages, model)
 
         response_text: str = ""
 
@@ -24,32 +89,69 @@ class AnthropicProvider(AIProvider):
             max_tokens=20000,
             temperature=temperature,
             system=system_prompt,
-            messages=payload
+            messages=request_payload,
+            extra_headers=self._extra_headers,
         ) as stream:
             for text in stream.text_stream:
                 response_text += text
+            info = _stream_info(stream.get_final_message())
 
         # Build history
-        new_user_content = build_claude_user_content(user_text, file, local)
-        history = list(messages) if messages else []
-        history.append({"role": "user", "content": new_user_content})
-        history.append({"role": "assistant", "content": response_text})
+        history = extend_history(messages, payload[-1], {"role": "assistant", "content": response_text})
 
         content = parse_ai_response(response_text) if json_output else response_text
-        return AIResponse(content=content, history=history)
+        return AIResponse(content=content, history=history, **vars(info))
+
+    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> StreamResult:
+        return StreamResult(self._stream(system_prompt, user_text, messages, file, model, temperature, local))
 
-    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> Iterator[str]:
-        payload: list = generate_claude_payload(user_text, file, local=local, messages=messages)
+    @reupload_missing_files
+    def _stream(self, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> Iterator[str | StreamInfo]:
+        _, request_payload = self._payload(user_text, file, local, messages, model)
 
         with self.client.messages.stream(
             model=model,
             max_tokens=20000,
             temperature=temperature,
             system=system_prompt,
-            messages=payload
+            messages=request_payload,
+            extra_headers=self._extra_headers,
         ) as stream:
             for text in stream.text_stream:
                 yield text
+            yield _stream_info(stream.get_final_message())
+
+    def submit_batch(self, requests: list[dict], model: str) -> str:
+        batch_requests = []
+        for request in requests:
+            _, request_payload = self._payload(request.get("user_text"), request.get("file"), request.get("local", False), request.get("messages"), model)
+            params = {
+                "model": model,
+                "max_tokens": 20000,
+                "temperature": request.get("temperature", 0.2),
+                "messages": request_payload,
+            }
+            if request.get("system_prompt"):
+                params["system"] = request["system_prompt"]
+            batch_requests.append({"custom_id": request["custom_id"], "params": params})
+
+        batch = self.client.messages.batches.create(requests=batch_requests, extra_headers=self._extra_headers)
+        return batch.id
+
+    def batch_status(self, batch_id: str) -> str:
+        batch = self.client.messages.batches.retrieve(batch_id)
+        return ENDED if batch.processing_status == "ended" else IN_PROGRESS
+
+    def batch_results(self, batch_id: str) -> dict[str, str | Exception]:
+        results = {}
+
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = "".join(block.text for block in entry.result.message.content if block.type == "text")
+            else:
+                results[entry.custom_id] = BatchRequestError(f"Request {entry.result.type}: {getattr(entry.result, 'error', None)}")
+
+        return results
 
     def list_models(self) -> list[str]:
         response = self.client.models.list()
@@ -63,8 +165,9 @@ class AnthropicProvider(AIProvider):
             "display_name": response.display_name,
         }
 
+    @reupload_missing_files
     async def agenerate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
-        payload: list = generate_claude_payload(user_text, file, local=local, messages=messages)
+        payload, request_payload = await self._apayload(user_text, file, local, messages, model)
 
         response_text: str = ""
 
@@ -73,29 +176,34 @@ class AnthropicProvider(AIProvider):
             max_tokens=20000,
             temperature=temperature,
             system=system_prompt,
-            messages=payload
+            messages=request_payload,
+            extra_headers=self._extra_headers,
         ) as stream:
             async for text in stream.text_stream:
                 response_text += text
+            info = _stream_info(await stream.get_final_message())
 
         # Build history
-        new_user_content = build_claude_user_content(user_text, file, local)
-        history = list(messages) if messages else []
-        history.append({"role": "user", "content": new_user_content})
-        history.append({"role": "assistant", "content": response_text})
+        history = extend_history(messages, payload[-1], {"role": "assistant", "content": response_text})
 
         content = parse_ai_response(response_text) if json_output else response_text
-        return AIResponse(content=content, history=history)
+        return AIResponse(content=content, history=history, **vars(info))
 
-    async def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncIterator[str]:
-        payload: list = generate_claude_payload(user_text, file, local=local, messages=messages)
+    def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncStreamResult:
+        return AsyncStreamResult(self._astream(system_prompt, user_text, messages, file, model, temperature, local))
+
+    @reupload_missing_files
+    async def _astream(self, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> AsyncIterator[str | StreamInfo]:
+        _, request_payload = await self._apayload(user_text, file, local, messages, model)
 
         async with self.async_client.messages.stream(
             model=model,
             max_tokens=20000,
             temperature=temperature,
             system=system_prompt,
-            messages=payload
+            messages=request_payload,
+            extra_headers=self._extra_headers,
         ) as stream:
             async for text in stream.text_stream:
-                yield text
\ No newline at end of file
+                yield text
+            yield _stream_info(await stream.get_final_message())
\ No newline at end of file
@@ -1,10 +1,16 @@
+from multi_ai_handler.file_uploads import FileUploadCache
 from multi_ai_handler.providers.openai import OpenAIProvider
 import os
 
 class CerebrasProvider(OpenAIProvider):
-    def __init__(self):
+    def __init__(self, base_url: str | None="https://api.cerebras.ai/v1", api_key: str | None=None, local: bool=True, upload_files: bool=False, upload_ttl: float=24 * 3600, upload_cache: FileUploadCache | None=None, max_retries: int=2, stream_usage: bool=True) -> None:
         super().__init__(
-            base_url="https://api.cerebras.ai/v1",
-            api_key=os.getenv("CEREBRAS_API_KEY"),
-            local=True
-        )
\ No newline at end of file
+            base_url=base_url,
+            api_key=api_key if api_key is not None else os.getenv("CEREBRAS_API_KEY"),
+            local=local,
+            upload_files=upload_files,
+            upload_ttl=upload_ttl,
+            upload_cache=upload_cache,
+            max_retries=max_retries,
+            stream_usage=stream_usage,
+        )
@@ -1,24 +1,109 @@
+import asyncio
+import io
+import os
+import re
+import time
+
 from google import genai
 from google.genai import types
 from pathlib import Path
 from typing import Iterator, AsyncIterator
 
+from multi_ai_handler import metrics
 from multi_ai_handler.ai_provider import AIProvider
-from multi_ai_handler.utils import AIResponse, parse_ai_response
-from multi_ai_handler.generate_payload import generate_google_payload, build_google_user_parts
+from multi_ai_handler.retry import status_code
+from multi_ai_handler.utils import AIResponse, AsyncStreamResult, LoopLocal, StreamInfo, StreamResult, Usage, parse_ai_response
+from multi_ai_handler.file_uploads import CachedUpload, FileUploadCache, default_upload_cache, reupload_missing_files, upload_namespace
+from multi_ai_handler.generate_payload import generate_google_payload, resolve_google_payload, extend_history, has_file_refs
+
+
+def _stream_info(response: types.GenerateContentResponse) -> StreamInfo:
+    """Usage, finish reason and server time of a response, or of the last chunk of a stream (which carries the totals)."""
+    metadata = response.usage_metadata
+    usage = None
+    if metadata is not None:
+        output_tokens = None if metadata.candidates_token_count is None else metadata.candidates_token_count + (metadata.thoughts_token_count or 0)
+        usage = Usage(input_tokens=metadata.prompt_token_count, output_tokens=output_tokens, cached_tokens=metadata.cached_content_token_count)
+
+    finish_reason = response.candidates[0].finish_reason if response.candidates else None
+
+    timing = None
+    headers = response.sdk_http_response.headers if response.sdk_http_response is not None else None
+    # e.g. "server-timing: gfet4t7; dur=1234"
+    server_timing = next((value for name, value in (headers or {}).items() if name.lower() == "server-timing"), None)
+    duration = re.search(r"dur=([\d.]+)", server_timing) if server_timing else None
+    if duration:
+        timing = {"total": float(duration.group(1)) / 1000}
+
+    return StreamInfo(usage=usage, finish_reason=getattr(finish_reason, "value", finish_reason), timing=timing)
+
 
 class GoogleProvider(AIProvider):
-    def __init__(self):
+    def __init__(self, base_url: str | None=None, api_key: str | None=None, upload_files: bool=False, upload_ttl: float=47 * 3600, upload_cache: FileUploadCache | None=None) -> None:
         super().__init__()
-        self.client = genai.Client()
-        self.async_client = self.client.aio
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        self.client = genai.Client(api_key=api_key, http_options=http_options)
+        self._async_clients = LoopLocal(lambda: genai.Client(api_key=api_key, http_options=http_options).aio, close=lambda client: client.aclose())
+
+        # In upload mode files go through the Files API once and payloads reference their URI.
+        # Gemini deletes uploaded files after 48 hours, hence the default TTL.
+        self.upload_files = upload_files
+        self._upload = CachedUpload(
+            upload_cache or default_upload_cache,
+            upload_namespace("google", base_url, api_key or os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")),
+            upload_ttl,
+            self._upload_file,
+        )
 
+    @property
+    def async_client(self) -> "genai.client.AsyncClient":
+        return self._async_clients.get()
+
+    def close(self) -> None:
+        self.client.close()
+        self._async_clients.clear()
+
+    async def aclose(self) -> None:
+        await self._async_clients.aclose()
+        self.client.close()
+
+    def is_missing_upload(self, exc: Exception) -> bool:
+        # An expired or deleted upload is reported as PERMISSION_DENIED or NOT_FOUND on the file's URI.
+        if status_code(exc) not in (403, 404) or getattr(exc, "status", None) not in ("PERMISSION_DENIED", "NOT_FOUND"):
+            return False
+        return "file" in str(getattr(exc, "message", "") or "").lower()
+
+    def _upload_file(self, filename: str, data: bytes, mime_type: str) -> str:
+        uploaded = self.client.files.upload(
+            file=io.BytesIO(data),
+            config=types.UploadFileConfig(mime_type=mime_type, display_name=filename),
+        )
+        while uploaded.state == types.FileState.PROCESSING:
+            time.sleep(1)
+            uploaded = self.client.files.get(name=uploaded.name)
+        if uploaded.state == types.FileState.FAILED:
+            raise RuntimeError(f"Gemini could not process uploaded file {filename}: {uploaded.error}")
+        return uploaded.uri
+
+    def _payload(self, user_text: str | None, file: str | Path | dict | None, local: bool, messages: list[dict] | None, model: str | None = None) -> tuple[list, list]:
+        """Return the payload kept in history (with file references) and the resolved one to send."""
+        with metrics.scope(self.metrics, self.metrics_label, model), metrics.timed("payload_build_seconds"):
+            payload = generate_google_payload(user_text, file, local=local, messages=messages, upload=self._upload if self.upload_files else None)
+            return payload, resolve_google_payload(payload)
+
+    async def _apayload(self, user_text: str | None, file: str | Path | dict | None, local: bool, messages: list[dict] | None, model: str | None = None) -> tuple[list, list]:
+        if file is None and not has_file_refs(messages):
+            return self._payload(user_text, file, local, messages, model)
+        # Reading, encoding, extracting and uploading files blocks, so it runs off the event loop.
+        return await asyncio.to_thread(self._payload, user_text, file, local, messages, model)
+
+    @reupload_missing_files
     def generate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model:str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
-        payload: list = generate_google_payload(user_text, file, local=local, messages=messages)
+        payload, request_payload = self._payload(user_text, file, local, messages, model)
 
         response = self.client.models.generate_content(
             model=model,
-            contents=payload,
+            contents=request_payload,
             config=types.GenerateContentConfig(
                 system_instruction=system_prompt,
                 temperature=temperature
@@ -28,29 +113,34 @@ class GoogleProvider(AIProvider):
         response_text = response.text
 
         # Build history (Google uses "model" for assistant role)
-        new_user_parts = build_google_user_parts(user_text, file, local)
-        history = list(messages) if messages else []
-        history.append({"role": "user", "parts": new_user_parts})
-        history.append({"role": "model", "parts": [{"text": response_text}]})
+        history = extend_history(messages, payload[-1], {"role": "model", "parts": [{"text": response_text}]})
 
         content = parse_ai_response(response_text) if json_output else response_text
-        return AIResponse(content=content, history=history)
+        return AIResponse(content=content, history=history, **vars(_stream_info(response)))
+
+    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> StreamResult:
+        return StreamResult(self._stream(system_prompt, user_text, messages, file, model, temperature, local))
 
-    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> Iterator[str]:
-        payload: list = generate_google_payload(user_text, file, local=local, messages=messages)
+    @reupload_missing_files
+    def _stream(self, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> Iterator[str | StreamInfo]:
+        _, request_payload = self._payload(user_text, file, local, messages, model)
 
         response = self.client.models.generate_content_stream(
             model=model,
-            contents=payload,
+            contents=request_payload,
             config=types.GenerateContentConfig(
                 system_instruction=system_prompt,
                 temperature=temperature
             )
         )
 
+        last = None
         for chunk in response:
             if chunk.text:
                 yield chunk.text
+            last = chunk
+        if last is not None:
+            yield _stream_info(last)
 
     def list_models(self) -> list[str]:
         response = self.client.models.list()
@@ -65,12 +155,13 @@ class GoogleProvider(AIProvider):
             "output_token_limit": response.output_token_limit,
         }
 
+    @reupload_missing_files
     async def agenerate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
-        payload: list = generate_google_payload(user_text, file, local=local, messages=messages)
+        payload, request_payload = await self._apayload(user_text, file, local, messages, model)
 
         response = await self.async_client.models.generate_content(
             model=model,
-            contents=payload,
+            contents=request_payload,
             config=types.GenerateContentConfig(
                 system_instruction=system_prompt,
                 temperature=temperature
@@ -80,26 +171,31 @@ class GoogleProvider(AIProvider):
         response_text = response.text
 
         # Build history (Google uses "model" for assistant role)
-        new_user_parts = build_google_user_parts(user_text, file, local)
-        history = list(messages) if messages else []
-        history.append({"role": "user", "parts": new_user_parts})
-        history.append({"role": "model", "parts": [{"text": response_text}]})
+        history = extend_history(messages, payload[-1], {"role": "model", "parts": [{"text": response_text}]})
 
         content = parse_ai_response(response_text) if json_output else response_text
-        return AIResponse(content=content, history=history)
+        return AIResponse(content=content, history=history, **vars(_stream_info(response)))
 
-    async def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncIterator[str]:
-        payload: list = generate_google_payload(user_text, file, local=local, messages=messages)
+    def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncStreamResult:
+        return AsyncStreamResult(self._astream(system_prompt, user_text, messages, file, model, temperature, local))
+
+    @reupload_missing_files
+    async def _astream(self, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> AsyncIterator[str | StreamInfo]:
+        _, request_payload = await self._apayload(user_text, file, local, messages, model)
 
         response = await self.async_client.models.generate_content_stream(
             model=model,
-            contents=payload,
+            contents=request_payload,
             config=types.GenerateContentConfig(
                 system_instruction=system_prompt,
                 temperature=temperature
             )
         )
 
+        last = None
         async for chunk in response:
             if chunk.text:
-                yield chunk.text
\ No newline at end of file
+                yield chunk.text
+            last = chunk
+        if last is not None:
+            yield _stream_info(last)
\ No newline at end of file
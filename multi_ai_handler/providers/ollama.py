@@ -1,93 +1,378 @@
+import asyncio
+import contextlib
+import difflib
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from multi_ai_handler import metrics
 from multi_ai_handler.ai_provider import AIProvider
-from multi_ai_handler.utils import AIResponse, parse_ai_response
+from multi_ai_handler.rate_limit import AdaptiveConcurrency
+from multi_ai_handler.utils import AIResponse, AsyncStreamResult, LoopLocal, StreamInfo, StreamResult, Usage, parse_ai_response
 from pathlib import Path
 from typing import Iterator, AsyncIterator
 import requests
 
-from multi_ai_handler.generate_payload import generate_ollama_payload, build_ollama_user_content
+from multi_ai_handler.generate_payload import generate_ollama_payload, extend_history
 
 try:
+    import httpx
     import ollama
     from ollama import AsyncClient
     OLLAMA_AVAILABLE = True
+    # The ollama client raises ConnectionError when it can't connect and httpx errors when a connection breaks.
+    _HOST_ERRORS = (ConnectionError, httpx.TransportError)
 except ImportError:
     OLLAMA_AVAILABLE = False
     AsyncClient = None
+    _HOST_ERRORS = (ConnectionError,)
 
 class OllamaServerError(RuntimeError):
     pass
 
 
-class OllamaProvider(AIProvider):
-    def __init__(self, base_url: str = "http://localhost:11434"):
-        super().__init__()
-        self.base_url = base_url.rstrip("/")
+# Runtime options the server accepts in a request's ``options``; ``temperature`` is a per-call argument.
+RUNTIME_OPTIONS = frozenset({
+    "num_keep", "seed", "num_predict", "top_k", "top_p", "min_p", "typical_p", "repeat_last_n", "repeat_penalty",
+    "presence_penalty", "frequency_penalty", "penalize_newline", "stop", "tfs_z", "mirostat", "mirostat_tau", "mirostat_eta",
+    "numa", "num_ctx", "num_batch", "num_gpu", "main_gpu", "low_vram", "f16_kv", "logits_all", "vocab_only", "use_mmap",
+    "use_mlock", "num_thread", "embedding_only",
+})
+if OLLAMA_AVAILABLE:
+    # Options added by newer client versions.
+    RUNTIME_OPTIONS |= frozenset(ollama.Options.model_fields) - {"temperature"}
 
-    def _check_server(self):
-        if not OLLAMA_AVAILABLE:
-            raise ImportError(
-                "Ollama is not installed. Install it with: pip install multi-ai-handler[ollama]"
-            )
 
+def _check_options(options: dict) -> None:
+    """Reject option names the server would silently ignore, such as misspellings."""
+    for name in options:
+        if name in RUNTIME_OPTIONS:
+            continue
+        if name == "temperature":
+            raise ValueError("temperature is set per request, not as an OllamaProvider option")
+        close = difflib.get_close_matches(name, RUNTIME_OPTIONS, n=1)
+        raise ValueError(f"Unknown Ollama option {name!r}" + (f"; did you mean {close[0]!r}?" if close else ""))
+
+
+def _stream_info(response) -> StreamInfo:
+    """Usage and server timing of a response, or of the final (``done``) chunk of a stream."""
+    usage = Usage(input_tokens=response.get("prompt_eval_count"), output_tokens=response.get("eval_count"))
+    # Ollama reports durations in nanoseconds.
+    timing = {name: response[key] / 1e9 for name, key in (("total", "total_duration"), ("load", "load_duration"), ("prompt", "prompt_eval_duration"), ("completion", "eval_duration")) if response.get(key) is not None}
+    return StreamInfo(usage=usage, finish_reason=response.get("done_reason"), timing=timing or None)
+
+
+def _model_name(model: str) -> str:
+    # /api/ps lists models with their tag.
+    return model if ":" in model else f"{model}:latest"
+
+
+class _Host:
+    """One Ollama server: its clients, cached health, loaded models and per-model request slots."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.client = ollama.Client(host=self.base_url) if OLLAMA_AVAILABLE else None
+        self.async_clients = LoopLocal(lambda: AsyncClient(host=self.base_url), close=lambda client: client._client.aclose())
+        # (checked at, error message or None if healthy), from time.monotonic().
+        self.health: tuple[float, str | None] | None = None
+        # Models in memory as of the last check, plus those served since.
+        self.loaded: set[str] = set()
+        self.in_flight = 0
+        self.gates: dict[str | None, AdaptiveConcurrency] = {}
+        self._health_lock = threading.Lock()
+        self._refreshing = False
+
+    @property
+    def healthy(self) -> bool:
+        health = self.health
+        return health is not None and health[1] is None
+
+    def probe(self) -> str | None:
+        """Why the server can't take requests, or None if it can; also refreshes ``loaded``."""
         try:
-            resp = requests.get(f"{self.base_url}/api/tags", timeout=2)
+            resp = self.session.get(f"{self.base_url}/api/ps", timeout=2)
         except requests.exceptions.ConnectionError:
-            raise OllamaServerError(
-                f"Ollama server is not running at {self.base_url}. "
-                f"Start it with: `ollama serve`"
-            )
+            return f"Ollama server is not running at {self.base_url}. Start it with: `ollama serve`"
         except requests.exceptions.RequestException as e:
-            raise OllamaServerError(
-                f"Could not communicate with Ollama server at {self.base_url}: {e}"
-            )
+            return f"Could not communicate with Ollama server at {self.base_url}: {e}"
 
         if resp.status_code >= 500:
-            raise OllamaServerError(
-                f"Ollama server responded with {resp.status_code} (server error)"
+            return f"Ollama server responded with {resp.status_code} (server error)"
+        if resp.ok:
+            self.loaded = {model["name"] for model in resp.json().get("models", [])}
+        return None
+
+    def refresh(self, seen: float) -> None:
+        """Probe the server unless someone else did after ``seen``."""
+        with self._health_lock:
+            # Concurrent callers wait here for one probe instead of each sending their own.
+            if self.health is None or self.health[0] <= seen:
+                error = self.probe()
+                # Stamped when the probe finishes, so callers that arrived during it don't probe again.
+                self.health = (time.monotonic(), error)
+
+    def refresh_in_background(self, seen: float) -> None:
+        with self._health_lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self.refresh(seen)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def eject(self, error: BaseException) -> None:
+        self.health = (time.monotonic(), f"Lost connection to Ollama server at {self.base_url}: {error}")
+
+    def gate(self, model: str | None, parallel: int) -> AdaptiveConcurrency:
+        gate = self.gates.get(model)
+        if gate is None:
+            gate = self.gates.setdefault(model, AdaptiveConcurrency(parallel, max_limit=parallel, adaptive=False))
+        return gate
+
+    def close(self) -> None:
+        self.session.close()
+        self.async_clients.clear()
+
+    async def aclose(self) -> None:
+        await self.async_clients.aclose()
+        self.session.close()
+
+
+class OllamaProvider(AIProvider):
+    """Local models through one Ollama server, or load-balanced over several.
+
+    ``base_url`` takes a list of servers to spread requests over. Each request goes to a healthy server,
+    preferring ones with free slots (see ``parallel``), then ones that already have the model loaded,
+    then the least busy.
+
+    Each server's health (and the models it has loaded, from ``/api/ps``) is checked once and then
+    cached for ``health_ttl`` seconds, after which it is re-checked in the background while requests keep
+    going. A server that fails a check or drops a connection is ejected; it is re-checked every
+    ``health_ttl`` seconds and re-admitted once it answers again. When no server is up, every request
+    re-checks them first, so a restart is noticed right away. Async calls never block the event loop on
+    a check.
+
+    ``keep_alive`` (seconds or a duration like "30m"; -1 keeps models loaded) and runtime ``options``
+    such as ``num_ctx`` are sent with every request. With ``parallel`` set, at most that many requests
+    per model are in flight on each server; the rest queue here instead of in the server. Set it to the
+    server's ``OLLAMA_NUM_PARALLEL``. Unknown option names (see ``RUNTIME_OPTIONS``) raise ``ValueError``.
+    """
+
+    def __init__(self, base_url: str | list[str] = "http://localhost:11434", health_ttl: float = 10.0, keep_alive: float | str | None = None, parallel: int | None = None, **options):
+        super().__init__()
+        _check_options(options)
+        self._hosts = [_Host(url) for url in ([base_url] if isinstance(base_url, str) else base_url)]
+        if not self._hosts:
+            raise ValueError("OllamaProvider needs at least one base_url")
+        self.base_url = self._hosts[0].base_url
+        self.health_ttl = health_ttl
+        self.keep_alive = keep_alive
+        self.parallel = parallel
+        self.options = options
+        self._lock = threading.Lock()
+
+    def _to_check(self) -> list[_Host]:
+        """Servers the caller has to wait for a check of; others due for one are re-checked in the background."""
+        if not OLLAMA_AVAILABLE:
+            raise ImportError(
+                "Ollama is not installed. Install it with: pip install multi-ai-handler[ollama]"
             )
 
+        now = time.monotonic()
+        any_healthy = any(host.healthy for host in self._hosts)
+        to_check = []
+        for host in self._hosts:
+            health = host.health
+            if health is None or (health[1] is not None and not any_healthy):
+                if any_healthy:
+                    host.refresh_in_background(now)
+                else:
+                    to_check.append(host)
+            elif now - health[0] >= self.health_ttl:
+                host.refresh_in_background(health[0])
+        return to_check
+
+    def _raise_unhealthy(self) -> None:
+        if any(host.healthy for host in self._hosts):
+            return
+        if len(self._hosts) == 1:
+            raise OllamaServerError(self._hosts[0].health[1])
+        raise OllamaServerError("No Ollama server is available: " + "; ".join(host.health[1] for host in self._hosts if host.health is not None))
+
+    def _check_server(self):
+        to_check = self._to_check()
+        seen = time.monotonic()
+        if len(to_check) == 1:
+            to_check[0].refresh(seen)
+        elif to_check:
+            with ThreadPoolExecutor(len(to_check)) as pool:
+                list(pool.map(lambda host: host.refresh(seen), to_check))
+        self._raise_unhealthy()
+
+    async def _acheck_server(self):
+        to_check = self._to_check()
+        seen = time.monotonic()
+        await asyncio.gather(*(asyncio.to_thread(host.refresh, seen) for host in to_check))
+        self._raise_unhealthy()
+
+    def _healthy(self) -> list[_Host]:
+        hosts = [host for host in self._hosts if host.healthy]
+        if not hosts:
+            self._raise_unhealthy()
+        return hosts
+
+    def _pick(self, model: str | None) -> _Host:
+        name = _model_name(model) if model else None
+        with self._lock:
+            def rank(host: _Host):
+                gate = host.gates.get(model)
+                full = gate is not None and gate.in_flight >= self.parallel
+                return (full, name not in host.loaded, host.in_flight, random.random())
+
+            host = min(self._healthy(), key=rank)
+            host.in_flight += 1
+        return host
+
+    def _done(self, host: _Host, model: str | None, error: BaseException | None) -> None:
+        with self._lock:
+            host.in_flight -= 1
+        if isinstance(error, _HOST_ERRORS):
+            host.eject(error)
+        elif error is None and model:
+            host.loaded.add(_model_name(model))
+
+    def _observe(self, name: str, model: str | None, value: float) -> None:
+        if self.metrics is not None:
+            self.metrics.observe(name, self.metrics_label or "ollama", model or "", value)
+
+    def _info(self, response, model: str | None) -> StreamInfo:
+        info = _stream_info(response)
+        if info.timing and "load" in info.timing:
+            # Near zero while the model stays loaded; cold starts show up as the long tail.
+            self._observe("model_load_seconds", model, info.timing["load"])
+        return info
+
+    def _gate(self, host: _Host, model: str | None) -> AdaptiveConcurrency | None:
+        if self.parallel is None:
+            return None
+        with self._lock:
+            return host.gate(model, self.parallel)
+
+    @contextlib.contextmanager
+    def _host(self, model: str | None) -> Iterator[_Host]:
+        """Pick a server for the request and hold one of its slots for ``model`` while it runs."""
+        host = self._pick(model)
+        error = None
+        try:
+            gate = self._gate(host, model)
+            if gate is None:
+                yield host
+                return
+            start = time.perf_counter()
+            gate.acquire()
+            self._observe("slot_wait_seconds", model, time.perf_counter() - start)
+            try:
+                yield host
+            finally:
+                gate.release()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._done(host, model, error)
+
+    @contextlib.asynccontextmanager
+    async def _ahost(self, model: str | None) -> AsyncIterator[_Host]:
+        host = self._pick(model)
+        error = None
+        try:
+            gate = self._gate(host, model)
+            if gate is None:
+                yield host
+                return
+            start = time.perf_counter()
+            await gate.aacquire()
+            self._observe("slot_wait_seconds", model, time.perf_counter() - start)
+            try:
+                yield host
+            finally:
+                gate.release()
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._done(host, model, error)
+
+    def _chat_options(self, temperature: float) -> dict:
+        return {**self.options, "temperature": temperature}
+
+    def _payload(self, user_text: str | None, system_prompt: str, file: str | Path | dict | None, messages: list[dict] | None, model: str | None) -> list:
+        with metrics.scope(self.metrics, self.metrics_label, model), metrics.timed("payload_build_seconds"):
+            return generate_ollama_payload(user_text, system_prompt, file, messages=messages)
+
+    async def _apayload(self, user_text: str | None, system_prompt: str, file: str | Path | dict | None, messages: list[dict] | None, model: str | None) -> list:
+        if file is None:
+            return self._payload(user_text, system_prompt, file, messages, model)
+        # Reading the file and extracting its text blocks, so it runs off the event loop.
+        return await asyncio.to_thread(self._payload, user_text, system_prompt, file, messages, model)
+
     def generate(self, system_prompt: str, user_text: str = None, messages: list[dict] = None, file: str | Path | dict | None = None, model: str = None, temperature: float = 0.0, local: bool=False, json_output: bool=False) -> AIResponse:
         self._check_server()
 
-        payload: list = generate_ollama_payload(user_text, system_prompt, file, messages=messages)
+        payload: list = self._payload(user_text, system_prompt, file, messages, model)
 
-        response = ollama.chat(
-            model=model,
-            messages=payload,
-            options={"temperature": temperature},
-        )
+        with self._host(model) as host:
+            response = host.client.chat(
+                model=model,
+                messages=payload,
+                options=self._chat_options(temperature),
+                keep_alive=self.keep_alive,
+            )
 
         response_text = response['message']['content']
 
         # Build history (without system message)
-        new_user_content = build_ollama_user_content(user_text, file)
-        history = list(messages) if messages else []
-        history.append({"role": "user", "content": new_user_content})
-        history.append({"role": "assistant", "content": response_text})
+        history = extend_history(messages, payload[-1], {"role": "assistant", "content": response_text})
 
         content = parse_ai_response(response_text) if json_output else response_text
-        return AIResponse(content=content, history=history)
+        return AIResponse(content=content, history=history, **vars(self._info(response, model)))
+
+    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> StreamResult:
+        return StreamResult(self._stream(system_prompt, user_text, messages, file, model, temperature, local))
 
-    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> Iterator[str]:
+    def _stream(self, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> Iterator[str | StreamInfo]:
         self._check_server()
 
-        payload: list = generate_ollama_payload(user_text, system_prompt, file, messages=messages)
+        payload: list = self._payload(user_text, system_prompt, file, messages, model)
 
-        stream = ollama.chat(
-            model=model,
-            messages=payload,
-            options={"temperature": temperature},
-            stream=True
-        )
+        with self._host(model) as host:
+            stream = host.client.chat(
+                model=model,
+                messages=payload,
+                options=self._chat_options(temperature),
+                keep_alive=self.keep_alive,
+                stream=True
+            )
 
-        for chunk in stream:
-            if chunk['message']['content']:
-                yield chunk['message']['content']
+            for chunk in stream:
+                if chunk['message']['content']:
+                    yield chunk['message']['content']
+                if chunk.get('done'):
+                    yield self._info(chunk, model)
 
     def list_models(self) -> list[str]:
         self._check_server()
 
-        resp = requests.get(f"{self.base_url}/api/tags")
+        host = self._healthy()[0]
+        resp = host.session.get(f"{host.base_url}/api/tags")
         resp.raise_for_status()
         data = resp.json()
 
@@ -96,7 +381,8 @@ class OllamaProvider(AIProvider):
     def get_model_info(self, model: str) -> dict:
         self._check_server()
 
-        resp = requests.post(f"{self.base_url}/api/show", json={"name": model})
+        host = self._healthy()[0]
+        resp = host.session.post(f"{host.base_url}/api/show", json={"name": model})
         resp.raise_for_status()
         data = resp.json()
 
@@ -107,42 +393,111 @@ class OllamaProvider(AIProvider):
             "parameters": data.get("details", {}).get("parameter_size"),
         }
 
-    async def agenerate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
+    def loaded_models(self) -> list[dict]:
+        """Models currently in memory (``/api/ps``), with their size, VRAM use and expiry, and the server (``host``) they're on."""
+        self._check_server()
+
+        models = []
+        for host in self._healthy():
+            resp = host.session.get(f"{host.base_url}/api/ps")
+            resp.raise_for_status()
+            models.extend({**model, "host": host.base_url} for model in resp.json().get("models", []))
+        return models
+
+    def host_status(self) -> list[dict]:
+        """Each server's cached health, requests in flight and loaded models, as used for routing."""
+        return [
+            {"host": host.base_url, "healthy": host.healthy, "error": host.health[1] if host.health else None, "in_flight": host.in_flight, "loaded": sorted(host.loaded)}
+            for host in self._hosts
+        ]
+
+    def preload(self, model: str, keep_alive: float | str | None = None) -> float | None:
+        """Load ``model`` (with the configured options) on every server before the first request needs it; returns the longest load time in seconds."""
+        self._check_server()
+
+        keep_alive = keep_alive if keep_alive is not None else self.keep_alive
+        loads = []
+        for host in self._healthy():
+            response = host.client.chat(model=model, messages=[], options=self.options or None, keep_alive=keep_alive)
+            host.loaded.add(_model_name(model))
+            loads.append((self._info(response, model).timing or {}).get("load"))
+        return max((load for load in loads if load is not None), default=None)
+
+    def unload(self, model: str) -> None:
+        """Free ``model``'s memory on every server now instead of when its keep-alive expires."""
         self._check_server()
 
-        payload: list = generate_ollama_payload(user_text, system_prompt, file, messages=messages)
+        for host in self._healthy():
+            host.client.chat(model=model, messages=[], keep_alive=0)
+            host.loaded.discard(_model_name(model))
 
-        async_client = AsyncClient(host=self.base_url)
-        response = await async_client.chat(
-            model=model,
-            messages=payload,
-            options={"temperature": temperature},
-        )
+    async def apreload(self, model: str, keep_alive: float | str | None = None) -> float | None:
+        await self._acheck_server()
+
+        keep_alive = keep_alive if keep_alive is not None else self.keep_alive
+        hosts = self._healthy()
+        responses = await asyncio.gather(*(host.async_clients.get().chat(model=model, messages=[], options=self.options or None, keep_alive=keep_alive) for host in hosts))
+        for host in hosts:
+            host.loaded.add(_model_name(model))
+        loads = [(self._info(response, model).timing or {}).get("load") for response in responses]
+        return max((load for load in loads if load is not None), default=None)
+
+    async def aunload(self, model: str) -> None:
+        await self._acheck_server()
+
+        hosts = self._healthy()
+        await asyncio.gather(*(host.async_clients.get().chat(model=model, messages=[], keep_alive=0) for host in hosts))
+        for host in hosts:
+            host.loaded.discard(_model_name(model))
+
+    async def agenerate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
+        await self._acheck_server()
+
+        payload: list = await self._apayload(user_text, system_prompt, file, messages, model)
+
+        async with self._ahost(model) as host:
+            response = await host.async_clients.get().chat(
+                model=model,
+                messages=payload,
+                options=self._chat_options(temperature),
+                keep_alive=self.keep_alive,
+            )
 
         response_text = response['message']['content']
 
         # Build history (without system message)
-        new_user_content = build_ollama_user_content(user_text, file)
-        history = list(messages) if messages else []
-        history.append({"role": "user", "content": new_user_content})
-        history.append({"role": "assistant", "content": response_text})
+        history = extend_history(messages, payload[-1], {"role": "assistant", "content": response_text})
 
         content = parse_ai_response(response_text) if json_output else response_text
-        return AIResponse(content=content, history=history)
+        return AIResponse(content=content, history=history, **vars(self._info(response, model)))
 
-    async def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncIterator[str]:
-        self._check_server()
+    def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncStreamResult:
+        return AsyncStreamResult(self._astream(system_prompt, user_text, messages, file, model, temperature, local))
+
+    async def _astream(self, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> AsyncIterator[str | StreamInfo]:
+        await self._acheck_server()
+
+        payload: list = await self._apayload(user_text, system_prompt, file, messages, model)
+
+        async with self._ahost(model) as host:
+            stream = await host.async_clients.get().chat(
+                model=model,
+                messages=payload,
+                options=self._chat_options(temperature),
+                keep_alive=self.keep_alive,
+                stream=True
+            )
 
-        payload: list = generate_ollama_payload(user_text, system_prompt, file, messages=messages)
+            async for chunk in stream:
+                if chunk['message']['content']:
+                    yield chunk['message']['content']
+                if chunk.get('done'):
+                    yield self._info(chunk, model)
 
-        async_client = AsyncClient(host=self.base_url)
-        stream = await async_client.chat(
-            model=model,
-            messages=payload,
-            options={"temperature": temperature},
-            stream=True
-        )
+    def close(self) -> None:
+        for host in self._hosts:
+            host.close()
 
-        async for chunk in stream:
-            if chunk['message']['content']:
-                yield chunk['message']['content']
+    async def aclose(self) -> None:
+        for host in self._hosts:
+            await host.aclose()
@@ -1,67 +1,226 @@
+import asyncio
+import json
+
 from openai import OpenAI, AsyncOpenAI
 
+from multi_ai_handler import metrics
 from multi_ai_handler.ai_provider import AIProvider
-from multi_ai_handler.utils import AIResponse, parse_ai_response
+from multi_ai_handler.batch import ENDED, FAILED, IN_PROGRESS, BatchRequestError
+from multi_ai_handler.retry import status_code
+from multi_ai_handler.utils import AIResponse, AsyncStreamResult, LoopLocal, StreamInfo, StreamResult, Usage, parse_ai_response
 import os
 from pathlib import Path
 from typing import Iterator, AsyncIterator
 
-from multi_ai_handler.generate_payload import generate_openai_payload, build_openai_user_content
+from multi_ai_handler.file_uploads import CachedUpload, FileUploadCache, default_upload_cache, is_missing_file, reupload_missing_files, upload_namespace
+from multi_ai_handler.generate_payload import generate_openai_payload, resolve_openai_payload, extend_history, has_file_refs
+
+
+def _stream_info(completion, finish_reason: str | None, headers) -> StreamInfo:
+    """Usage and server time of a completion, or of the last chunk of a stream (which carries the usage)."""
+    usage = None
+    if completion is not None and completion.usage is not None:
+        details = completion.usage.prompt_tokens_details
+        usage = Usage(input_tokens=completion.usage.prompt_tokens, output_tokens=completion.usage.completion_tokens, cached_tokens=details.cached_tokens if details else None)
+
+    timing = {}
+    processing_ms = headers.get("openai-processing-ms")
+    if processing_ms:
+        timing["total"] = float(processing_ms) / 1000
+    # Cerebras reports a breakdown of its server time in the body.
+    time_info = (completion.model_extra or {}).get("time_info") if completion is not None else None
+    if isinstance(time_info, dict):
+        for name in ("queue", "prompt", "completion", "total"):
+            if isinstance(time_info.get(f"{name}_time"), (int, float)):
+                timing[name] = float(time_info[f"{name}_time"])
+
+    return StreamInfo(usage=usage, finish_reason=finish_reason, timing=timing or None)
+
+
+def _rejects_stream_options(exc: Exception) -> bool:
+    # OpenAI-compatible servers that don't know stream_options answer 400 (or 422) naming the field.
+    return status_code(exc) in (400, 422) and ("stream_options" in str(exc) or "include_usage" in str(exc))
+
 
 class OpenAIProvider(AIProvider):
-    def __init__(self, base_url: str | None=None, api_key: str | None=None, local: bool=False) -> None:
+    def __init__(self, base_url: str | None=None, api_key: str | None=None, local: bool=False, upload_files: bool=False, upload_ttl: float=24 * 3600, upload_cache: FileUploadCache | None=None, max_retries: int=2, stream_usage: bool=True) -> None:
         super().__init__()
         self.local = local
+        # Ask streams for a final usage chunk; turned off automatically for servers that reject stream_options.
+        self.stream_usage = stream_usage
         if api_key is None:
             api_key = os.getenv("OPENAI_API_KEY")
+        # The manager passes max_retries=0 when its retry_policy owns retries.
         self.client = OpenAI(
             base_url=base_url,
             api_key=api_key,
+            max_retries=max_retries,
         )
-        self.async_client = AsyncOpenAI(
+        self._async_clients = LoopLocal(lambda: AsyncOpenAI(
             base_url=base_url,
             api_key=api_key,
+            max_retries=max_retries,
+        ), close=lambda client: client.close())
+
+        # In upload mode PDFs go through the Files API once and payloads reference them by ID.
+        self.upload_files = upload_files
+        self._upload = CachedUpload(
+            upload_cache or default_upload_cache,
+            upload_namespace("openai", str(self.client.base_url), self.client.api_key),
+            upload_ttl,
+            self._upload_file,
         )
 
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        return self._async_clients.get()
+
+    def close(self) -> None:
+        self.client.close()
+        self._async_clients.clear()
+
+    async def aclose(self) -> None:
+        await self._async_clients.aclose()
+        self.client.close()
+
+    def is_retryable(self, exc: Exception) -> bool:
+        # A 429 is also returned for an exhausted quota, which no amount of waiting fixes.
+        if getattr(exc, "code", None) == "insufficient_quota":
+            return False
+        return super().is_retryable(exc)
+
+    def is_missing_upload(self, exc: Exception) -> bool:
+        return is_missing_file(exc)
+
+    def _upload_file(self, filename: str, data: bytes, mime_type: str) -> str:
+        return self.client.files.create(file=(filename, data, mime_type), purpose="user_data").id
+
+    def _payload(self, user_text: str | None, system_prompt: str, file: str | Path | dict | None, local: bool, messages: list[dict] | None, model: str | None = None) -> tuple[list, list]:
+        """Return the payload kept in history (with file references) and the resolved one to send."""
+        with metrics.scope(self.metrics, self.metrics_label, model), metrics.timed("payload_build_seconds"):
+            payload = generate_openai_payload(user_text, system_prompt, file, local=local, messages=messages, upload=self._upload if self.upload_files else None)
+            return payload, resolve_openai_payload(payload)
+
+    async def _apayload(self, user_text: str | None, system_prompt: str, file: str | Path | dict | None, local: bool, messages: list[dict] | None, model: str | None = None) -> tuple[list, list]:
+        if file is None and not has_file_refs(messages):
+            return self._payload(user_text, system_prompt, file, local, messages, model)
+        # Reading, encoding, extracting and uploading files blocks, so it runs off the event loop.
+        return await asyncio.to_thread(self._payload, user_text, system_prompt, file, local, messages, model)
+
+    @reupload_missing_files
     def generate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model:str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
         if self.local:
             local = True
 
-        payload: list = generate_openai_payload(user_text, system_prompt, file, local=local, messages=messages)
+        payload, request_payload = self._payload(user_text, system_prompt, file, local, messages, model)
 
-        completion = self.client.chat.completions.create(
+        # The raw response gives access to the server timing header.
+        raw = self.client.chat.completions.with_raw_response.create(
             model=model,
-            messages=payload,
+            messages=request_payload,
             temperature=temperature
         )
+        completion = raw.parse()
 
         response_text = completion.choices[0].message.content
 
         # Build history (without system message)
-        new_user_content = build_openai_user_content(user_text, file, local)
-        history = list(messages) if messages else []
-        history.append({"role": "user", "content": new_user_content})
-        history.append({"role": "assistant", "content": response_text})
+        history = extend_history(messages, payload[-1], {"role": "assistant", "content": response_text})
 
         content = parse_ai_response(response_text) if json_output else response_text
-        return AIResponse(content=content, history=history)
+        return AIResponse(content=content, history=history, **vars(_stream_info(completion, completion.choices[0].finish_reason, raw.headers)))
+
+    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> StreamResult:
+        return StreamResult(self._stream(system_prompt, user_text, messages, file, model, temperature, local))
+
+    def _create_stream(self, **params):
+        if self.stream_usage:
+            try:
+                return self.client.chat.completions.with_raw_response.create(**params, stream=True, stream_options={"include_usage": True})
+            except Exception as e:
+                if not _rejects_stream_options(e):
+                    raise
+                self.stream_usage = False
+        return self.client.chat.completions.with_raw_response.create(**params, stream=True)
+
+    async def _acreate_stream(self, **params):
+        if self.stream_usage:
+            try:
+                return await self.async_client.chat.completions.with_raw_response.create(**params, stream=True, stream_options={"include_usage": True})
+            except Exception as e:
+                if not _rejects_stream_options(e):
+                    raise
+                self.stream_usage = False
+        return await self.async_client.chat.completions.with_raw_response.create(**params, stream=True)
 
-    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> Iterator[str]:
+    @reupload_missing_files
+    def _stream(self, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> Iterator[str | StreamInfo]:
         if self.local:
             local = True
 
-        payload: list = generate_openai_payload(user_text, system_prompt, file, local=local, messages=messages)
+        _, request_payload = self._payload(user_text, system_prompt, file, local, messages, model)
 
-        stream = self.client.chat.completions.create(
-            model=model,
-            messages=payload,
-            temperature=temperature,
-            stream=True
-        )
+        raw = self._create_stream(model=model, messages=request_payload, temperature=temperature)
+
+        finish_reason = None
+        last = None
+        # With include_usage the usage arrives in a final chunk without choices.
+        for chunk in raw.parse():
+            if chunk.choices:
+                choice = chunk.choices[0]
+                if choice.delta.content is not None:
+                    yield choice.delta.content
+                finish_reason = choice.finish_reason or finish_reason
+            last = chunk
+        yield _stream_info(last, finish_reason, raw.headers)
+
+    def submit_batch(self, requests: list[dict], model: str) -> str:
+        lines = []
+        for request in requests:
+            _, request_payload = self._payload(request.get("user_text"), request.get("system_prompt"), request.get("file"), self.local or request.get("local", False), request.get("messages"), model)
+            lines.append(json.dumps({
+                "custom_id": request["custom_id"],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": request_payload,
+                    "temperature": request.get("temperature", 0.2),
+                },
+            }))
 
-        for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
-                yield chunk.choices[0].delta.content
+        batch_file = self.client.files.create(file=("batch.jsonl", "\n".join(lines).encode(), "application/jsonl"), purpose="batch")
+        batch = self.client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        return batch.id
+
+    def batch_status(self, batch_id: str) -> str:
+        status = self.client.batches.retrieve(batch_id).status
+        if status == "failed":
+            return FAILED
+        # Expired and cancelled batches still return results for the requests that completed.
+        if status in ("completed", "expired", "cancelled"):
+            return ENDED
+        return IN_PROGRESS
+
+    def batch_results(self, batch_id: str) -> dict[str, str | Exception]:
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if entry.get("error") or response.get("status_code") != 200:
+                    results[entry["custom_id"]] = BatchRequestError(str(entry.get("error") or response.get("body")))
+                else:
+                    results[entry["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+
+        return results
 
     def list_models(self) -> list[str]:
         response = self.client.models.list()
@@ -75,42 +234,49 @@ class OpenAIProvider(AIProvider):
             "owned_by": response.owned_by,
         }
 
+    @reupload_missing_files
     async def agenerate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
         if self.local:
             local = True
 
-        payload: list = generate_openai_payload(user_text, system_prompt, file, local=local, messages=messages)
+        payload, request_payload = await self._apayload(user_text, system_prompt, file, local, messages, model)
 
-        completion = await self.async_client.chat.completions.create(
+        # The raw response gives access to the server timing header.
+        raw = await self.async_client.chat.completions.with_raw_response.create(
             model=model,
-            messages=payload,
+            messages=request_payload,
             temperature=temperature
         )
+        completion = raw.parse()
 
         response_text = completion.choices[0].message.content
 
         # Build history (without system message)
-        new_user_content = build_openai_user_content(user_text, file, local)
-        history = list(messages) if messages else []
-        history.append({"role": "user", "content": new_user_content})
-        history.append({"role": "assistant", "content": response_text})
+        history = extend_history(messages, payload[-1], {"role": "assistant", "content": response_text})
 
         content = parse_ai_response(response_text) if json_output else response_text
-        return AIResponse(content=content, history=history)
+        return AIResponse(content=content, history=history, **vars(_stream_info(completion, completion.choices[0].finish_reason, raw.headers)))
+
+    def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncStreamResult:
+        return AsyncStreamResult(self._astream(system_prompt, user_text, messages, file, model, temperature, local))
 
-    async def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncIterator[str]:
+    @reupload_missing_files
+    async def _astream(self, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> AsyncIterator[str | StreamInfo]:
         if self.local:
             local = True
 
-        payload: list = generate_openai_payload(user_text, system_prompt, file, local=local, messages=messages)
+        _, request_payload = await self._apayload(user_text, system_prompt, file, local, messages, model)
 
-        stream = await self.async_client.chat.completions.create(
-            model=model,
-            messages=payload,
-            temperature=temperature,
-            stream=True
-        )
+        raw = await self._acreate_stream(model=model, messages=request_payload, temperature=temperature)
 
-        async for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
-                yield chunk.choices[0].delta.content
\ No newline at end of file
+        finish_reason = None
+        last = None
+        # With include_usage the usage arrives in a final chunk without choices.
+        async for chunk in raw.parse():
+            if chunk.choices:
+                choice = chunk.choices[0]
+                if choice.delta.content is not None:
+                    yield choice.delta.content
+                finish_reason = choice.finish_reason or finish_reason
+            last = chunk
+        yield _stream_info(last, finish_reason, raw.headers)
\ No newline at end of file
@@ -1,9 +1,19 @@
+from multi_ai_handler.file_uploads import FileUploadCache
 from multi_ai_handler.providers.openai import OpenAIProvider
 import os
 
 class OpenrouterProvider(OpenAIProvider):
-    def __init__(self):
+    def __init__(self, base_url: str | None="https://openrouter.ai/api/v1", api_key: str | None=None, local: bool=False, upload_files: bool=False, upload_ttl: float=24 * 3600, upload_cache: FileUploadCache | None=None, max_retries: int=2, stream_usage: bool=True) -> None:
         super().__init__(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv("OPENROUTER_API_KEY")
-        )
\ No newline at end of file
+            base_url=base_url,
+            api_key=api_key if api_key is not None else os.getenv("OPENROUTER_API_KEY"),
+            local=local,
+            upload_files=upload_files,
+            upload_ttl=upload_ttl,
+            upload_cache=upload_cache,
+            max_retries=max_retries,
+            stream_usage=stream_usage,
+        )
+
+    def submit_batch(self, requests: list[dict], model: str) -> str:
+        raise NotImplementedError("OpenRouter does not support batch requests")
@@ -0,0 +1,260 @@
+import asyncio
+import importlib
+import inspect
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import asdict
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+from multi_ai_handler.ai_provider import AIProvider
+from multi_ai_handler.response_cache import _file_digest, request_key
+from multi_ai_handler.utils import AIResponse, AsyncStreamResult, StreamInfo, StreamResult, Usage
+
+
+class CassetteMissError(RuntimeError):
+    pass
+
+
+class Cassette:
+    """Recorded responses in a single SQLite file, indexed by request hash.
+
+    Each entry is a zlib-compressed JSON document read on demand, so replaying never loads the
+    whole cassette; opened read-only it can be shared by any number of replaying processes.
+    """
+
+    def __init__(self, path: str | Path, readonly: bool = False):
+        self.path = Path(path).expanduser()
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False, isolation_level=None)
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, kind TEXT NOT NULL, model TEXT, recorded REAL NOT NULL, data BLOB NOT NULL)"
+        )
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row is not None else None
+
+    def put(self, key: str, kind: str, model: str | None, entry: dict) -> None:
+        data = zlib.compress(json.dumps(entry, separators=(",", ":"), default=str).encode())
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, model, recorded, data) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, model, time.time(), data),
+            )
+
+    def models(self) -> list[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT DISTINCT model FROM entries WHERE model IS NOT NULL ORDER BY model").fetchall()
+        return [row[0] for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def _key(kind: str, system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str | None, temperature: float, local: bool, json_output: bool = False) -> str:
+    # The call kind stands in for the provider name, so a cassette replays under whatever name it is registered as.
+    return request_key(kind, {}, model, system_prompt, user_text, messages, file, temperature, json_output, local)
+
+
+def _request(system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str | None, temperature: float, local: bool, json_output: bool = False) -> dict:
+    """What was sent, kept in the entry for inspecting a cassette."""
+    return {"system_prompt": system_prompt, "user_text": user_text, "messages": messages, "file": _file_digest(file), "model": model, "temperature": temperature, "local": local, "json_output": json_output}
+
+
+def _info(entry: dict) -> StreamInfo:
+    usage = entry.get("usage")
+    return StreamInfo(usage=Usage(**usage) if usage else None, finish_reason=entry.get("finish_reason"), timing=entry.get("timing"))
+
+
+def _record_info(entry: dict, info: StreamInfo | AIResponse | None) -> dict:
+    if info is not None:
+        entry.update(usage=asdict(info.usage) if info.usage else None, finish_reason=info.finish_reason, timing=info.timing)
+    return entry
+
+
+class ReplayProvider(AIProvider):
+    """Records a real provider's responses to a cassette, or serves them back from one.
+
+    In ``mode="record"`` every call goes to ``upstream`` (a provider class or "module:Class" path,
+    constructed with the remaining config) and its response, chunks and their timing are stored under
+    a hash of the request. In ``mode="replay"`` responses come from the cassette only, as fast as
+    possible or, with ``realtime=True``, at the pace they were recorded; an unrecorded request raises
+    ``CassetteMissError``. ``max_retries`` is passed on to an upstream that takes it, so a manager's
+    retry policy turns off the recorded SDK's own retries.
+    """
+
+    def __init__(self, cassette: str | Path, mode: str = "replay", upstream: type[AIProvider] | str | None = None, realtime: bool = False, max_retries: int | None = None, **upstream_config):
+        super().__init__()
+        if mode not in ("record", "replay"):
+            raise ValueError(f"mode must be 'record' or 'replay', got {mode!r}")
+        self.mode = mode
+        self.realtime = realtime
+        self.upstream: AIProvider | None = None
+        if mode == "record":
+            if upstream is None:
+                raise ValueError("Recording needs the provider to record")
+            if isinstance(upstream, str):
+                module_name, _, class_name = upstream.partition(":")
+                upstream = getattr(importlib.import_module(module_name), class_name)
+            if max_retries is not None and "max_retries" in inspect.signature(upstream).parameters:
+                upstream_config["max_retries"] = max_retries
+            self.upstream = upstream(**upstream_config)
+        self.cassette = Cassette(cassette, readonly=mode == "replay")
+
+    def _recorded(self) -> AIProvider:
+        # Payload and file timings of the recorded provider land in the same registry.
+        self.upstream.metrics = self.metrics
+        self.upstream.metrics_label = self.metrics_label
+        return self.upstream
+
+    def _entry(self, key: str) -> dict:
+        entry = self.cassette.get(key)
+        if entry is None:
+            raise CassetteMissError(f"No recording for this request in {self.cassette.path}")
+        return entry
+
+    @staticmethod
+    def _response(entry: dict) -> AIResponse:
+        return AIResponse(content=entry["content"], history=entry.get("history"), **vars(_info(entry)))
+
+    def generate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
+        key = _key("generate", system_prompt, user_text, messages, file, model, temperature, local, json_output)
+        if self.mode == "replay":
+            entry = self._entry(key)
+            if self.realtime:
+                time.sleep(entry["latency"])
+            return self._response(entry)
+
+        start = time.perf_counter()
+        response = self._recorded().generate(system_prompt, user_text=user_text, messages=messages, file=file, model=model, temperature=temperature, local=local, json_output=json_output)
+        entry = {"request": _request(system_prompt, user_text, messages, file, model, temperature, local, json_output), "content": response.content, "history": response.history, "latency": time.perf_counter() - start}
+        self.cassette.put(key, "generate", model, _record_info(entry, response))
+        return response
+
+    async def agenerate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
+        key = _key("generate", system_prompt, user_text, messages, file, model, temperature, local, json_output)
+        if self.mode == "replay":
+            entry = self._entry(key)
+            if self.realtime:
+                await asyncio.sleep(entry["latency"])
+            return self._response(entry)
+
+        start = time.perf_counter()
+        response = await self._recorded().agenerate(system_prompt, user_text=user_text, messages=messages, file=file, model=model, temperature=temperature, local=local, json_output=json_output)
+        entry = {"request": _request(system_prompt, user_text, messages, file, model, temperature, local, json_output), "content": response.content, "history": response.history, "latency": time.perf_counter() - start}
+        self.cassette.put(key, "generate", model, _record_info(entry, response))
+        return response
+
+    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> StreamResult:
+        key = _key("stream", system_prompt, user_text, messages, file, model, temperature, local)
+        if self.mode == "replay":
+            # Look the entry up now so a miss raises at the call, like a failed request would.
+            return StreamResult(self._replay(self._entry(key)))
+        request = _request(system_prompt, user_text, messages, file, model, temperature, local)
+        return StreamResult(self._record(key, request, system_prompt, user_text, messages, file, model, temperature, local))
+
+    def _replay(self, entry: dict) -> Iterator[str | StreamInfo]:
+        start = time.monotonic()
+        for offset, chunk in entry["chunks"]:
+            if self.realtime:
+                delay = start + offset - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield chunk
+        yield _info(entry)
+
+    def _record(self, key: str, request: dict, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> Iterator[str | StreamInfo]:
+        start = time.perf_counter()
+        result = self._recorded().stream(system_prompt, user_text=user_text, messages=messages, file=file, model=model, temperature=temperature, local=local)
+        chunks = []
+        info = None
+        for chunk in result:
+            if not isinstance(chunk, str):
+                info = chunk
+                continue
+            chunks.append((round(time.perf_counter() - start, 6), chunk))
+            yield chunk
+
+        info = getattr(result, "info", None) or info
+        # Only complete streams are recorded; an abandoned or failed one never gets here.
+        self.cassette.put(key, "stream", model, _record_info({"request": request, "chunks": chunks}, info))
+        if info is not None:
+            yield info
+
+    def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncStreamResult:
+        key = _key("stream", system_prompt, user_text, messages, file, model, temperature, local)
+        if self.mode == "replay":
+            return AsyncStreamResult(self._areplay(self._entry(key)))
+        request = _request(system_prompt, user_text, messages, file, model, temperature, local)
+        return AsyncStreamResult(self._arecord(key, request, system_prompt, user_text, messages, file, model, temperature, local))
+
+    async def _areplay(self, entry: dict) -> AsyncIterator[str | StreamInfo]:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for offset, chunk in entry["chunks"]:
+            if self.realtime:
+                delay = start + offset - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
+        yield _info(entry)
+
+    async def _arecord(self, key: str, request: dict, system_prompt: str, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, model: str, temperature: float, local: bool) -> AsyncIterator[str | StreamInfo]:
+        start = time.perf_counter()
+        result = self._recorded().astream(system_prompt, user_text=user_text, messages=messages, file=file, model=model, temperature=temperature, local=local)
+        chunks = []
+        info = None
+        async for chunk in result:
+            if not isinstance(chunk, str):
+                info = chunk
+                continue
+            chunks.append((round(time.perf_counter() - start, 6), chunk))
+            yield chunk
+
+        info = getattr(result, "info", None) or info
+        self.cassette.put(key, "stream", model, _record_info({"request": request, "chunks": chunks}, info))
+        if info is not None:
+            yield info
+
+    def list_models(self) -> list[str]:
+        if self.mode == "record":
+            return self._recorded().list_models()
+        return self.cassette.models()
+
+    def get_model_info(self, model: str) -> dict:
+        if self.mode == "record":
+            return self._recorded().get_model_info(model)
+        return {"name": model}
+
+    def is_retryable(self, exc: Exception) -> bool:
+        if isinstance(exc, CassetteMissError):
+            return False
+        if self.upstream is not None:
+            return self.upstream.is_retryable(exc)
+        return super().is_retryable(exc)
+
+    def close(self) -> None:
+        if self.upstream is not None:
+            self.upstream.close()
+        self.cassette.close()
+
+    async def aclose(self) -> None:
+        if self.upstream is not None:
+            await self.upstream.aclose()
+        self.cassette.close()
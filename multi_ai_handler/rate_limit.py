@@ -0,0 +1,311 @@
+import asyncio
+import contextlib
+import mimetypes
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterator
+
+from multi_ai_handler.retry import status_code
+
+# Statuses that mean "you are sending too much", as opposed to a failed request.
+THROTTLE_STATUS_CODES = frozenset({429, 529})
+
+
+def is_throttle(exc: BaseException) -> bool:
+    return isinstance(exc, Exception) and status_code(exc) in THROTTLE_STATUS_CODES
+
+
+# Providers bill an image by its resolution, around 1.6k tokens at their usual size caps, and a
+# document page at roughly 1.5-3k tokens, which is some 50-100 KB of a typical PDF.
+_IMAGE_TOKENS = 1600
+_DOCUMENT_BYTES_PER_TOKEN = 32
+
+
+def _file_tokens(filename: str | None, size: int) -> int:
+    mime_type, _ = mimetypes.guess_type(filename or "")
+    if mime_type and mime_type.startswith("image/"):
+        return _IMAGE_TOKENS
+    if mime_type and mime_type.startswith("text/"):
+        return size // 4
+    return size // _DOCUMENT_BYTES_PER_TOKEN
+
+
+def _attachment_tokens(file: str | Path | dict | None) -> int:
+    if file is None:
+        return 0
+    if isinstance(file, dict):
+        return _file_tokens(file.get("filename"), len(file.get("encoded_data") or "") * 3 // 4)
+    try:
+        return _file_tokens(Path(file).name, Path(file).stat().st_size)
+    except OSError:
+        # The provider reports the missing file when it builds the payload.
+        return 0
+
+
+def estimate_tokens(system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None = None) -> int:
+    """Rough prompt size of a request: ~4 characters per token of text, plus an estimate for attached files."""
+    chars = len(system_prompt or "") + len(user_text or "")
+    tokens = _attachment_tokens(file)
+    for message in messages or []:
+        content = message.get("content", message.get("parts"))
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for block in content:
+                if isinstance(block, str):
+                    chars += len(block)
+                elif isinstance(block, dict) and isinstance(block.get("text"), str):
+                    chars += len(block["text"])
+                elif isinstance(block, dict) and "file_ref" in block:
+                    # Files from earlier turns are sent again with every request.
+                    tokens += _file_tokens(block["file_ref"]["filename"], block["file_ref"]["size"])
+    return tokens + chars // 4 + 1
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at ``per_minute`` tokens per minute.
+
+    ``reserve`` always succeeds and returns how long the caller must wait; the balance may go
+    negative, so waiting callers are served in order instead of racing for refills.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # A request larger than the bucket could never fit, so it only has to wait for a full one.
+            self._tokens -= min(amount, self.capacity)
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Give back ``amount`` reserved tokens (or take more if negative) once actual usage is known."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit tuned by AIMD: +``increase`` per window of successes, ×``backoff`` on throttling.
+
+    Slots can be waited for from threads (``acquire``) and from any event loop (``aacquire``).
+    """
+
+    def __init__(self, initial: int = 8, min_limit: int = 1, max_limit: int = 256, increase: float = 1.0, backoff: float = 0.5, adaptive: bool = True):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.backoff = backoff
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self._waiters: deque[Callable[[], None]] = deque()
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return True
+        return False
+
+    def _wake(self) -> None:
+        # Hand free slots directly to waiters in arrival order.
+        while self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self._waiters.popleft()()
+
+    def acquire(self) -> None:
+        with self._lock:
+            if self._try_acquire():
+                return
+            event = threading.Event()
+            self._waiters.append(event.set)
+        event.wait()
+
+    async def aacquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._try_acquire():
+                return
+            future = loop.create_future()
+
+            def wake() -> None:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+            self._waiters.append(wake)
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            with self._lock:
+                if wake in self._waiters:
+                    self._waiters.remove(wake)
+                    raise
+            # The slot was handed over just before the cancellation.
+            self.release()
+            raise
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def on_success(self) -> None:
+        if not self.adaptive:
+            return
+        with self._lock:
+            # Only grow while the limit is actually the bottleneck.
+            if self.in_flight + 1 >= int(self.limit):
+                self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+                self._wake()
+
+    def on_throttle(self, started: float) -> None:
+        """Record throttling of a request dispatched at ``started`` (``time.monotonic()``)."""
+        if not self.adaptive:
+            return
+        with self._lock:
+            # Requests sent before the last cut saw the old limit; their 429s are the same congestion signal.
+            if started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = time.monotonic()
+
+
+@dataclass
+class RateLimit:
+    """Limits for one provider or (provider, model).
+
+    ``rpm``/``tpm`` are requests and estimated tokens per minute (None = unlimited), with bursts of
+    up to ``burst`` seconds' worth. ``concurrency`` is the starting in-flight limit, adjusted
+    between ``min_concurrency`` and ``max_concurrency`` when ``adaptive``. ``output_tokens`` is
+    the completion size assumed when estimating a request's tokens.
+    """
+    rpm: float | None = None
+    tpm: float | None = None
+    concurrency: int = 8
+    min_concurrency: int = 1
+    max_concurrency: int = 256
+    adaptive: bool = True
+    burst: float = 10.0
+    output_tokens: int = 512
+
+
+class _Limiter:
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self.requests = TokenBucket(limit.rpm, limit.rpm * limit.burst / 60) if limit.rpm else None
+        self.tokens = TokenBucket(limit.tpm, limit.tpm * limit.burst / 60) if limit.tpm else None
+        self.concurrency = AdaptiveConcurrency(limit.concurrency, limit.min_concurrency, limit.max_concurrency, adaptive=limit.adaptive)
+
+    def delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self.requests is not None:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens is not None:
+            delay = max(delay, self.tokens.reserve(tokens + self.limit.output_tokens))
+        return delay
+
+    def finish(self, started: float, exc: BaseException | None) -> None:
+        self.concurrency.release()
+        if exc is None:
+            self.concurrency.on_success()
+        elif is_throttle(exc):
+            self.concurrency.on_throttle(started)
+
+
+class RateLimiter:
+    """Client-side RPM/TPM token buckets plus an adaptive concurrency limit per provider and model.
+
+    Limits are looked up for ``(provider, model)``, then ``provider``, then ``default``; each model
+    gets its own buckets and concurrency state.
+    """
+
+    def __init__(self, limits: dict[str | tuple[str, str], RateLimit] | None = None, default: RateLimit | None = None):
+        self.limits = dict(limits or {})
+        self.default = default
+        self._limiters: dict[tuple[str, str], _Limiter | None] = {}
+        self._lock = threading.Lock()
+
+    def set_limit(self, provider: str, limit: RateLimit, model: str | None = None) -> None:
+        with self._lock:
+            self.limits[(provider, model) if model else provider] = limit
+            for key in [key for key in self._limiters if key[0] == provider and (model is None or key[1] == model)]:
+                del self._limiters[key]
+
+    def limiter(self, provider: str, model: str) -> _Limiter | None:
+        key = (provider, model)
+        with self._lock:
+            if key not in self._limiters:
+                limit = self.limits.get(key) or self.limits.get(provider) or self.default
+                self._limiters[key] = _Limiter(limit) if limit else None
+            return self._limiters[key]
+
+    def concurrency(self, provider: str, model: str) -> float | None:
+        """Current adaptive concurrency limit for ``provider``/``model`` (None if unlimited)."""
+        limiter = self.limiter(provider, model)
+        return limiter.concurrency.limit if limiter else None
+
+    def settle(self, provider: str, model: str, tokens: int, used: int) -> None:
+        """Correct the TPM reservation made for ``tokens`` estimated prompt tokens with the ``used`` tokens the provider reported."""
+        limiter = self.limiter(provider, model)
+        if limiter is None or limiter.tokens is None:
+            return
+        reserved = min(tokens + limiter.limit.output_tokens, limiter.tokens.capacity)
+        limiter.tokens.refund(reserved - used)
+
+    @contextlib.contextmanager
+    def acquire(self, provider: str, model: str, tokens: int = 0) -> Iterator[None]:
+        limiter = self.limiter(provider, model)
+        if limiter is None:
+            yield
+            return
+
+        limiter.concurrency.acquire()
+        try:
+            delay = limiter.delay(tokens)
+            if delay:
+                time.sleep(delay)
+        except BaseException:
+            limiter.concurrency.release()
+            raise
+
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            limiter.finish(started, e)
+            raise
+        limiter.finish(started, None)
+
+    @contextlib.asynccontextmanager
+    async def aacquire(self, provider: str, model: str, tokens: int = 0) -> AsyncIterator[None]:
+        limiter = self.limiter(provider, model)
+        if limiter is None:
+            yield
+            return
+
+        await limiter.concurrency.aacquire()
+        try:
+            delay = limiter.delay(tokens)
+            if delay:
+                await asyncio.sleep(delay)
+        except BaseException:
+            limiter.concurrency.release()
+            raise
+
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            limiter.finish(started, e)
+            raise
+        limiter.finish(started, None)
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any, Iterator
+
+from multi_ai_handler.cache import CacheBackend, LRUCache, TieredCache, hash_key
+
+
+def _file_digest(file: str | Path | dict | None) -> str | None:
+    if file is None:
+        return None
+    if isinstance(file, dict):
+        return hash_key(file.get("filename") or "", file.get("encoded_data") or "")
+
+    with open(file, "rb") as f:
+        return f"{Path(file).name}:{hashlib.file_digest(f, 'sha256').hexdigest()}"
+
+
+def request_key(provider: str, config: dict, model: str, system_prompt: str | None, user_text: str | None, messages: list[dict] | None, file: str | Path | dict | None, temperature: float, json_output: bool, local: bool) -> str:
+    """Canonical hash of everything that determines a provider's payload and response.
+
+    Attached files are keyed by content, so the same document under another path still hits.
+    """
+    request = {
+        "provider": provider,
+        "config": sorted((name, repr(value)) for name, value in config.items()),
+        "model": model,
+        "system_prompt": system_prompt,
+        "user_text": user_text,
+        "messages": messages,
+        "file": _file_digest(file),
+        "temperature": temperature,
+        "json_output": json_output,
+        "local": local,
+    }
+    return hash_key(json.dumps(request, sort_keys=True, default=str))
+
+
+def replay_chunks(text: str, chunk_size: int = 64) -> Iterator[str]:
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+class ResponseCache:
+    """Opt-in cache of responses keyed by ``request_key``.
+
+    Entries live in an in-memory LRU and, optionally, a persistent ``DirectoryCache`` or
+    ``SQLiteCache`` that several worker processes can share. ``ttl`` (seconds) applies to both tiers.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float | None = None, backend: CacheBackend | None = None, chunk_size: int = 64):
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self._cache = TieredCache(LRUCache(max_entries=max_entries), backend)
+
+    def get(self, key: str) -> dict[str, Any] | None:
+        raw = self._cache.get(key)
+        if raw is None:
+            return None
+
+        entry = json.loads(raw)
+        if entry["expires_at"] is not None and entry["expires_at"] <= time.time():
+            return None
+        return entry
+
+    def set(self, key: str, content: str | dict, history: list[dict] | None = None) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        self._cache.set(key, json.dumps({"content": content, "history": history, "expires_at": expires_at}, default=str))
+
+    def replay(self, key: str) -> Iterator[str] | None:
+        """Chunked iterator over a cached text response, or None on a miss."""
+        entry = self.get(key)
+        if entry is None or not isinstance(entry["content"], str):
+            return None
+        return replay_chunks(entry["content"], self.chunk_size)
+
+    def clear(self) -> None:
+        self._cache.clear()
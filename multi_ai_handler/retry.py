@@ -0,0 +1,196 @@
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+# 529 is Anthropic's "overloaded"; 408/409/425 are transient request conflicts and timeouts.
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 529})
+
+# Transport failures raised by the SDKs (matched by class name so no SDK has to be imported).
+RETRYABLE_ERROR_NAMES = frozenset({
+    "APIConnectionError",
+    "APITimeoutError",
+    "TransportError",
+    "TimeoutException",
+    "NetworkError",
+    "RemoteProtocolError",
+    "ServerDisconnectedError",
+    "ClientConnectionError",
+})
+
+
+def status_code(exc: Exception) -> int | None:
+    """HTTP status of an SDK error (``status_code`` for Anthropic/OpenAI/Ollama, ``code`` for Google)."""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def retry_after(exc: Exception) -> float | None:
+    """Seconds the server asked us to wait, from ``retry-after-ms`` or ``Retry-After`` headers."""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return float(value) / 1000
+
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        if value.strip().isdigit():
+            return float(value)
+
+        date = email.utils.parsedate_to_datetime(value)
+        return max(0.0, date.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    code = status_code(exc)
+    if code is not None:
+        return code in RETRYABLE_STATUS_CODES
+
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+class RetryBudget:
+    """Caps retries to a fraction of recent requests so a struggling backend isn't hit with a retry storm.
+
+    Every request deposits ``ratio`` tokens (up to ``max_tokens``) and every retry spends one.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = min_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, ``Retry-After`` support and a shared retry budget.
+
+    ``classify`` decides whether an error is worth retrying; the manager passes the provider's
+    ``is_retryable`` so each provider can refine the generic classification. Streams are only
+    retried if they fail before yielding their first chunk. ``on_retry`` is called with each error that is retried.
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5, max_delay: float = 30.0, jitter: bool = True, budget: RetryBudget | None = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budget = budget if budget is not None else RetryBudget()
+
+    def delay(self, attempt: int, exc: Exception) -> float | None:
+        """Seconds to wait before retry number ``attempt + 1``, or None if the error should be raised."""
+        server_delay = retry_after(exc)
+        if server_delay is not None:
+            return server_delay if server_delay <= self.max_delay else None
+
+        backoff = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+    def _next_delay(self, attempt: int, exc: Exception, classify: Callable[[Exception], bool], on_retry: Callable[[Exception], None] | None) -> float | None:
+        if attempt + 1 >= self.max_attempts or not classify(exc):
+            return None
+        delay = self.delay(attempt, exc)
+        if delay is None or not self.budget.withdraw():
+            return None
+        if on_retry is not None:
+            on_retry(exc)
+        return delay
+
+    def call(self, fn: Callable[[], T], classify: Callable[[Exception], bool] = is_retryable, on_retry: Callable[[Exception], None] | None = None) -> T:
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, classify, on_retry)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+    async def acall(self, fn: Callable[[], Awaitable[T]], classify: Callable[[Exception], bool] = is_retryable, on_retry: Callable[[Exception], None] | None = None) -> T:
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            try:
+                return await fn()
+            except Exception as e:
+                delay = self._next_delay(attempt, e, classify, on_retry)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def stream(self, fn: Callable[[], Iterator[str]], classify: Callable[[Exception], bool] = is_retryable, on_retry: Callable[[Exception], None] | None = None) -> Iterator[str]:
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            iterator = iter(fn())
+            try:
+                first = next(iterator)
+            except StopIteration:
+                return
+            except Exception as e:
+                delay = self._next_delay(attempt, e, classify, on_retry)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            yield first
+            yield from iterator
+            return
+
+    async def astream(self, fn: Callable[[], AsyncIterator[str]], classify: Callable[[Exception], bool] = is_retryable, on_retry: Callable[[Exception], None] | None = None) -> AsyncIterator[str]:
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            iterator = aiter(fn())
+            try:
+                first = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            except Exception as e:
+                delay = self._next_delay(attempt, e, classify, on_retry)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+
+            try:
+                yield first
+                async for chunk in iterator:
+                    yield chunk
+            finally:
+                await iterator.aclose()
+            return
@@ -0,0 +1,118 @@
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, replace
+
+
+@dataclass
+class RouteStats:
+    """Live EWMA measurements for one (provider, model)."""
+    ttft: float | None = None
+    throughput: float | None = None
+    output_chars: float | None = None
+    error_rate: float = 0.0
+    in_flight: int = 0
+    requests: int = 0
+
+    def expected_latency(self) -> float | None:
+        """Estimated seconds to a complete response: time to first token plus generation time."""
+        if self.throughput is None:
+            return self.ttft
+        return (self.ttft or 0.0) + self.output_chars / self.throughput
+
+
+@dataclass
+class RouteDecision:
+    pool: str
+    ranking: list[tuple[str, str, float]]
+    explored: bool = False
+    time: float = field(default_factory=time.time)
+
+    @property
+    def chosen(self) -> tuple[str, str]:
+        provider, model, _ = self.ranking[0]
+        return provider, model
+
+
+class Router:
+    """Ranks a pool of equivalent (provider, model) candidates per request.
+
+    Each candidate's cost is its expected latency (EWMA time to first token plus output size over
+    EWMA throughput), multiplied by its in-flight requests + 1 so load spreads across the pool, and
+    divided by its EWMA success rate. Untried candidates are ranked first, ones without successful
+    measurements are costed at the pool median, and with probability ``explore`` a random candidate
+    is tried first so stale measurements keep getting refreshed. The last ``max_decisions``
+    rankings are kept in ``decisions``.
+    """
+
+    def __init__(self, pools: dict[str, list[tuple[str, str]]] | None = None, alpha: float = 0.3, explore: float = 0.05, max_decisions: int = 200):
+        self.pools = {name: list(candidates) for name, candidates in (pools or {}).items()}
+        self.alpha = alpha
+        self.explore = explore
+        self.decisions: deque[RouteDecision] = deque(maxlen=max_decisions)
+        self._stats: dict[tuple[str, str], RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def add_pool(self, name: str, candidates: list[tuple[str, str]]) -> None:
+        self.pools[name] = list(candidates)
+
+    def _ewma(self, current: float | None, sample: float) -> float:
+        return sample if current is None else current + self.alpha * (sample - current)
+
+    def _get(self, provider: str, model: str) -> RouteStats:
+        stats = self._stats.get((provider, model))
+        if stats is None:
+            stats = self._stats[(provider, model)] = RouteStats()
+        return stats
+
+    def route(self, pool: str) -> list[tuple[str, str]]:
+        """Candidates of ``pool`` ordered from cheapest to most expensive; the rest serve as fallbacks."""
+        candidates = self.pools[pool]
+        with self._lock:
+            stats = [self._get(provider, model) for provider, model in candidates]
+            known = [latency for latency in (s.expected_latency() for s in stats) if latency is not None]
+            default = statistics.median(known) if known else 1.0
+
+            costs = []
+            for s in stats:
+                latency = s.expected_latency()
+                if latency is None:
+                    # Untried candidates go first so that every candidate gets measured.
+                    latency = 0.0 if s.requests == 0 else default
+                costs.append(latency * (s.in_flight + 1) / max(0.05, 1.0 - s.error_rate))
+
+        ranking = sorted(((provider, model, cost) for (provider, model), cost in zip(candidates, costs)), key=lambda item: item[2])
+        explored = len(ranking) > 1 and random.random() < self.explore
+        if explored:
+            ranking.insert(0, ranking.pop(random.randrange(1, len(ranking))))
+
+        self.decisions.append(RouteDecision(pool, ranking, explored))
+        return [(provider, model) for provider, model, _ in ranking]
+
+    def start(self, provider: str, model: str) -> None:
+        with self._lock:
+            stats = self._get(provider, model)
+            stats.in_flight += 1
+            stats.requests += 1
+
+    def finish(self, provider: str, model: str, duration: float, ttft: float | None = None, chars: int | None = None, error: bool = False) -> None:
+        """Record the end of a call; ``chars`` is None if the caller stopped reading a stream early."""
+        with self._lock:
+            stats = self._get(provider, model)
+            stats.in_flight -= 1
+            if ttft is not None:
+                stats.ttft = self._ewma(stats.ttft, ttft)
+            if chars is None and not error:
+                return
+
+            stats.error_rate = self._ewma(stats.error_rate, float(error))
+            generation = duration - (ttft or 0.0)
+            if not error and chars and generation > 0:
+                stats.throughput = self._ewma(stats.throughput, chars / generation)
+                stats.output_chars = self._ewma(stats.output_chars, chars)
+
+    def stats(self) -> dict[tuple[str, str], RouteStats]:
+        with self._lock:
+            return {key: replace(stats) for key, stats in self._stats.items()}
@@ -0,0 +1,217 @@
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Future):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    """One upstream iterator read by several subscribers; whoever needs the next chunk first pulls it."""
+
+    def __init__(self, iterator: Iterator[str], on_finish: Callable[[], None]):
+        self.iterator = iterator
+        self.on_finish = on_finish
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.pulling = False
+        self.subscribers = 0
+        self.cond = threading.Condition()
+
+    def _finish(self, error: BaseException | None = None) -> None:
+        with self.cond:
+            self.done = True
+            self.error = error
+            self.pulling = False
+            self.cond.notify_all()
+        self.on_finish()
+
+    def subscribe(self) -> Iterator[str]:
+        index = 0
+        try:
+            while True:
+                with self.cond:
+                    while index >= len(self.chunks) and not self.done and self.pulling:
+                        self.cond.wait()
+                    pull = index >= len(self.chunks) and not self.done
+                    if pull:
+                        self.pulling = True
+                    elif index >= len(self.chunks):
+                        if self.error is not None:
+                            raise self.error
+                        return
+
+                if pull:
+                    try:
+                        chunk = next(self.iterator)
+                    except StopIteration:
+                        self._finish()
+                        return
+                    except BaseException as e:
+                        self._finish(e)
+                        raise
+                    with self.cond:
+                        self.chunks.append(chunk)
+                        self.pulling = False
+                        self.cond.notify_all()
+                else:
+                    chunk = self.chunks[index]
+
+                index += 1
+                yield chunk
+        finally:
+            with self.cond:
+                self.subscribers -= 1
+                abandoned = self.subscribers == 0 and not self.done
+                if abandoned:
+                    self.done = True
+            if abandoned:
+                self.on_finish()
+                close = getattr(self.iterator, "close", None)
+                if close is not None:
+                    close()
+
+
+class _SharedAsyncStream:
+    """Async counterpart of ``_SharedStream``; chunks are pulled by a shielded task so a cancelled subscriber doesn't break the others."""
+
+    def __init__(self, iterator: AsyncIterator[str], on_finish: Callable[[], None]):
+        self.iterator = iterator
+        self.on_finish = on_finish
+        self.chunks: list[str] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.pending: asyncio.Future | None = None
+        self.subscribers = 0
+
+    async def _pull(self) -> None:
+        try:
+            self.chunks.append(await anext(self.iterator))
+        except StopAsyncIteration:
+            self.done = True
+            self.on_finish()
+        except BaseException as e:
+            self.done = True
+            self.error = e
+            self.on_finish()
+        finally:
+            self.pending = None
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        try:
+            while True:
+                if index < len(self.chunks):
+                    index += 1
+                    yield self.chunks[index - 1]
+                elif self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                else:
+                    if self.pending is None:
+                        self.pending = asyncio.ensure_future(self._pull())
+                    await asyncio.shield(self.pending)
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self.done = True
+                self.on_finish()
+                pending = self.pending
+                if pending is not None:
+                    pending.cancel()
+                    # The cancelled pull is still inside the generator's __anext__ until it unwinds.
+                    await asyncio.wait([pending])
+                await self.iterator.aclose()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one upstream call.
+
+    Results (or errors) are shared by every caller waiting at the time; once a call finishes its key
+    is released, so later calls go upstream again. Async calls are coalesced per event loop.
+    """
+
+    def __init__(self):
+        self._calls: dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _discard(self, key: tuple, entry: Any) -> None:
+        with self._lock:
+            if self._calls.get(key) is entry:
+                del self._calls[key]
+
+    def call(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            entry = self._calls.get(("call", key))
+            leader = entry is None
+            if leader:
+                entry = self._calls[("call", key)] = _Call()
+
+        if leader:
+            try:
+                entry.result = fn()
+            except BaseException as e:
+                entry.error = e
+            finally:
+                self._discard(("call", key), entry)
+                entry.event.set()
+        else:
+            entry.event.wait()
+
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    async def acall(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        flight_key = ("acall", asyncio.get_running_loop(), key)
+        with self._lock:
+            entry = self._calls.get(flight_key)
+            if entry is None:
+                entry = self._calls[flight_key] = _AsyncCall(asyncio.ensure_future(fn()))
+                entry.task.add_done_callback(lambda _: self._discard(flight_key, entry))
+            entry.waiters += 1
+
+        try:
+            return await asyncio.shield(entry.task)
+        finally:
+            entry.waiters -= 1
+            # The upstream call is only abandoned once nobody is waiting for it.
+            if entry.waiters == 0 and not entry.task.done():
+                entry.task.cancel()
+
+    def stream(self, key: str, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        flight_key = ("stream", key)
+        with self._lock:
+            shared = self._calls.get(flight_key)
+            if shared is not None:
+                with shared.cond:
+                    # A stream that ended or was abandoned stays registered until its on_finish runs; joining it would truncate.
+                    if not shared.done:
+                        shared.subscribers += 1
+                        return shared.subscribe()
+            shared = _SharedStream(fn(), lambda: self._discard(flight_key, shared))
+            self._calls[flight_key] = shared
+            shared.subscribers += 1
+        return shared.subscribe()
+
+    def astream(self, key: str, fn: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        flight_key = ("astream", asyncio.get_running_loop(), key)
+        with self._lock:
+            shared = self._calls.get(flight_key)
+            if shared is None or shared.done:
+                shared = _SharedAsyncStream(fn(), lambda: self._discard(flight_key, shared))
+                self._calls[flight_key] = shared
+            shared.subscribers += 1
+        return shared.subscribe()
@@ -1,16 +1,48 @@
+import asyncio
+import functools
 import json
+import threading
+import weakref
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterator, AsyncIterator, TYPE_CHECKING
+from typing import Any, Awaitable, Callable, Iterator, AsyncIterator, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from multi_ai_handler.ai_provider import AIProvider
 
 
+@functools.cache
+def load_env() -> None:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+
+@dataclass
+class Usage:
+    """Token counts reported by the provider; ``input_tokens`` includes ``cached_tokens``."""
+    input_tokens: int | None = None
+    output_tokens: int | None = None
+    cached_tokens: int | None = None
+
+
+@dataclass
+class StreamInfo:
+    """What a provider reports at the end of a stream; yielded after the last text chunk."""
+    usage: Usage | None = None
+    finish_reason: str | None = None
+    timing: dict[str, float] | None = None
+
+
 @dataclass
 class AIResponse:
     content: str | dict
     history: list[dict] | None = None
+    usage: Usage | None = None
+    # As reported by the provider, e.g. "stop", "end_turn", "max_tokens", "length".
+    finish_reason: str | None = None
+    # Server-reported seconds: "total" where the provider reports it, plus provider-specific phases.
+    timing: dict[str, float] | None = None
 
     def __str__(self) -> str:
         if isinstance(self.content, dict):
@@ -18,7 +50,155 @@ class AIResponse:
         return self.content
 
     def __repr__(self) -> str:
-        return f"AIResponse(content='{self.content[:50]}...', history={len(self.history) if self.history else 0} messages)"
+        return f"AIResponse(content='{str(self.content)[:50]}...', history={len(self.history) if self.history else 0} messages)"
+
+
+class StreamResult:
+    """Iterates over a stream's text chunks; ``usage``, ``finish_reason`` and ``timing`` are set once it ends.
+
+    Wraps an iterator of text chunks optionally followed by a ``StreamInfo``.
+    """
+
+    def __init__(self, iterator: Iterator[str | StreamInfo]):
+        self._iterator = iterator
+        self.info: StreamInfo | None = None
+
+    @property
+    def usage(self) -> Usage | None:
+        return self.info.usage if self.info is not None else None
+
+    @property
+    def finish_reason(self) -> str | None:
+        return self.info.finish_reason if self.info is not None else None
+
+    @property
+    def timing(self) -> dict[str, float] | None:
+        return self.info.timing if self.info is not None else None
+
+    def __iter__(self) -> "StreamResult":
+        return self
+
+    def __next__(self) -> str:
+        chunk = next(self._iterator)
+        while not isinstance(chunk, str):
+            self.info = chunk
+            chunk = next(self._iterator)
+        return chunk
+
+    def close(self) -> None:
+        close = getattr(self._iterator, "close", None)
+        if close is not None:
+            close()
+
+
+class AsyncStreamResult:
+    """Async counterpart of ``StreamResult``."""
+
+    def __init__(self, iterator: AsyncIterator[str | StreamInfo]):
+        self._iterator = iterator
+        self.info: StreamInfo | None = None
+
+    usage = StreamResult.usage
+    finish_reason = StreamResult.finish_reason
+    timing = StreamResult.timing
+
+    def __aiter__(self) -> "AsyncStreamResult":
+        return self
+
+    async def __anext__(self) -> str:
+        chunk = await anext(self._iterator)
+        while not isinstance(chunk, str):
+            self.info = chunk
+            chunk = await anext(self._iterator)
+        return chunk
+
+    async def aclose(self) -> None:
+        aclose = getattr(self._iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+@dataclass
+class RequestResult:
+    """Outcome of one request in ``request_many``/``arequest_many``, tagged with its input position."""
+    index: int
+    response: AIResponse | None = None
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class LoopLocal:
+    """Lazily creates one object per running event loop.
+
+    Async SDK clients hold connection pools bound to the loop they were first used on,
+    so a provider shared across threads and loops keeps a separate async client for each.
+    With ``close`` (an async function taking the object), each object is closed on its own loop:
+    by ``aclose``, by ``clear`` while that loop is still running, and otherwise when the loop shuts
+    down (``asyncio.run`` finalizes async generators before closing the loop), so a client made for
+    a short-lived loop doesn't leak its connection pool.
+    """
+
+    def __init__(self, factory: Callable[[], Any], close: Callable[[Any], Awaitable[None]] | None = None):
+        self._factory = factory
+        self._close = close
+        # loop -> (object, async generator that closes it on that loop)
+        self._instances: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def get(self) -> Any:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._instances.get(loop)
+            if entry is None:
+                instance = self._factory()
+                entry = self._instances[loop] = (instance, self._closer(loop, instance))
+        return entry[0]
+
+    def _closer(self, loop: asyncio.AbstractEventLoop, instance: Any) -> AsyncIterator[None] | None:
+        if self._close is None:
+            return None
+
+        async def close_on_shutdown() -> AsyncIterator[None]:
+            try:
+                yield
+            finally:
+                with self._lock:
+                    entry = self._instances.get(loop)
+                    if entry is not None and entry[0] is instance:
+                        del self._instances[loop]
+                await self._close(instance)
+
+        closer = close_on_shutdown()
+        # Run it to its yield now: starting it registers it with the running loop, whose shutdown closes it.
+        try:
+            closer.asend(None).send(None)
+        except StopIteration:
+            pass
+        return closer
+
+    def clear(self) -> None:
+        """Forget every object, closing those whose loop is still running on that loop."""
+        with self._lock:
+            entries = list(self._instances.items())
+            self._instances.clear()
+        for loop, (_, closer) in entries:
+            if closer is not None and loop.is_running():
+                asyncio.run_coroutine_threadsafe(_aclose(closer), loop)
+
+    async def aclose(self) -> None:
+        """Close the current loop's object now and forget the others (see ``clear``)."""
+        with self._lock:
+            entry = self._instances.pop(asyncio.get_running_loop(), None)
+        self.clear()
+        if entry is not None and entry[1] is not None:
+            await entry[1].aclose()
+
+
+async def _aclose(closer: AsyncIterator[None]) -> None:
+    await closer.aclose()
 
 
 class Conversation:
@@ -63,8 +243,8 @@ class Conversation:
         self,
         user_text: str | None = None,
         file: str | Path | dict | None = None,
-    ) -> Iterator[str]:
-        yield from self.handler.stream(
+    ) -> StreamResult:
+        return self.handler.stream(
             system_prompt=self.system_prompt,
             user_text=user_text,
             messages=self.history if self.history else None,
@@ -96,12 +276,12 @@ class Conversation:
 
         return response
 
-    async def astream(
+    def astream(
         self,
         user_text: str | None = None,
         file: str | Path | dict | None = None,
-    ) -> AsyncIterator[str]:
-        async for chunk in self.handler.astream(
+    ) -> AsyncStreamResult:
+        return self.handler.astream(
             system_prompt=self.system_prompt,
             user_text=user_text,
             messages=self.history if self.history else None,
@@ -109,8 +289,7 @@ class Conversation:
             model=self.model,
             temperature=self.temperature,
             local=self.local,
-        ):
-            yield chunk
+        )
 
     def clear(self) -> None:
         self.history = []
@@ -0,0 +1,82 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+from multi_ai_handler import AIProvider, AIResponse
+from multi_ai_handler.utils import AsyncStreamResult, StreamInfo, StreamResult, Usage
+
+
+class FakeProvider(AIProvider):
+    """In-process provider: answers ``reply`` (in ``chunk_size`` pieces when streamed) after ``delay`` seconds, or raises ``error``.
+
+    ``delays`` and ``errors`` give per-call values, in call order, before falling back to ``delay``/``error``.
+    """
+
+    def __init__(self, reply: str = "ok", delay: float = 0.0, error: Exception | None = None, chunk_size: int = 2, delays: tuple = (), errors: tuple = ()):
+        self.reply = reply
+        self.delay = delay
+        self.error = error
+        self.chunk_size = chunk_size
+        self.delays = list(delays)
+        self.errors = list(errors)
+        self.calls = 0
+        self.requests: list[dict] = []
+
+    def _next(self, **request) -> tuple[float, Exception | None]:
+        self.calls += 1
+        self.requests.append(request)
+        delay = self.delays.pop(0) if self.delays else self.delay
+        error = self.errors.pop(0) if self.errors else self.error
+        return delay, error
+
+    def _response(self, error: Exception | None) -> AIResponse:
+        if error is not None:
+            raise error
+        request = self.requests[-1]
+        history = [*(request["messages"] or []), {"role": "user", "content": request["user_text"]}, {"role": "assistant", "content": self.reply}]
+        return AIResponse(content=self.reply, history=history, usage=Usage(1, len(self.reply)), finish_reason="stop")
+
+    def generate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
+        delay, error = self._next(system_prompt=system_prompt, user_text=user_text, messages=messages, file=file, model=model)
+        time.sleep(delay)
+        return self._response(error)
+
+    async def agenerate(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False, json_output: bool=False) -> AIResponse:
+        delay, error = self._next(system_prompt=system_prompt, user_text=user_text, messages=messages, file=file, model=model)
+        await asyncio.sleep(delay)
+        return self._response(error)
+
+    def _pieces(self) -> list[str]:
+        return [self.reply[i:i + self.chunk_size] for i in range(0, len(self.reply), self.chunk_size)]
+
+    def stream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> StreamResult:
+        delay, error = self._next(system_prompt=system_prompt, user_text=user_text, messages=messages, file=file, model=model)
+
+        def chunks() -> Iterator[str | StreamInfo]:
+            time.sleep(delay)
+            if error is not None:
+                raise error
+            yield from self._pieces()
+            yield StreamInfo(usage=Usage(1, len(self.reply)), finish_reason="stop")
+
+        return StreamResult(chunks())
+
+    def astream(self, system_prompt: str, user_text: str=None, messages: list[dict]=None, file: str | Path | dict | None=None, model: str=None, temperature: float=0.0, local: bool=False) -> AsyncStreamResult:
+        delay, error = self._next(system_prompt=system_prompt, user_text=user_text, messages=messages, file=file, model=model)
+
+        async def chunks() -> AsyncIterator[str | StreamInfo]:
+            await asyncio.sleep(delay)
+            if error is not None:
+                raise error
+            for piece in self._pieces():
+                yield piece
+            yield StreamInfo(usage=Usage(1, len(self.reply)), finish_reason="stop")
+
+        return AsyncStreamResult(chunks())
+
+    def list_models(self) -> list[str]:
+        return ["fake"]
+
+    def get_model_info(self, model: str) -> dict:
+        return {"name": model}
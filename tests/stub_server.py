@@ -0,0 +1,72 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+
+# handler(method, path, body) -> (status, body) or (status, body, headers); dict/list bodies are sent as JSON.
+Handler = Callable[[str, str, bytes], tuple]
+
+
+class StubServer:
+    """Local HTTP server that answers every request through ``handler`` and logs ``(method, path, body)``."""
+
+    def __init__(self, handler: Handler):
+        self.handler = handler
+        self.requests: list[tuple[str, str, bytes]] = []
+        stub = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _respond(self) -> None:
+                body = self.rfile.read(int(self.headers.get("content-length") or 0))
+                stub.requests.append((self.command, self.path, body))
+                status, payload, *rest = stub.handler(self.command, self.path, body)
+                headers = rest[0] if rest else {}
+                if isinstance(payload, (dict, list)):
+                    payload = json.dumps(payload)
+                    headers.setdefault("content-type", "application/json")
+                if isinstance(payload, str):
+                    payload = payload.encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("content-length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_DELETE = _respond
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), RequestHandler)
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def paths(self, method: str | None = None) -> list[str]:
+        return [path for request_method, path, _ in self.requests if method in (None, request_method)]
+
+    def json(self, index: int = -1) -> Any:
+        return json.loads(self.requests[index][2])
+
+    def __enter__(self) -> "StubServer":
+        threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def chat_completion(content: str = "ok") -> dict:
+    return {"id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "m", "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}], "usage": {"prompt_tokens": 3, "completion_tokens": 1, "total_tokens": 4}}
+
+
+def chat_stream(*chunks: str) -> str:
+    events = [{"id": "chatcmpl-1", "object": "chat.completion.chunk", "created": 0, "model": "m", "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]} for chunk in chunks]
+    return "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+
+
+def error(status: int, message: str = "error") -> tuple:
+    # retry-after-ms keeps SDK and policy backoff in the millisecond range.
+    return status, {"error": {"message": message, "type": "server_error"}}, {"retry-after-ms": "1"}
@@ -0,0 +1,98 @@
+import json
+import re
+
+import pytest
+
+from multi_ai_handler import AIProviderManager
+from multi_ai_handler.batch import BatchRequestError
+from tests.stub_server import StubServer
+
+
+class FakeBatchServer:
+    """OpenAI files and batches endpoints; a batch completes on its second poll, failing requests whose text contains "fail"."""
+
+    def __init__(self):
+        self.files: dict[str, str] = {}
+        self.batches: dict[str, dict] = {}
+
+    def __call__(self, method, path, body):
+        if method == "POST" and path == "/v1/files":
+            # The JSONL is the only file part of the multipart upload.
+            content = re.search(rb'filename="[^"]*".*?\r\n\r\n(.*?)\r\n--', body, re.S).group(1).decode()
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = content
+            return 200, {"id": file_id, "object": "file", "bytes": len(content), "created_at": 0, "filename": "batch.jsonl", "purpose": "batch", "status": "processed"}
+        if method == "POST" and path == "/v1/batches":
+            batch_id = f"batch_{len(self.batches)}"
+            self.batches[batch_id] = {"input_file_id": json.loads(body)["input_file_id"], "polls": 0}
+            return 200, self._batch(batch_id)
+        if method == "GET" and path.startswith("/v1/batches/"):
+            batch_id = path.rsplit("/", 1)[1]
+            self.batches[batch_id]["polls"] += 1
+            return 200, self._batch(batch_id)
+        if method == "GET" and path.endswith("/content"):
+            return 200, self.files[path.split("/")[3]], {"content-type": "application/octet-stream"}
+        return 404, {"error": {"message": f"Unknown path {path}"}}
+
+    def _batch(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        done = batch["polls"] >= 2
+        if done and f"out-{batch_id}" not in self.files:
+            self._run(batch_id)
+        return {"id": batch_id, "object": "batch", "endpoint": "/v1/chat/completions", "input_file_id": batch["input_file_id"], "completion_window": "24h", "created_at": 0, "status": "completed" if done else "in_progress", "output_file_id": f"out-{batch_id}" if done else None, "error_file_id": f"err-{batch_id}" if done else None}
+
+    def _run(self, batch_id: str) -> None:
+        output, errors = [], []
+        for line in self.files[self.batches[batch_id]["input_file_id"]].splitlines():
+            request = json.loads(line)
+            text = request["body"]["messages"][-1]["content"][0]["text"]
+            if "fail" in text:
+                errors.append({"custom_id": request["custom_id"], "response": {"status_code": 400, "body": {"error": "bad request"}}, "error": None})
+            else:
+                output.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": {"choices": [{"message": {"content": json.dumps({"echo": text})}}]}}, "error": None})
+        self.files[f"out-{batch_id}"] = "\n".join(json.dumps(entry) for entry in output)
+        self.files[f"err-{batch_id}"] = "\n".join(json.dumps(entry) for entry in errors)
+
+
+@pytest.fixture
+def server():
+    with StubServer(FakeBatchServer()) as server:
+        yield server
+
+
+def _manager(url: str, batch_dir=None) -> AIProviderManager:
+    manager = AIProviderManager(batch_dir=batch_dir)
+    manager.register_provider("openai", "multi_ai_handler.providers.openai:OpenAIProvider", base_url=f"{url}/v1", api_key="test", max_retries=0)
+    return manager
+
+
+def test_results_come_back_in_input_order(server):
+    manager = _manager(server.url)
+    job = manager.submit_batch("openai", "m", [{"user_text": "one"}, {"user_text": "please fail"}, {"user_text": "three"}], json_output=True)
+
+    results = manager.wait_batch(job, poll_interval=0.01, timeout=5)
+
+    assert [result.index for result in results] == [0, 1, 2]
+    assert results[0].response.content == {"echo": "one"}
+    assert isinstance(results[1].error, BatchRequestError)
+    assert results[2].response.content == {"echo": "three"}
+
+
+def test_pending_batches_resume_after_restart(server, tmp_path):
+    job = _manager(server.url, tmp_path).submit_batch("openai", "m", [{"user_text": "one"}])
+    assert not _manager(server.url, tmp_path).poll_batch(job).done
+
+    restarted = _manager(server.url, tmp_path)
+    [resumed] = restarted.resume_batches()
+    assert resumed.batch_id == job.batch_id
+
+    results = restarted.wait_batch(resumed, poll_interval=0.01, timeout=5)
+    assert results[0].response.content == json.dumps({"echo": "one"})
+    assert restarted.resume_batches() == []
+
+
+def test_unfinished_batch_has_no_results(server):
+    manager = _manager(server.url)
+    job = manager.submit_batch("openai", "m", [{"user_text": "one"}])
+    with pytest.raises(RuntimeError, match="in progress"):
+        manager.batch_results(job)
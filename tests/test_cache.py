@@ -0,0 +1,160 @@
+import base64
+import os
+import time
+
+import pytest
+
+from multi_ai_handler import extract_md
+from multi_ai_handler.cache import DirectoryCache, LRUCache, SQLiteCache, TieredCache, hash_key
+
+
+def test_hash_key_separates_parts():
+    assert hash_key("ab", "c") != hash_key("a", "bc")
+    assert hash_key("a", b"b") == hash_key(b"a", "b")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert cache.get("a") == "1"
+    assert cache.get("b") is None
+    assert len(cache) == 2
+
+
+def test_lru_is_bounded_by_size():
+    cache = LRUCache(max_entries=10, max_bytes=5)
+    cache.set("a", "xxx")
+    cache.set("b", "yyy")
+    cache.set("huge", "z" * 6)
+
+    assert cache.get("a") is None
+    assert cache.get("b") == "yyy"
+    assert cache.get("huge") is None
+
+
+def test_directory_cache_is_shared_and_evicts_oldest(tmp_path):
+    writer = DirectoryCache(tmp_path, max_bytes=8)
+    writer.set("a", "1234")
+    old = time.time() - 60
+    os.utime(tmp_path / "a.cache", (old, old))
+    writer.set("b", "5678")
+
+    reader = DirectoryCache(tmp_path, max_bytes=8)
+    assert reader.get("b") == "5678"
+
+    writer.set("c", "9")
+    assert reader.get("a") is None
+    assert reader.get("c") == "9"
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_sqlite_cache_persists_and_evicts_oldest(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = SQLiteCache(path, max_bytes=8)
+    cache.set("a", "1234")
+    cache.set("b", "5678")
+    cache.get("a")
+    cache.set("c", "9")
+    cache.close()
+
+    reopened = SQLiteCache(path)
+    assert reopened.get("a") == "1234"
+    assert reopened.get("b") is None
+    assert reopened.get("c") == "9"
+    reopened.close()
+
+
+def test_directory_cache_scans_only_past_the_limit(tmp_path, monkeypatch):
+    cache = DirectoryCache(tmp_path, max_bytes=10)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+
+    for key in "abcd":
+        cache.set(key, "xx")
+    cache.set("a", "yy")
+    assert scans == []
+
+    cache.set("e", "zzzz")
+    assert len(scans) == 1
+    # Trimmed to the low-water mark, so the next small write fits without a scan.
+    assert sum(file.stat().st_size for file in tmp_path.glob("*.cache")) <= 9
+    cache.set("f", "")
+    assert len(scans) == 1
+
+
+def test_sqlite_cache_keeps_a_running_total(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = SQLiteCache(path, max_bytes=100)
+    cache.set("a", "x" * 40)
+    cache.set("a", "x" * 30)
+    cache.set("b", "x" * 50)
+    size = lambda db: db._conn.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+    assert size(cache) == 80
+
+    cache.set("c", "x" * 30)
+    assert cache.get("a") is None
+    assert size(cache) == 80
+    cache.close()
+
+    reopened = SQLiteCache(path, max_bytes=100)
+    assert size(reopened) == 80
+    reopened.clear()
+    assert size(reopened) == 0
+    reopened.close()
+
+
+def test_tiered_cache_fills_memory_from_backend(tmp_path):
+    backend = DirectoryCache(tmp_path)
+    backend.set("k", "v")
+    cache = TieredCache(LRUCache(), backend)
+
+    assert cache.get("k") == "v"
+    assert cache.memory.get("k") == "v"
+
+    cache.clear()
+    assert cache.get("k") is None
+
+
+@pytest.fixture
+def converter(monkeypatch):
+    """Docling replaced by a counting fake and the extraction cache reset around each test."""
+    calls = []
+
+    def convert(filename, file_bytes, ocr_threshold, table_mode):
+        calls.append(filename)
+        return f"# {file_bytes.decode()}"
+
+    monkeypatch.setattr(extract_md, "DOCLING_AVAILABLE", True)
+    monkeypatch.setattr(extract_md, "_convert", convert)
+    extract_md.configure_extraction_cache()
+    yield calls
+    extract_md.configure_extraction_cache()
+
+
+def _encoded(text: str) -> str:
+    return base64.b64encode(text.encode()).decode()
+
+
+def test_extraction_is_cached_by_content(converter):
+    assert extract_md.extract_structured_md("a.docx", _encoded("same")) == "# same"
+    assert extract_md.extract_structured_md("renamed.docx", _encoded("same")) == "# same"
+    assert converter == ["a.docx"]
+
+    extract_md.extract_structured_md("a.docx", _encoded("same"), ocr_threshold=0.5)
+    extract_md.extract_structured_md("a.docx", _encoded("changed"))
+    assert len(converter) == 3
+
+
+def test_extraction_cache_persistent_tier(converter, tmp_path):
+    extract_md.configure_extraction_cache(backend=SQLiteCache(tmp_path / "md.db"))
+    extract_md.extract_structured_md("a.docx", _encoded("doc"))
+
+    # Another process: an empty memory tier over the same file.
+    extract_md.configure_extraction_cache(backend=SQLiteCache(tmp_path / "md.db"))
+    assert extract_md.extract_structured_md("a.docx", _encoded("doc")) == "# doc"
+    assert converter == ["a.docx"]
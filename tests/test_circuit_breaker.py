@@ -0,0 +1,54 @@
+import asyncio
+import time
+
+from multi_ai_handler import AIProviderManager, CircuitBreaker, CircuitBreakers, HedgePolicy
+from multi_ai_handler.circuit_breaker import CLOSED, HALF_OPEN, OPEN
+from tests.fakes import FakeProvider
+
+
+def test_opens_on_failure_rate_and_closes_after_healthy_probe():
+    breaker = CircuitBreaker(min_requests=4, failure_rate=0.5, open_duration=0.05)
+    for success in (True, True, False):
+        breaker.record(success, 0.01)
+    assert breaker.state == CLOSED
+    breaker.record(False, 0.01)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record(True, 0.01)
+    assert breaker.state == CLOSED
+
+
+def test_slow_calls_trip_the_breaker():
+    breaker = CircuitBreaker(min_requests=2, slow_call_duration=0.5, slow_call_rate=1.0)
+    breaker.record(True, 1.0)
+    breaker.record(True, 2.0)
+    assert breaker.state == OPEN
+
+
+def test_release_returns_probe_slot_without_an_outcome():
+    breaker = CircuitBreaker(min_requests=1, open_duration=0.0)
+    breaker.record(False, 0.01)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_cancelled_hedge_loser_is_not_a_success():
+    breakers = CircuitBreakers(min_requests=1, open_duration=0.0)
+    manager = AIProviderManager(circuit_breakers=breakers, hedge_policy=HedgePolicy(delay=0.05), fallbacks={"slow": [("fast", "m")]})
+    manager.register_provider("slow", FakeProvider, delay=5.0)
+    manager.register_provider("fast", FakeProvider, reply="fast")
+    breakers.get("slow").record(False, 0.01)
+
+    response = asyncio.run(manager.agenerate("slow", "m", user_text="hi"))
+
+    assert response.content == "fast"
+    # The stalled original was cancelled: its probe slot is free again and the circuit still half-open.
+    assert breakers.states()["slow"] == HALF_OPEN
+    assert breakers.get("slow").allow()
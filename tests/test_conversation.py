@@ -0,0 +1,47 @@
+import asyncio
+
+from multi_ai_handler import AIProviderManager, RateLimit, RateLimiter, RetryPolicy
+from multi_ai_handler.metrics import MetricsRegistry
+from multi_ai_handler.rate_limit import estimate_tokens
+from tests.fakes import FakeProvider
+
+
+def test_conversation_keeps_history():
+    manager = AIProviderManager()
+    manager.register_provider("fake", FakeProvider, reply="hello")
+    conv = manager.conversation("fake", "m", system_prompt="be brief")
+
+    conv.send("one")
+    conv.send("two")
+
+    assert len(conv) == 4
+    assert manager.get_provider("fake").requests[-1]["messages"] == conv.history[:2]
+
+
+def test_conversation_goes_through_the_manager():
+    metrics = MetricsRegistry()
+    manager = AIProviderManager(retry_policy=RetryPolicy(base_delay=0.0), rate_limiter=RateLimiter(default=RateLimit(rpm=600)), metrics=metrics)
+    manager.register_provider("fake", FakeProvider, errors=(ConnectionError("reset"),))
+    conv = manager.conversation("fake", "m")
+
+    assert conv.send("hi").content == "ok"
+    assert asyncio.run(conv.asend("again")).content == "ok"
+    assert "".join(conv.stream("and again")) == "ok"
+
+    # The first send was retried by the manager's policy, and every turn was counted.
+    assert manager.get_provider("fake").calls == 4
+    assert metrics.counter("retries_total", "fake", "m") == 1
+
+
+def test_estimate_counts_attached_files(tmp_path):
+    text = tmp_path / "notes.txt"
+    text.write_text("x" * 4000)
+    image = tmp_path / "photo.png"
+    image.write_bytes(b"\x89PNG" + bytes(100_000))
+
+    base = estimate_tokens("system", "question", None)
+    assert estimate_tokens("system", "question", None, text) == base + 1000
+    assert estimate_tokens("system", "question", None, image) == base + 1600
+    # Files from earlier turns are sent again.
+    history = [{"role": "user", "content": [{"file_ref": {"filename": "notes.txt", "size": 4000}}]}]
+    assert estimate_tokens("system", "question", history) == base + 1000
@@ -0,0 +1,135 @@
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from multi_ai_handler import extract_md
+
+
+@pytest.fixture
+def parallel(monkeypatch):
+    """Page-parallel extraction with Docling and the worker pool replaced by in-process fakes."""
+    calls = {"count": 0, "convert": 0}
+
+    def count(file_bytes):
+        calls["count"] += 1
+        return 20
+
+    def convert(filename, file_bytes, ocr_threshold, table_mode):
+        calls["convert"] += 1
+        return "whole"
+
+    pool = ThreadPoolExecutor(2)
+    monkeypatch.setattr(extract_md, "DOCLING_AVAILABLE", True)
+    monkeypatch.setattr(extract_md, "PYPDFIUM_AVAILABLE", True)
+    monkeypatch.setattr(extract_md, "count_pdf_pages", count)
+    monkeypatch.setattr(extract_md, "_convert", convert)
+    monkeypatch.setattr(extract_md, "_convert_page_range", lambda path, ocr, table, start, end: f"{start}-{end}")
+    monkeypatch.setattr(extract_md, "_get_page_pool", lambda workers: pool)
+    monkeypatch.setattr(extract_md, "_extraction_cache", extract_md.TieredCache(extract_md.LRUCache(max_entries=8)))
+    extract_md.enable_page_parallelism(min_pages=10, pages_per_chunk=8)
+    yield calls
+    extract_md.disable_page_parallelism()
+    pool.shutdown()
+
+
+def _encoded(data: bytes = b"%PDF-1.4 test") -> str:
+    return base64.b64encode(data).decode()
+
+
+def test_pages_are_counted_once(parallel):
+    assert extract_md.extract_structured_md("doc.pdf", _encoded()) == "1-8\n\n9-16\n\n17-20"
+    assert parallel["count"] == 1
+
+
+def test_without_pypdfium_pdfs_are_converted_whole(parallel, monkeypatch):
+    monkeypatch.setattr(extract_md, "PYPDFIUM_AVAILABLE", False)
+
+    assert extract_md.extract_structured_md("doc.pdf", _encoded(b"%PDF-1.4 other")) == "whole"
+    assert list(extract_md.iter_structured_md_pages("doc.pdf", _encoded())) == ["whole"]
+    assert parallel["count"] == 0
+
+
+def test_count_pdf_pages_needs_pypdfium(monkeypatch):
+    monkeypatch.setattr(extract_md, "PYPDFIUM_AVAILABLE", False)
+    with pytest.raises(ImportError, match="pypdfium2"):
+        extract_md.count_pdf_pages(b"%PDF-1.4")
+
+
+def test_page_ranges_stay_out_of_the_memory_tier(parallel):
+    extract_md.extract_structured_md("doc.pdf", _encoded())
+
+    # Only the whole document is cached in memory, not its three page ranges.
+    assert len(extract_md._extraction_cache.memory) == 1
+
+
+def test_page_ranges_are_kept_in_the_persistent_tier(parallel, monkeypatch):
+    backend = extract_md.LRUCache()
+    monkeypatch.setattr(extract_md, "_extraction_cache", extract_md.TieredCache(extract_md.LRUCache(), backend))
+
+    assert list(extract_md.iter_structured_md_pages("doc.pdf", _encoded(), page_count=20)) == ["1-8", "9-16", "17-20"]
+    monkeypatch.setattr(extract_md, "_convert_page_range", lambda *args: pytest.fail("converted again"))
+    assert list(extract_md.iter_structured_md_pages("doc.pdf", _encoded(), page_count=20)) == ["1-8", "9-16", "17-20"]
+    assert len(backend) == 3
+
+
+def test_page_pool_follows_the_requested_size(monkeypatch):
+    pools = []
+
+    class Pool:
+        def __init__(self, max_workers, mp_context):
+            self.max_workers = max_workers
+            self.shut_down = False
+            pools.append(self)
+
+        def shutdown(self, wait=True, cancel_futures=False):
+            self.shut_down = True
+
+    monkeypatch.setattr(extract_md, "ProcessPoolExecutor", Pool)
+    extract_md.shutdown_page_pool()
+    try:
+        assert extract_md._get_page_pool(2) is extract_md._get_page_pool(2)
+        resized = extract_md._get_page_pool(4)
+        assert resized.max_workers == 4
+        assert pools[0].shut_down and not resized.shut_down
+    finally:
+        extract_md.shutdown_page_pool()
+
+
+@pytest.fixture
+def builds(monkeypatch):
+    """Converter construction replaced by a slow fake that records each option set it builds."""
+    built = []
+
+    def build(ext, ocr_threshold, table_mode):
+        built.append((ext, ocr_threshold, table_mode))
+        time.sleep(0.05)
+        return object()
+
+    monkeypatch.setattr(extract_md, "DOCLING_AVAILABLE", True)
+    monkeypatch.setattr(extract_md, "_build_converter", build)
+    extract_md.clear_converters()
+    yield built
+    extract_md.clear_converters()
+
+
+def test_concurrent_callers_share_one_converter(builds):
+    with ThreadPoolExecutor(8) as pool:
+        converters = list(pool.map(lambda _: extract_md.get_converter(".PDF"), range(8)))
+
+    assert builds == [(".pdf", 0.1, "accurate")]
+    assert all(converter is converters[0] for converter in converters)
+
+
+def test_converters_are_built_per_option_set(builds):
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda args: extract_md.get_converter(*args), [(".pdf", 0.1, "accurate"), (".pdf", 0.5, "accurate"), (".pdf", 0.1, "fast")] * 2))
+    # Non-PDF formats don't use the PDF options, so they share one converter.
+    assert extract_md.get_converter(".docx", 0.1) is extract_md.get_converter(".pptx", 0.9, "fast")
+
+    assert sorted(builds) == [(".docx", 0.1, "accurate"), (".pdf", 0.1, "accurate"), (".pdf", 0.1, "fast"), (".pdf", 0.5, "accurate")]
+
+    extract_md.clear_converters()
+    extract_md.get_converter()
+    assert len(builds) == 5
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import json
+
+import pytest
+
+from multi_ai_handler import AIProviderManager
+from multi_ai_handler import file_uploads
+from multi_ai_handler.file_uploads import FileUploadCache, is_missing_file, reupload_missing_files, upload_namespace
+from tests.stub_server import StubServer, chat_completion, chat_stream
+
+
+class FilesEndpoint:
+    """OpenAI-style stub with a files endpoint; chat requests referencing an unknown file ID get a 404."""
+
+    def __init__(self):
+        self.files: set[str] = set()
+
+    def __call__(self, method, path, body):
+        if path == "/v1/files":
+            file_id = f"file-{len(self.files) + 1}"
+            self.files.add(file_id)
+            return 200, {"id": file_id, "object": "file", "bytes": len(body), "created_at": 0, "filename": "doc.pdf", "purpose": "user_data", "status": "processed"}
+        request = json.loads(body)
+        referenced = [block["file"]["file_id"] for message in request["messages"] if isinstance(message["content"], list) for block in message["content"] if block.get("type") == "file"]
+        missing = [file_id for file_id in referenced if file_id not in self.files]
+        if missing:
+            return 404, {"error": {"message": f"No such File object: {missing[0]}", "type": "invalid_request_error", "code": "not_found_error"}}
+        if request.get("stream"):
+            return 200, chat_stream("read ", *referenced), {"content-type": "text/event-stream"}
+        return 200, chat_completion(f"read {' '.join(referenced)}")
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "doc.pdf"
+    path.write_bytes(b"%PDF-1.4\n%%EOF\n")
+    return path
+
+
+def _manager(url: str, cache: FileUploadCache) -> AIProviderManager:
+    manager = AIProviderManager()
+    manager.register_provider("openai", "multi_ai_handler.providers.openai:OpenAIProvider", base_url=f"{url}/v1", api_key="test", upload_files=True, upload_cache=cache, max_retries=0)
+    return manager
+
+
+def _stale(cache: FileUploadCache, url: str, pdf) -> None:
+    """Cache an upload the provider has since deleted."""
+    cache.set(upload_namespace("openai", f"{url}/v1/", "test"), hashlib.sha256(pdf.read_bytes()).hexdigest(), "file-expired", 3600)
+
+
+def test_file_is_uploaded_once(pdf):
+    cache = FileUploadCache()
+    with StubServer(FilesEndpoint()) as server:
+        manager = _manager(server.url, cache)
+        manager.generate("openai", "m", user_text="summarize", file=pdf)
+        manager.generate("openai", "m", user_text="again", file=pdf)
+    assert server.paths("POST").count("/v1/files") == 1
+
+
+def test_missing_upload_is_uploaded_again(pdf):
+    cache = FileUploadCache()
+    with StubServer(FilesEndpoint()) as server:
+        _stale(cache, server.url, pdf)
+        manager = _manager(server.url, cache)
+        response = manager.generate("openai", "m", user_text="summarize", file=pdf)
+    assert response.content == "read file-1"
+    assert server.paths() == ["/v1/chat/completions", "/v1/files", "/v1/chat/completions"]
+
+
+def test_missing_upload_is_uploaded_again_for_async_streams(pdf):
+    cache = FileUploadCache()
+
+    async def consume(manager) -> str:
+        return "".join([chunk async for chunk in manager.astream("openai", "m", user_text="summarize", file=pdf)])
+
+    with StubServer(FilesEndpoint()) as server:
+        _stale(cache, server.url, pdf)
+        assert asyncio.run(consume(_manager(server.url, cache))) == "read file-1"
+    assert server.paths().count("/v1/files") == 1
+
+
+@pytest.mark.parametrize("status, error", [
+    (404, {"message": "The model `m` does not exist", "type": "invalid_request_error", "code": "model_not_found"}),
+    (400, {"message": "File too large", "type": "invalid_request_error"}),
+    (400, {"message": "Invalid PDF file", "type": "invalid_request_error", "code": "invalid_file"}),
+    (403, {"message": "Unsupported file type", "type": "invalid_request_error"}),
+])
+def test_other_errors_are_not_retried(pdf, status, error):
+    files = FilesEndpoint()
+
+    def handler(method, path, body):
+        if path == "/v1/files":
+            return files(method, path, body)
+        return status, {"error": error}
+
+    with StubServer(handler) as server:
+        manager = _manager(server.url, FileUploadCache())
+        with pytest.raises(Exception):
+            manager.generate("openai", "m", user_text="summarize", file=pdf)
+    assert server.paths().count("/v1/chat/completions") == 1
+
+
+class _Error(Exception):
+    def __init__(self, status_code: int, body: dict):
+        super().__init__(body)
+        self.status_code = status_code
+        self.body = body
+
+
+def test_is_missing_file_needs_a_not_found_file_error():
+    # Anthropic errors carry the whole body, OpenAI errors the "error" object.
+    assert is_missing_file(_Error(404, {"type": "error", "error": {"type": "not_found_error", "message": "File not found: file_1"}}))
+    assert is_missing_file(_Error(404, {"type": "invalid_request_error", "code": "not_found_error", "message": "No such File object: file-1"}))
+    assert not is_missing_file(_Error(404, {"type": "error", "error": {"type": "not_found_error", "message": "model: claude-x"}}))
+    assert not is_missing_file(_Error(400, {"type": "error", "error": {"type": "invalid_request_error", "message": "file too large"}}))
+
+
+class _Provider:
+    upload_files = True
+
+    def __init__(self, error: Exception):
+        self.error = error
+        self.closed = []
+        self.forgotten = []
+        self._upload = self
+
+    def is_missing_upload(self, exc: Exception) -> bool:
+        return True
+
+    def forget(self, file) -> bool:
+        self.forgotten.append(file)
+        return False
+
+    @reupload_missing_files
+    def _stream(self, file=None):
+        try:
+            yield "a"
+            yield "b"
+        finally:
+            self.closed.append(1)
+
+    @reupload_missing_files
+    async def _astream(self, file=None):
+        try:
+            yield "a"
+            yield "b"
+        finally:
+            self.closed.append(1)
+
+    @reupload_missing_files
+    async def agenerate(self, file=None):
+        raise self.error
+
+
+def test_stopping_a_stream_early_closes_the_provider_stream():
+    provider = _Provider(RuntimeError())
+    stream = provider._stream(file="doc.pdf")
+    assert next(stream) == "a"
+    stream.close()
+    assert provider.closed == [1]
+
+    async def consume():
+        stream = provider._astream(file="doc.pdf")
+        assert await anext(stream) == "a"
+        await stream.aclose()
+        # Closed right away, not when the event loop finalizes leftover generators.
+        assert provider.closed == [1, 1]
+
+    asyncio.run(consume())
+    assert provider.closed == [1, 1]
+
+
+def test_errors_without_upload_mode_stay_on_the_event_loop(monkeypatch):
+    provider = _Provider(RuntimeError("boom"))
+    provider.upload_files = False
+
+    async def no_thread(*args, **kwargs):
+        raise AssertionError("went to a thread")
+
+    monkeypatch.setattr(file_uploads.asyncio, "to_thread", no_thread)
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(provider.agenerate(file="doc.pdf"))
+    assert provider.forgotten == []
+
+
+def test_google_missing_upload_signals():
+    errors = pytest.importorskip("google.genai.errors")
+    from multi_ai_handler.providers.google import GoogleProvider
+
+    provider = GoogleProvider.__new__(GoogleProvider)
+    gone = errors.ClientError(403, {"error": {"code": 403, "message": "You do not have permission to access the File abc or it may not exist.", "status": "PERMISSION_DENIED"}})
+    too_large = errors.ClientError(400, {"error": {"code": 400, "message": "The file is too large.", "status": "INVALID_ARGUMENT"}})
+    no_model = errors.ClientError(404, {"error": {"code": 404, "message": "models/x is not found for API version v1beta", "status": "NOT_FOUND"}})
+    assert provider.is_missing_upload(gone)
+    assert not provider.is_missing_upload(too_large)
+    assert not provider.is_missing_upload(no_model)
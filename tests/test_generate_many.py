@@ -0,0 +1,79 @@
+import asyncio
+
+from multi_ai_handler import AIProviderManager
+from tests.fakes import FakeProvider
+
+
+def _manager() -> AIProviderManager:
+    manager = AIProviderManager()
+    manager.register_provider("slow", FakeProvider, reply="slow", delay=0.2)
+    manager.register_provider("fast", FakeProvider, reply="fast")
+    return manager
+
+
+REQUESTS = [{"provider": "slow", "model": "m", "user_text": str(i)} for i in range(3)] + [{"provider": "fast", "model": "m", "user_text": str(i)} for i in range(4)]
+
+
+def test_saturated_provider_does_not_block_others():
+    results = list(_manager().generate_many(REQUESTS, concurrency=2, provider_concurrency={"slow": 1}))
+
+    assert sorted(result.index for result in results) == list(range(7))
+    assert all(result.ok for result in results)
+    # The fast requests finish while the slow ones wait for their provider's single slot.
+    order = [result.index for result in results]
+    assert order.index(6) < order.index(1)
+
+
+def test_async_saturated_provider_does_not_block_others():
+    async def collect():
+        return [result async for result in _manager().agenerate_many(REQUESTS, concurrency=2, provider_concurrency={"slow": 1})]
+
+    order = [result.index for result in asyncio.run(collect())]
+    assert sorted(order) == list(range(7))
+    assert order.index(6) < order.index(1)
+
+
+def test_provider_limit_is_respected():
+    manager = AIProviderManager()
+    manager.register_provider("fake", FakeProvider, delay=0.05)
+    in_flight = []
+    provider = manager.get_provider("fake")
+    generate = provider.generate
+
+    def tracked(*args, **kwargs):
+        in_flight.append(1)
+        try:
+            assert len(in_flight) <= 2
+            return generate(*args, **kwargs)
+        finally:
+            in_flight.pop()
+
+    provider.generate = tracked
+    requests = [{"provider": "fake", "model": "m", "user_text": str(i)} for i in range(6)]
+    results = list(manager.generate_many(requests, concurrency=6, provider_concurrency=2))
+    assert all(result.ok for result in results)
+
+
+def test_errors_are_returned_on_results():
+    manager = AIProviderManager()
+    manager.register_provider("down", FakeProvider, error=ValueError("bad request"))
+    [result] = manager.generate_many([{"provider": "down", "model": "m", "user_text": "hi"}])
+    assert not result.ok and isinstance(result.error, ValueError)
+
+
+def test_async_requests_are_unwound_when_the_caller_stops():
+    manager = AIProviderManager()
+    manager.register_provider("fast", FakeProvider)
+    manager.register_provider("slow", FakeProvider, delay=5.0)
+    requests = [{"provider": "fast", "model": "m", "user_text": "x"}] + [{"provider": "slow", "model": "m", "user_text": str(i)} for i in range(3)]
+
+    async def first_then_stop():
+        results = manager.agenerate_many(requests, concurrency=4)
+        first = await anext(results)
+        await results.aclose()
+        # Nothing is left running once the iterator is closed.
+        return first, [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+
+    first, leftover = asyncio.run(first_then_stop())
+    assert first.ok
+    assert leftover == []
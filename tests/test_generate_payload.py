@@ -0,0 +1,65 @@
+import asyncio
+import base64
+import os
+
+import pytest
+
+from multi_ai_handler import generate_payload
+from multi_ai_handler.generate_payload import AttachmentChangedError, generate_claude_payload, generate_openai_payload, resolve_claude_payload, resolve_openai_payload
+from tests.stub_server import StubServer, chat_completion
+
+
+@pytest.fixture
+def image(tmp_path):
+    path = tmp_path / "pixel.png"
+    path.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(64))
+    return path
+
+
+def test_history_keeps_file_refs_until_resolved(image):
+    payload = generate_claude_payload("describe", file=image)
+
+    block = payload[-1]["content"][-1]
+    assert block["file_ref"]["filename"] == "pixel.png"
+    resolved = resolve_claude_payload(payload)
+    assert resolved[-1]["content"][-1]["source"]["data"] == base64.b64encode(image.read_bytes()).decode()
+    # Resolving doesn't touch the payload kept for history.
+    assert "file_ref" in payload[-1]["content"][-1]
+
+
+def test_modified_attachment_raises(image):
+    payload = generate_openai_payload("describe", "system", file=image)
+    image.write_bytes(image.read_bytes() + b"more")
+    os.utime(image, ns=(0, 0))
+
+    with pytest.raises(AttachmentChangedError, match="modified"):
+        resolve_openai_payload(payload)
+
+
+def test_deleted_attachment_raises(image):
+    payload = generate_claude_payload("describe", file=image)
+    image.unlink()
+
+    with pytest.raises(AttachmentChangedError, match="deleted"):
+        resolve_claude_payload(payload)
+
+
+def test_provider_builds_the_user_message_once(image, monkeypatch):
+    pytest.importorskip("openai")
+    from multi_ai_handler.providers.openai import OpenAIProvider
+
+    builds = []
+    build = generate_payload.build_openai_user_content
+    monkeypatch.setattr(generate_payload, "build_openai_user_content", lambda *args: builds.append(args) or build(*args))
+
+    with StubServer(lambda method, path, body: (200, chat_completion("a pixel"))) as server:
+        provider = OpenAIProvider(base_url=f"{server.url}/v1", api_key="test", max_retries=0)
+        response = provider.generate("system", user_text="describe", file=image, model="m")
+        assert len(builds) == 1
+        asyncio.run(provider.agenerate("system", user_text="describe", file=image, model="m", messages=response.history))
+        assert len(builds) == 2
+        provider.close()
+
+    # The history reuses the message that was sent, keeping the file as a reference.
+    assert response.history[0]["content"][-1]["file_ref"]["filename"] == "pixel.png"
+    assert response.history[1] == {"role": "assistant", "content": "a pixel"}
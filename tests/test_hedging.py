@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from multi_ai_handler import AIProviderManager, HedgePolicy
+from tests.fakes import FakeProvider
+
+
+def _manager(policy: HedgePolicy, **providers) -> AIProviderManager:
+    manager = AIProviderManager(hedge_policy=policy, fallbacks={"a": [("b", "m")]})
+    for name, config in providers.items():
+        manager.register_provider(name, FakeProvider, **config)
+    return manager
+
+
+def test_hedge_wins_when_original_stalls():
+    policy = HedgePolicy(delay=0.05, alternate=False)
+    manager = _manager(policy, a={"delays": (5.0, 0.0), "reply": "hedged"})
+
+    response = asyncio.run(manager.agenerate("a", "m", user_text="hi"))
+
+    assert response.content == "hedged"
+    assert manager.get_provider("a").calls == 2
+
+
+def test_cancelled_original_is_recorded_as_lower_bound():
+    policy = HedgePolicy(delay=0.05, alternate=False)
+    manager = _manager(policy, a={"delays": (5.0, 0.0)})
+
+    asyncio.run(manager.agenerate("a", "m", user_text="hi"))
+
+    # The winner's latency plus the cancelled original's time so far, which is at least the hedge delay.
+    assert policy.latencies.count("a", "m") == 2
+    assert policy.latencies.percentile("a", "m", 1.0) >= 0.05
+
+
+def test_stream_losers_are_recorded_too():
+    policy = HedgePolicy(delay=0.05)
+    manager = _manager(policy, a={"delay": 5.0}, b={"reply": "from b"})
+
+    async def consume() -> str:
+        return "".join([chunk async for chunk in manager.astream("a", "m", user_text="hi")])
+
+    assert asyncio.run(consume()) == "from b"
+    assert policy.latencies.count("b", "m") == 1
+    assert policy.latencies.percentile("a", "m", 1.0) >= 0.05
+
+
+def test_race_takes_first_valid_response():
+    policy = HedgePolicy(race=True, validate=lambda response: response.content != "bad")
+    manager = _manager(policy, a={"reply": "bad"}, b={"reply": "good", "delay": 0.05})
+
+    response = asyncio.run(manager.agenerate("a", "m", user_text="hi"))
+
+    assert response.content == "good"
+    assert manager.get_provider("a").calls == manager.get_provider("b").calls == 1
+
+
+class SlowUnwindProvider(FakeProvider):
+    """Never answers; when cancelled it takes a while to clean up, like a call releasing its connection."""
+
+    def __init__(self, **config):
+        super().__init__(**config)
+        self.unwound = 0
+
+    async def agenerate(self, *args, **kwargs):
+        self._next()
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            await asyncio.sleep(0.1)
+            self.unwound += 1
+            raise
+
+
+def test_cancelled_caller_waits_for_hedged_copies_to_unwind():
+    policy = HedgePolicy(delay=0.01, alternate=False)
+    manager = AIProviderManager(hedge_policy=policy)
+    manager.register_provider("a", SlowUnwindProvider)
+
+    async def main() -> int:
+        task = asyncio.ensure_future(manager.agenerate("a", "m", user_text="hi"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.sleep(0.03)
+        # Cancelled again while the copies are still unwinding.
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return manager.get_provider("a").unwound
+
+    assert asyncio.run(main()) == 2
@@ -0,0 +1,28 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+HEAVY = ["anthropic", "docling", "dotenv", "google.genai", "httpx", "ollama", "openai"]
+
+
+def _modules_after(code: str) -> list[str]:
+    """Which of the heavy modules a fresh interpreter has imported after running ``code``."""
+    script = f"import json, sys\n{code}\nprint(json.dumps([name for name in {HEAVY!r} if name in sys.modules]))"
+    output = subprocess.run([sys.executable, "-c", script], cwd=Path(__file__).parent.parent, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_importing_the_package_loads_no_sdks():
+    assert _modules_after("import multi_ai_handler") == []
+
+
+def test_creating_a_manager_loads_no_sdks():
+    assert _modules_after("import multi_ai_handler\nmulti_ai_handler.AIProviderManager()\nmulti_ai_handler.get_manager()") == []
+
+
+def test_a_provider_loads_only_its_own_sdk():
+    loaded = _modules_after("import multi_ai_handler\nmulti_ai_handler.OpenAIProvider")
+
+    assert "openai" in loaded
+    assert not {"anthropic", "google.genai", "ollama", "docling"} & set(loaded)
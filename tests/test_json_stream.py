@@ -0,0 +1,129 @@
+import asyncio
+import json
+
+import pytest
+
+from multi_ai_handler import AIProviderManager
+from multi_ai_handler.json_stream import JSONStreamParser
+from tests.fakes import FakeProvider
+
+
+def _parse(text: str, size: int) -> tuple[list, object]:
+    """Feed ``text`` in ``size``-character chunks; the events and the final value."""
+    parser = JSONStreamParser()
+    events = []
+    for start in range(0, len(text), size):
+        events.extend(parser.feed(text[start:start + size]))
+    events.extend(parser.finish())
+    return events, parser.value
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_object_fields_come_out_whole_at_any_split(size):
+    document = {"name": "a \"quoted\" \\ name", "tags": ["x", {"y": "}"}], "count": 3, "ok": True, "none": None, "text": "a,b]cé\\u"}
+    events, value = _parse(json.dumps(document), size)
+
+    assert value == document
+    assert events == list(document.items())
+
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_array_items_are_indexed(size):
+    events, value = _parse('[1, "two", [3], {"four": 4}]', size)
+
+    assert value == [1, "two", [3], {"four": 4}]
+    assert events == [(0, 1), (1, "two"), (2, [3]), (3, {"four": 4})]
+
+
+def test_each_field_is_reported_when_it_closes():
+    parser = JSONStreamParser()
+
+    assert parser.feed('{"a": 1, "b": "par') == [("a", 1)]
+    assert parser.value == {"a": 1}
+    assert parser.feed('tial", "c"') == [("b", "partial")]
+    assert parser.feed(": [1, 2]}") == [("c", [1, 2])]
+    assert parser.finish() == []
+
+
+def test_escape_split_across_chunks():
+    parser = JSONStreamParser()
+    events = parser.feed('{"a": "x\\') + parser.feed('"y", "b": 1}')
+
+    assert events == [("a", 'x"y'), ("b", 1)]
+
+
+@pytest.mark.parametrize("text", [
+    '```json\n{"a": 1}\n```',
+    'Here is the result:\n```json\n{"a": 1}\n```\nDone.',
+    '  \n{"a": 1}',
+])
+def test_fences_and_prose_are_skipped(text):
+    for size in (1, 5, 1000):
+        events, value = _parse(text, size)
+        assert value == {"a": 1}
+        assert events == [("a", 1)]
+
+
+@pytest.mark.parametrize("text, expected", [("42", 42), ('"text"', "text"), ("true", True), ("null", None), ("```json\n-1.5\n```", -1.5)])
+def test_top_level_scalars_come_from_finish(text, expected):
+    events, value = _parse(text, 1)
+
+    assert events == [(None, expected)]
+    assert value == expected
+
+
+def test_empty_containers():
+    assert _parse("{}", 1) == ([], {})
+    assert _parse("[]", 1) == ([], [])
+
+
+@pytest.mark.parametrize("text", ['{"a": 1,, "b": 2}', '{"a" 1}', '{"a": 1]', '{"a": 1 "b": 2}', "[1, }"])
+def test_malformed_json_raises_as_the_field_closes(text):
+    parser = JSONStreamParser()
+    with pytest.raises(json.JSONDecodeError):
+        parser.feed(text)
+
+
+@pytest.mark.parametrize("text", ['{"a": 1', '{"a": "open', "no json here", ""])
+def test_incomplete_json_raises_on_finish(text):
+    parser = JSONStreamParser()
+    parser.feed(text)
+    with pytest.raises(json.JSONDecodeError):
+        parser.finish()
+
+
+def test_text_after_the_value_is_ignored():
+    events, value = _parse('{"a": 1}\n```\nThat is all. {"b": 2}', 3)
+
+    assert events == [("a", 1)]
+    assert value == {"a": 1}
+
+
+def _manager(reply: str) -> AIProviderManager:
+    manager = AIProviderManager()
+    manager.register_provider("fake", FakeProvider, reply=reply, chunk_size=3)
+    return manager
+
+
+def test_manager_streams_json_fields():
+    manager = _manager('```json\n{"title": "T", "items": [1, 2]}\n```')
+
+    result = manager.stream("fake", "m", user_text="hi", json_output=True)
+
+    assert list(result) == [("title", "T"), ("items", [1, 2])]
+    assert result.value == {"title": "T", "items": [1, 2]}
+    assert result.finish_reason == "stop"
+
+
+def test_manager_async_stream_closes_on_malformed_json():
+    manager = _manager('{"a": 1, "b": oops, "c": 3}')
+
+    async def run():
+        result = manager.astream("fake", "m", user_text="hi", json_output=True)
+        fields = []
+        with pytest.raises(json.JSONDecodeError):
+            async for field in result:
+                fields.append(field)
+        return fields
+
+    assert asyncio.run(run()) == [("a", 1)]
@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+import pytest
+
+from multi_ai_handler import AIProviderManager, metrics
+from multi_ai_handler.metrics import LATENCY_BUCKETS, RATE_BUCKETS, Histogram, MetricsRegistry
+from tests.fakes import FakeProvider
+from tests.stub_server import StubServer, chat_completion
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = Histogram((1.0, 2.0, 4.0))
+    for value in (0.5, 1.0, 1.5, 3.0, 10.0):
+        histogram.observe(value)
+
+    # Upper bounds are inclusive, as Prometheus ``le``; the last slot is +Inf.
+    assert histogram.counts == [2, 1, 1, 1]
+    assert (histogram.count, histogram.sum, histogram.max) == (5, 16.0, 10.0)
+    assert histogram.percentile(0.2) == pytest.approx(0.5)
+    assert histogram.percentile(0.5) == pytest.approx(1.5)
+    assert histogram.percentile(1.0) == 10.0
+    assert Histogram().percentile(0.5) is None
+
+
+def test_registry_picks_buckets_by_name_and_reports_to_the_callback():
+    seen = []
+    registry = MetricsRegistry(callback=lambda name, labels, value: seen.append((name, labels["provider"], value)))
+    registry.observe("latency_seconds", "p", "m", 0.2)
+    registry.observe("chunks_per_second", "p", "m", 30)
+    registry.increment("requests_total", "p", "m")
+    registry.increment("requests_total", "p", "m", 2)
+
+    assert registry.histogram("latency_seconds", "p", "m").buckets == LATENCY_BUCKETS
+    assert registry.histogram("chunks_per_second", "p", "m").buckets == RATE_BUCKETS
+    assert registry.counter("requests_total", "p", "m") == 3
+    assert registry.counter("requests_total", "other", "m") == 0
+    assert seen == [("latency_seconds", "p", 0.2), ("chunks_per_second", "p", 30), ("requests_total", "p", 1), ("requests_total", "p", 2)]
+
+    snapshot = registry.snapshot(percentiles=(0.5,))[("p", "m")]
+    assert snapshot["latency_seconds"]["count"] == 1
+    # Interpolated halfway through the 0.1-0.25 bucket.
+    assert snapshot["latency_seconds"]["p50"] == pytest.approx(0.175)
+    assert snapshot["requests_total"] == 3
+
+    registry.clear()
+    assert registry.snapshot() == {}
+
+
+def test_prometheus_text_format():
+    registry = MetricsRegistry(namespace="app")
+    registry.observe("latency_seconds", 'we"ird', "m", 0.007)
+    registry.observe("latency_seconds", 'we"ird', "m", 100)
+    registry.increment("errors_total", "p", "m", 2)
+
+    lines = registry.to_prometheus().splitlines()
+
+    labels = 'provider="we\\"ird",model="m"'
+    assert lines[0] == "# TYPE app_latency_seconds histogram"
+    assert lines[1] == f'app_latency_seconds_bucket{{{labels},le="0.005"}} 0'
+    assert lines[2] == f'app_latency_seconds_bucket{{{labels},le="0.01"}} 1'
+    assert f'app_latency_seconds_bucket{{{labels},le="60"}} 1' in lines
+    assert f'app_latency_seconds_bucket{{{labels},le="120"}} 2' in lines
+    assert f'app_latency_seconds_bucket{{{labels},le="+Inf"}} 2' in lines
+    assert f"app_latency_seconds_sum{{{labels}}} 100.007" in lines
+    assert f"app_latency_seconds_count{{{labels}}} 2" in lines
+    assert lines[-2:] == ["# TYPE app_errors_total counter", 'app_errors_total{provider="p",model="m"} 2']
+
+
+def test_timed_records_only_inside_a_scope():
+    registry = MetricsRegistry()
+    with metrics.timed("build_seconds"):
+        pass
+    with metrics.scope(None, "p", "m"), metrics.timed("build_seconds"):
+        pass
+    assert registry.snapshot() == {}
+
+    with metrics.scope(registry, "p", "m"):
+        with metrics.timed("build_seconds"):
+            time.sleep(0.01)
+    with metrics.timed("build_seconds"):
+        pass
+
+    histogram = registry.histogram("build_seconds", "p", "m")
+    assert histogram.count == 1 and histogram.sum >= 0.01
+
+
+def test_scope_is_per_task():
+    registry = MetricsRegistry()
+
+    async def build(provider: str) -> None:
+        with metrics.scope(registry, provider, "m"):
+            await asyncio.sleep(0.01)
+            with metrics.timed("build_seconds"):
+                pass
+
+    async def main() -> None:
+        await asyncio.gather(build("a"), build("b"))
+
+    asyncio.run(main())
+    assert registry.histogram("build_seconds", "a", "m").count == 1
+    assert registry.histogram("build_seconds", "b", "m").count == 1
+
+
+def test_manager_records_calls_and_errors():
+    registry = MetricsRegistry()
+    manager = AIProviderManager(metrics=registry)
+    manager.register_provider("fake", FakeProvider, reply="hello", delay=0.01)
+    manager.register_provider("broken", FakeProvider, error=ValueError("bad request"))
+
+    manager.generate("fake", "m", user_text="hi")
+    assert "".join(manager.stream("fake", "m", user_text="hi")) == "hello"
+    with pytest.raises(ValueError):
+        manager.generate("broken", "m", user_text="hi")
+
+    assert registry.counter("requests_total", "fake", "m") == 2
+    assert registry.counter("output_tokens_total", "fake", "m") == 2 * len("hello")
+    assert registry.histogram("latency_seconds", "fake", "m").count == 2
+    assert registry.histogram("latency_seconds", "fake", "m").sum >= 0.02
+    assert registry.histogram("ttft_seconds", "fake", "m").count == 1
+    assert registry.histogram("chunks_per_second", "fake", "m").count == 1
+    assert registry.counter("errors_total", "broken", "m") == 1
+    assert registry.histogram("latency_seconds", "broken", "m") is None
+
+
+def test_provider_call_records_payload_build_time():
+    registry = MetricsRegistry()
+    manager = AIProviderManager(metrics=registry)
+
+    with StubServer(lambda method, path, body: (200, chat_completion("Hello"))) as server:
+        manager.register_provider("compat", "multi_ai_handler.providers.openai:OpenAIProvider", base_url=f"{server.url}/v1", api_key="test", max_retries=0)
+        assert manager.generate("compat", "m", user_text="hi").content == "Hello"
+        assert asyncio.run(manager.agenerate("compat", "m", user_text="hi")).content == "Hello"
+        manager.close()
+
+    # Labelled with the registered name, not the provider class.
+    assert registry.histogram("payload_build_seconds", "compat", "m").count == 2
+    assert registry.histogram("latency_seconds", "compat", "m").count == 2
+    assert registry.counter("input_tokens_total", "compat", "m") == 6
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("ollama")
+
+from multi_ai_handler.metrics import MetricsRegistry
+from multi_ai_handler.providers.ollama import OllamaProvider, OllamaServerError
+from tests.stub_server import StubServer
+
+
+class OllamaHost:
+    """Handler for a stub Ollama server that answers chats with its own name."""
+
+    def __init__(self, name: str, loaded: tuple[str, ...] = (), up: bool = True, delay: float = 0.0, load_duration: int = 0):
+        self.name = name
+        self.loaded = list(loaded)
+        self.up = up
+        self.delay = delay
+        self.load_duration = load_duration
+        # Chats break off without a response, like a server that crashed mid-request.
+        self.drop = False
+        # Most chats in progress at once.
+        self.peak = 0
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, method: str, path: str, body: bytes) -> tuple:
+        if not self.up:
+            return 503, {"error": "starting"}
+        if path == "/api/ps":
+            return 200, {"models": [{"name": name, "model": name} for name in self.loaded]}
+        if path == "/api/chat":
+            if self.drop:
+                raise ConnectionResetError("dropped")
+            with self._lock:
+                self._active += 1
+                self.peak = max(self.peak, self._active)
+            time.sleep(self.delay)
+            with self._lock:
+                self._active -= 1
+            request = json.loads(body)
+            message = {"role": "assistant", "content": self.name}
+            done = {"model": request["model"], "created_at": "2024-01-01T00:00:00Z", "done": True, "done_reason": "stop", "prompt_eval_count": 3, "eval_count": 1, "load_duration": self.load_duration}
+            if not request.get("stream"):
+                return 200, {**done, "message": message}
+            chunks = [{"model": request["model"], "created_at": "2024-01-01T00:00:00Z", "message": message, "done": False}, {**done, "message": {"role": "assistant", "content": ""}}]
+            return 200, "".join(json.dumps(chunk) + "\n" for chunk in chunks), {"content-type": "application/x-ndjson"}
+        return 404, {"error": "not found"}
+
+
+def _chats(server: StubServer) -> int:
+    return len(server.paths("POST"))
+
+
+def _probes(server: StubServer) -> int:
+    return server.paths("GET").count("/api/ps")
+
+
+def _wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.02)
+
+
+def test_health_is_cached_for_the_ttl():
+    with StubServer(OllamaHost("a")) as a:
+        provider = OllamaProvider(base_url=a.url, health_ttl=0.2)
+        for i in range(5):
+            provider.generate("", user_text=str(i), model="m")
+        assert _probes(a) == 1
+
+        time.sleep(0.25)
+        # Past the TTL the request goes ahead while the server is re-checked in the background.
+        assert provider.generate("", user_text="hi", model="m").content == "a"
+        _wait_for(lambda: _probes(a) == 2)
+        provider.generate("", user_text="hi", model="m")
+        assert _probes(a) == 2
+        assert _chats(a) == 7
+
+
+def test_concurrent_first_requests_share_one_check():
+    with StubServer(OllamaHost("a")) as a:
+        provider = OllamaProvider(base_url=a.url)
+        threads = [threading.Thread(target=provider.generate, args=("",), kwargs={"user_text": str(i), "model": "m"}) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        async def burst():
+            await asyncio.gather(*(provider.agenerate("", user_text=str(i), model="m") for i in range(4)))
+
+        asyncio.run(burst())
+
+    assert _probes(a) == 1
+    assert _chats(a) == 12
+
+
+def test_requests_spread_over_hosts_with_free_slots():
+    with StubServer(OllamaHost("a", loaded=("m:latest",), delay=0.1)) as a, StubServer(OllamaHost("b", delay=0.1)) as b:
+        provider = OllamaProvider(base_url=[a.url, b.url], parallel=2)
+
+        async def burst():
+            return await asyncio.gather(*(provider.agenerate("", user_text=str(i), model="m") for i in range(4)))
+
+        replies = [response.content for response in asyncio.run(burst())]
+
+        # The host with the model loaded is preferred only while it has free slots.
+        assert sorted(replies) == ["a", "a", "b", "b"]
+
+
+def test_prefers_host_with_model_loaded():
+    with StubServer(OllamaHost("a")) as a, StubServer(OllamaHost("b", loaded=("m:latest",))) as b:
+        provider = OllamaProvider(base_url=[a.url, b.url])
+
+        replies = {provider.generate("", user_text=str(i), model="m").content for i in range(5)}
+
+        assert replies == {"b"}
+        assert _chats(a) == 0
+
+
+def test_stream_reports_host_reply_and_usage():
+    with StubServer(OllamaHost("a")) as a:
+        provider = OllamaProvider(base_url=[a.url])
+
+        result = provider.stream("", user_text="hi", model="m")
+
+        assert "".join(result) == "a"
+        assert result.usage.output_tokens == 1
+
+
+def test_down_host_is_skipped_and_reported():
+    with StubServer(OllamaHost("a")) as a:
+        provider = OllamaProvider(base_url=[a.url, "http://127.0.0.1:1"])
+
+        replies = {provider.generate("", user_text=str(i), model="m").content for i in range(3)}
+
+        assert replies == {"a"}
+        status = provider.host_status()
+        assert [host["healthy"] for host in status] == [True, False]
+        assert "not running" in status[1]["error"]
+
+
+def test_host_that_drops_is_ejected():
+    host = OllamaHost("a", loaded=("m:latest",))
+    with StubServer(host) as a, StubServer(OllamaHost("b")) as b:
+        provider = OllamaProvider(base_url=[a.url, b.url])
+        assert provider.generate("", user_text="hi", model="m").content == "a"
+
+        host.drop = True
+        with pytest.raises(httpx.TransportError):
+            provider.generate("", user_text="hi", model="m")
+
+        assert provider.host_status()[0]["healthy"] is False
+        assert provider.generate("", user_text="hi", model="m").content == "b"
+
+
+def test_ejected_host_is_readmitted_after_ttl():
+    host = OllamaHost("a", loaded=("m:latest",), up=False)
+    with StubServer(host) as a, StubServer(OllamaHost("b")) as b:
+        provider = OllamaProvider(base_url=[a.url, b.url], health_ttl=0.1)
+
+        assert provider.generate("", user_text="hi", model="n").content == "b"
+        assert provider.host_status()[0]["healthy"] is False
+
+        host.up = True
+        time.sleep(0.15)
+        provider.generate("", user_text="hi", model="n")  # starts the background re-check
+        deadline = time.monotonic() + 2
+        while not provider.host_status()[0]["healthy"] and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+        assert provider.generate("", user_text="hi", model="m").content == "a"
+
+
+def test_all_hosts_down_raises():
+    host = OllamaHost("a", up=False)
+    with StubServer(host) as a:
+        provider = OllamaProvider(base_url=[a.url, "http://127.0.0.1:1"])
+
+        with pytest.raises(OllamaServerError, match="No Ollama server is available"):
+            provider.generate("", user_text="hi", model="m")
+
+        # With every server down, the next request re-checks them at once.
+        host.up = True
+        assert provider.generate("", user_text="hi", model="m").content == "a"
+
+
+def test_parallel_caps_requests_per_model():
+    host = OllamaHost("a", delay=0.05)
+    with StubServer(host) as a:
+        provider = OllamaProvider(base_url=a.url, parallel=2)
+        provider.metrics = MetricsRegistry()
+
+        async def burst():
+            return await asyncio.gather(*(provider.agenerate("", user_text=str(i), model=model) for i in range(6) for model in ("m", "n")))
+
+        assert len(asyncio.run(burst())) == 12
+
+    # Two slots for each model, and the rest waited here.
+    assert host.peak == 4
+    waits = provider.metrics.histogram("slot_wait_seconds", "ollama", "m")
+    assert waits.count == 6 and waits.max >= 0.05
+
+
+def test_keep_alive_and_options_are_sent_with_every_request():
+    with StubServer(OllamaHost("a")) as a:
+        provider = OllamaProvider(base_url=a.url, keep_alive="1h", num_ctx=4096, num_thread=8)
+        provider.generate("", user_text="hi", model="m", temperature=0.5)
+        "".join(provider.stream("", user_text="hi", model="m"))
+
+        for index, temperature in ((-2, 0.5), (-1, 0.0)):
+            body = a.json(index)
+            assert body["keep_alive"] == "1h"
+            assert body["options"] == {"num_ctx": 4096, "num_thread": 8, "temperature": temperature}
+
+
+def test_preload_and_unload_on_every_host():
+    with StubServer(OllamaHost("a", load_duration=2_000_000_000)) as a, StubServer(OllamaHost("b", load_duration=500_000_000)) as b:
+        provider = OllamaProvider(base_url=[a.url, b.url], keep_alive=-1, num_ctx=4096)
+
+        # The slowest server's load time.
+        assert provider.preload("m") == pytest.approx(2.0)
+        for server in (a, b):
+            body = server.json()
+            assert (body["messages"], body["options"], body["keep_alive"]) == ([], {"num_ctx": 4096}, -1)
+        assert [host["loaded"] for host in provider.host_status()] == [["m:latest"], ["m:latest"]]
+
+        provider.unload("m")
+        assert [server.json()["keep_alive"] for server in (a, b)] == [0, 0]
+        assert [host["loaded"] for host in provider.host_status()] == [[], []]
+
+        assert asyncio.run(provider.apreload("m", keep_alive="10m")) == pytest.approx(2.0)
+        assert [server.json()["keep_alive"] for server in (a, b)] == ["10m", "10m"]
+        asyncio.run(provider.aunload("m"))
+        assert [host["loaded"] for host in provider.host_status()] == [[], []]
+
+
+def test_unknown_options_raise():
+    with pytest.raises(ValueError, match="did you mean 'num_ctx'"):
+        OllamaProvider(num_ctxt=4096)
+    with pytest.raises(ValueError, match="per request"):
+        OllamaProvider(temperature=0.3)
+    OllamaProvider(num_ctx=4096, num_gpu=1, seed=7, stop=["\\n"])
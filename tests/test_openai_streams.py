@@ -0,0 +1,43 @@
+import asyncio
+import json
+
+from multi_ai_handler import AIProviderManager
+from tests.stub_server import StubServer, chat_stream
+
+
+def _strict_server(method, path, body):
+    """An OpenAI-compatible server that rejects stream_options."""
+    if "stream_options" in json.loads(body):
+        return 400, {"error": {"message": "Unrecognized request argument supplied: stream_options", "type": "invalid_request_error"}}
+    return 200, chat_stream("Hel", "lo"), {"content-type": "text/event-stream"}
+
+
+def _manager(url: str, **config) -> AIProviderManager:
+    manager = AIProviderManager()
+    manager.register_provider("compat", "multi_ai_handler.providers.openai:OpenAIProvider", base_url=f"{url}/v1", api_key="test", max_retries=0, **config)
+    return manager
+
+
+def test_stream_options_dropped_for_servers_that_reject_them():
+    with StubServer(_strict_server) as server:
+        manager = _manager(server.url)
+        assert "".join(manager.stream("compat", "m", user_text="hi")) == "Hello"
+        assert "".join(manager.stream("compat", "m", user_text="hi")) == "Hello"
+    # Rejected once, then remembered.
+    assert ["stream_options" in json.loads(body) for _, _, body in server.requests] == [True, False, False]
+
+
+def test_async_stream_options_dropped():
+    async def consume(manager) -> str:
+        return "".join([chunk async for chunk in manager.astream("compat", "m", user_text="hi")])
+
+    with StubServer(_strict_server) as server:
+        assert asyncio.run(consume(_manager(server.url))) == "Hello"
+    assert len(server.requests) == 2
+
+
+def test_stream_usage_can_be_turned_off():
+    with StubServer(_strict_server) as server:
+        manager = _manager(server.url, stream_usage=False)
+        assert "".join(manager.stream("compat", "m", user_text="hi")) == "Hello"
+    assert len(server.requests) == 1
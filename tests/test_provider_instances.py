@@ -0,0 +1,135 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from multi_ai_handler import AIProviderManager
+from multi_ai_handler.utils import LoopLocal
+from tests.fakes import FakeProvider
+
+
+class SlowFakeProvider(FakeProvider):
+    """Counts constructions; construction is slow enough for concurrent callers to overlap."""
+
+    built = 0
+
+    def __init__(self, **config):
+        type(self).built += 1
+        time.sleep(0.05)
+        super().__init__(**config)
+        self.closed = 0
+
+    def close(self) -> None:
+        self.closed += 1
+
+
+def test_instances_are_shared_per_name_and_config():
+    manager = AIProviderManager()
+    manager.register_provider("fake", FakeProvider, reply="a")
+
+    assert manager.get_provider("fake") is manager.get_provider("fake")
+    assert manager.get_provider("fake", reply="b") is manager.get_provider("fake", reply="b")
+    assert manager.get_provider("fake", reply="b") is not manager.get_provider("fake")
+    # An override equal to the registered config is the same instance.
+    assert manager.get_provider("fake", reply="a") is manager.get_provider("fake")
+
+
+def test_concurrent_first_calls_build_one_instance():
+    SlowFakeProvider.built = 0
+    manager = AIProviderManager()
+    manager.register_provider("fake", SlowFakeProvider)
+    instances = []
+    threads = [threading.Thread(target=lambda: instances.append(manager.get_provider("fake"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert SlowFakeProvider.built == 1
+    assert all(instance is instances[0] for instance in instances)
+
+
+def test_close_and_aclose_release_instances():
+    manager = AIProviderManager()
+    manager.register_provider("fake", SlowFakeProvider)
+    first = manager.get_provider("fake")
+    manager.close()
+    assert first.closed == 1
+
+    second = manager.get_provider("fake")
+    assert second is not first
+    asyncio.run(manager.aclose())
+    assert second.closed == 1
+    assert manager.get_provider("fake") is not second
+
+
+class _Client:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self) -> None:
+        self.closed = True
+
+
+def _loop_local() -> LoopLocal:
+    return LoopLocal(_Client, close=lambda client: client.close())
+
+
+def test_loop_local_is_per_loop_and_closed_when_the_loop_ends():
+    clients = _loop_local()
+
+    async def get() -> _Client:
+        assert clients.get() is clients.get()
+        return clients.get()
+
+    first, second = asyncio.run(get()), asyncio.run(get())
+
+    assert first is not second
+    assert first.closed and second.closed
+
+
+def test_loop_local_aclose_and_clear():
+    clients = _loop_local()
+    started, stop = threading.Event(), threading.Event()
+    other = []
+
+    async def hold():
+        other.append(clients.get())
+        started.set()
+        while not stop.is_set():
+            await asyncio.sleep(0.01)
+
+    thread = threading.Thread(target=lambda: asyncio.run(hold()))
+    thread.start()
+    started.wait(5)
+
+    async def main() -> _Client:
+        client = clients.get()
+        await clients.aclose()
+        assert client.closed
+        return client
+
+    asyncio.run(main())
+    # aclose also forgets the other loop's client and closes it on that loop while it keeps running.
+    deadline = time.monotonic() + 2
+    while not other[0].closed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    closed = other[0].closed
+    stop.set()
+    thread.join()
+    assert closed
+
+
+def test_sdk_async_clients_are_closed_with_their_loop():
+    openai = pytest.importorskip("openai")
+    from multi_ai_handler.providers.openai import OpenAIProvider
+
+    provider = OpenAIProvider(base_url="http://127.0.0.1:1/v1", api_key="test")
+
+    async def client() -> "openai.AsyncOpenAI":
+        return provider.async_client
+
+    first = asyncio.run(client())
+    assert first.is_closed()
+    assert asyncio.run(client()) is not first
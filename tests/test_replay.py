@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+
+from multi_ai_handler import AIProviderManager
+from multi_ai_handler.providers.replay import Cassette, CassetteMissError, ReplayProvider
+from tests.fakes import FakeProvider
+
+
+def _manager(cassette, mode: str, **config) -> AIProviderManager:
+    manager = AIProviderManager()
+    if mode == "record":
+        config.setdefault("upstream", FakeProvider)
+    manager.register_provider("llm", ReplayProvider, cassette=cassette, mode=mode, **config)
+    return manager
+
+
+def test_generate_replays_recording(tmp_path):
+    cassette = tmp_path / "cassette.db"
+    recorder = _manager(cassette, "record", reply="recorded")
+    recorded = recorder.generate("llm", "m", system_prompt="sys", user_text="hi")
+    asyncio.run(recorder.agenerate("llm", "m", user_text="async"))
+    recorder.close()
+
+    player = _manager(cassette, "replay")
+    replayed = player.generate("llm", "m", system_prompt="sys", user_text="hi")
+
+    assert replayed.content == recorded.content == "recorded"
+    assert replayed.history == recorded.history
+    assert replayed.usage == recorded.usage
+    assert asyncio.run(player.agenerate("llm", "m", user_text="async")).content == "recorded"
+    assert player.get_provider("llm").list_models() == ["m"]
+
+
+def test_unrecorded_request_raises(tmp_path):
+    cassette = tmp_path / "cassette.db"
+    _manager(cassette, "record").generate("llm", "m", user_text="hi")
+
+    player = _manager(cassette, "replay")
+    with pytest.raises(CassetteMissError):
+        player.generate("llm", "m", user_text="something else")
+    with pytest.raises(CassetteMissError):
+        player.generate("llm", "other-model", user_text="hi")
+    # A generate recording doesn't answer a stream of the same request.
+    with pytest.raises(CassetteMissError):
+        list(player.stream("llm", "m", user_text="hi"))
+
+
+def test_stream_replays_chunks_and_info(tmp_path):
+    cassette = tmp_path / "cassette.db"
+    recorder = _manager(cassette, "record", reply="chunked reply", chunk_size=4)
+    assert "".join(recorder.stream("llm", "m", user_text="hi")) == "chunked reply"
+
+    player = _manager(cassette, "replay")
+    result = player.stream("llm", "m", user_text="hi")
+
+    assert list(result) == ["chun", "ked ", "repl", "y"]
+    assert result.finish_reason == "stop"
+    assert result.usage.output_tokens == len("chunked reply")
+
+
+def test_async_stream_round_trip(tmp_path):
+    cassette = tmp_path / "cassette.db"
+
+    async def collect(manager: AIProviderManager) -> list:
+        return [chunk async for chunk in manager.astream("llm", "m", user_text="hi")]
+
+    recorded = asyncio.run(collect(_manager(cassette, "record", reply="abcdef")))
+    assert asyncio.run(collect(_manager(cassette, "replay"))) == recorded == ["ab", "cd", "ef"]
+
+
+def test_abandoned_stream_is_not_recorded(tmp_path):
+    cassette = tmp_path / "cassette.db"
+    stream = _manager(cassette, "record", reply="abcdef").stream("llm", "m", user_text="hi")
+    next(stream)
+    stream.close()
+
+    assert len(Cassette(cassette, readonly=True)) == 0
+
+
+def test_realtime_replay_keeps_recorded_latency(tmp_path):
+    cassette = tmp_path / "cassette.db"
+    _manager(cassette, "record", delay=0.1).generate("llm", "m", user_text="hi")
+
+    fast, realtime = _manager(cassette, "replay"), _manager(cassette, "replay", realtime=True)
+    start = time.perf_counter()
+    fast.generate("llm", "m", user_text="hi")
+    assert time.perf_counter() - start < 0.05
+
+    start = time.perf_counter()
+    realtime.generate("llm", "m", user_text="hi")
+    assert time.perf_counter() - start >= 0.1
+
+
+def test_misses_are_not_retried(tmp_path):
+    cassette = tmp_path / "cassette.db"
+    _manager(cassette, "record").generate("llm", "m", user_text="hi")
+
+    assert not ReplayProvider(cassette).is_retryable(CassetteMissError("miss"))
+
+
+def test_invalid_modes():
+    with pytest.raises(ValueError):
+        ReplayProvider("unused.db", mode="rewind")
+    with pytest.raises(ValueError, match="needs the provider"):
+        ReplayProvider("unused.db", mode="record")
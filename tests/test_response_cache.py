@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from multi_ai_handler import AIProviderManager, response_cache
+from multi_ai_handler.cache import SQLiteCache
+from multi_ai_handler.response_cache import ResponseCache, request_key
+from tests.fakes import FakeProvider
+
+
+def _manager(cache: ResponseCache, **config) -> AIProviderManager:
+    manager = AIProviderManager(response_cache=cache)
+    manager.register_provider("fake", FakeProvider, **config)
+    return manager
+
+
+def test_request_key_covers_request_and_config():
+    base = ("fake", {}, "m", "sys", "hi", None, None, 0.2, False, False)
+    assert request_key(*base) == request_key(*base)
+    assert request_key(*base) != request_key("fake", {}, "m", "sys", "hi", None, None, 0.7, False, False)
+    assert request_key(*base) != request_key("fake", {"reply": "x"}, "m", "sys", "hi", None, None, 0.2, False, False)
+
+
+def test_request_key_uses_file_content(tmp_path):
+    first, second = tmp_path / "a", tmp_path / "b"
+    first.write_text("same")
+    second.mkdir()
+    (second / "a").write_text("same")
+
+    key = lambda file: request_key("fake", {}, "m", None, "hi", None, file, 0.2, False, False)
+    assert key(first) == key(second / "a")
+    (second / "a").write_text("changed")
+    assert key(first) != key(second / "a")
+
+
+def test_repeat_generate_is_served_from_cache():
+    manager = _manager(ResponseCache(), reply="cached")
+
+    first = manager.generate("fake", "m", user_text="hi")
+    second = asyncio.run(manager.agenerate("fake", "m", user_text="hi"))
+
+    assert second.content == first.content == "cached"
+    assert second.history == first.history
+    assert manager.get_provider("fake").calls == 1
+
+    manager.generate("fake", "m", user_text="other")
+    assert manager.get_provider("fake").calls == 2
+
+
+def test_stream_is_replayed_from_cache():
+    manager = _manager(ResponseCache(chunk_size=3), reply="streamed reply")
+
+    assert "".join(manager.stream("fake", "m", user_text="hi")) == "streamed reply"
+    replayed = list(manager.stream("fake", "m", user_text="hi"))
+
+    assert "".join(replayed) == "streamed reply"
+    assert replayed[0] == "str"
+    assert manager.get_provider("fake").calls == 1
+
+
+def test_failed_requests_are_not_cached():
+    manager = _manager(ResponseCache(), errors=(RuntimeError("boom"),))
+
+    with pytest.raises(RuntimeError):
+        manager.generate("fake", "m", user_text="hi")
+    assert manager.generate("fake", "m", user_text="hi").content == "ok"
+    assert manager.get_provider("fake").calls == 2
+
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=0.05)
+    cache.set("k", "v", [])
+    assert cache.get("k")["content"] == "v"
+
+    time.sleep(0.06)
+    assert cache.get("k") is None
+    assert cache.replay("k") is None
+
+
+def test_persistent_backend_is_shared(tmp_path):
+    first = _manager(ResponseCache(backend=SQLiteCache(tmp_path / "responses.db")))
+    first.generate("fake", "m", user_text="hi")
+
+    second = _manager(ResponseCache(backend=SQLiteCache(tmp_path / "responses.db")))
+    assert second.generate("fake", "m", user_text="hi").content == "ok"
+    assert second.get_provider("fake").calls == 0
+
+
+def test_async_keys_hash_files_off_the_event_loop(tmp_path, monkeypatch):
+    file = tmp_path / "doc.txt"
+    file.write_text("content")
+    threads = []
+    digest = response_cache._file_digest
+    monkeypatch.setattr(response_cache, "_file_digest", lambda file: threads.append(threading.get_ident()) or digest(file))
+    manager = _manager(ResponseCache())
+
+    async def run():
+        await manager.agenerate("fake", "m", user_text="hi", file=file)
+        assert "".join([chunk async for chunk in manager.astream("fake", "m", user_text="hi", file=file)]) == "ok"
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 2
+    assert loop_thread not in threads
@@ -0,0 +1,87 @@
+import pytest
+
+from multi_ai_handler import AIProviderManager, RetryPolicy
+from multi_ai_handler.retry import RetryBudget, is_retryable
+from tests.fakes import FakeProvider
+from tests.stub_server import StubServer, chat_completion, error
+
+
+def _faulty(failures: int, status: int = 503):
+    """Fail the first ``failures`` requests with ``status``, then answer."""
+    def handler(method, path, body):
+        if len(server.requests) <= failures:
+            return error(status)
+        return 200, chat_completion("recovered")
+    server = StubServer(handler)
+    return server
+
+
+def _manager(url: str, retry_policy: RetryPolicy | None, **config) -> AIProviderManager:
+    manager = AIProviderManager(retry_policy=retry_policy)
+    manager.register_provider("openai", "multi_ai_handler.providers.openai:OpenAIProvider", base_url=f"{url}/v1", api_key="test", **config)
+    return manager
+
+
+def test_policy_retries_transient_errors_without_sdk_retries():
+    with _faulty(2) as server:
+        manager = _manager(server.url, RetryPolicy(max_attempts=3, base_delay=0.001))
+        assert manager.generate("openai", "m", user_text="hi").content == "recovered"
+    # Each policy attempt is one request; the SDK's own retries are switched off.
+    assert len(server.requests) == 3
+
+
+def test_sdk_retries_are_not_multiplied_by_the_policy():
+    with _faulty(100) as server:
+        manager = _manager(server.url, RetryPolicy(max_attempts=2, base_delay=0.001))
+        with pytest.raises(Exception) as exc:
+            manager.generate("openai", "m", user_text="hi")
+    assert getattr(exc.value, "status_code", None) == 503
+    assert len(server.requests) == 2
+
+
+def test_explicit_max_retries_is_kept():
+    with _faulty(1) as server:
+        manager = _manager(server.url, RetryPolicy(max_attempts=1), max_retries=1)
+        assert manager.generate("openai", "m", user_text="hi").content == "recovered"
+    assert len(server.requests) == 2
+
+
+@pytest.mark.parametrize("provider", ["openrouter:OpenrouterProvider", "cerebras:CerebrasProvider"])
+def test_openai_compatible_providers_take_the_openai_config(provider):
+    with _faulty(2) as server:
+        manager = AIProviderManager(retry_policy=RetryPolicy(max_attempts=3, base_delay=0.001))
+        manager.register_provider("compat", f"multi_ai_handler.providers.{provider}", base_url=f"{server.url}/v1", api_key="test")
+        assert manager.generate("compat", "m", user_text="hi").content == "recovered"
+    assert len(server.requests) == 3
+
+
+def test_recording_upstream_leaves_retries_to_the_policy(tmp_path):
+    with _faulty(100) as server:
+        manager = AIProviderManager(retry_policy=RetryPolicy(max_attempts=2, base_delay=0.001))
+        manager.register_provider("llm", "multi_ai_handler.providers.replay:ReplayProvider", cassette=tmp_path / "cassette.db", mode="record", upstream="multi_ai_handler.providers.openai:OpenAIProvider", base_url=f"{server.url}/v1", api_key="test")
+        with pytest.raises(Exception) as exc:
+            manager.generate("llm", "m", user_text="hi")
+    assert getattr(exc.value, "status_code", None) == 503
+    assert len(server.requests) == 2
+
+
+def test_non_retryable_errors_are_raised_at_once():
+    with _faulty(100, status=400) as server:
+        manager = _manager(server.url, RetryPolicy(max_attempts=4, base_delay=0.001))
+        with pytest.raises(Exception):
+            manager.generate("openai", "m", user_text="hi")
+    assert len(server.requests) == 1
+
+
+def test_retry_budget_caps_retries():
+    manager = AIProviderManager(retry_policy=RetryPolicy(max_attempts=5, base_delay=0.0, budget=RetryBudget(ratio=0.0, min_tokens=1)))
+    manager.register_provider("down", FakeProvider, error=ConnectionError("refused"))
+    with pytest.raises(ConnectionError):
+        manager.generate("down", "m", user_text="hi")
+    # One retry from the budget, then the error surfaces.
+    assert manager.get_provider("down").calls == 2
+
+
+def test_classification():
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(ValueError())
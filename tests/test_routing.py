@@ -0,0 +1,114 @@
+import random
+
+import pytest
+
+from multi_ai_handler import AIProviderManager, Router
+from tests.fakes import FakeProvider
+
+POOL = [("a", "m"), ("b", "m"), ("c", "m")]
+
+
+def _measured(router: Router, provider: str, seconds: float, chars: int = 100, error: bool = False) -> None:
+    router.start(provider, "m")
+    router.finish(provider, "m", seconds, ttft=seconds / 2, chars=None if error else chars, error=error)
+
+
+def test_ranks_by_expected_latency():
+    router = Router({"auto": POOL}, explore=0)
+    for provider, seconds in (("a", 0.3), ("b", 0.1), ("c", 0.2)):
+        _measured(router, provider, seconds)
+
+    assert router.route("auto") == [("b", "m"), ("c", "m"), ("a", "m")]
+    decision = router.decisions[-1]
+    assert decision.chosen == ("b", "m") and not decision.explored
+    costs = [cost for _, _, cost in decision.ranking]
+    assert costs == sorted(costs)
+    assert costs[0] == pytest.approx(0.1)
+
+
+def test_untried_candidates_go_first():
+    router = Router({"auto": POOL}, explore=0)
+    _measured(router, "a", 0.1)
+    _measured(router, "b", 0.1)
+
+    assert router.route("auto")[0] == ("c", "m")
+
+
+def test_in_flight_requests_raise_the_cost():
+    router = Router({"auto": POOL[:2]}, explore=0)
+    _measured(router, "a", 0.1)
+    _measured(router, "b", 0.15)
+    assert router.route("auto")[0] == ("a", "m")
+
+    router.start("a", "m")
+    # 0.1 * (1 + 1) in flight > 0.15
+    assert router.route("auto")[0] == ("b", "m")
+    assert router.stats()[("a", "m")].in_flight == 1
+
+
+def test_errors_raise_the_cost():
+    router = Router({"auto": POOL[:2]}, alpha=0.5, explore=0)
+    _measured(router, "a", 0.1)
+    _measured(router, "b", 0.15)
+    _measured(router, "a", 0.1, error=True)
+
+    assert router.stats()[("a", "m")].error_rate == pytest.approx(0.5)
+    assert router.route("auto")[0] == ("b", "m")
+
+
+def test_exploration_tries_another_candidate_first():
+    random.seed(1)
+    router = Router({"auto": POOL}, explore=1.0)
+    for provider, seconds in (("a", 0.1), ("b", 0.2), ("c", 0.3)):
+        _measured(router, provider, seconds)
+
+    order = router.route("auto")
+
+    assert order[0] != ("a", "m")
+    assert sorted(order) == POOL
+    assert router.decisions[-1].explored
+
+
+def test_decisions_are_bounded_and_stats_are_copies():
+    router = Router({"auto": POOL}, explore=0, max_decisions=2)
+    for _ in range(5):
+        router.route("auto")
+    assert len(router.decisions) == 2
+
+    router.stats()[("a", "m")].in_flight = 99
+    assert router.stats()[("a", "m")].in_flight == 0
+
+
+def _manager(**providers) -> AIProviderManager:
+    manager = AIProviderManager(router=Router({"auto": [(name, "m") for name in providers]}, explore=0))
+    for name, config in providers.items():
+        manager.register_provider(name, FakeProvider, reply=name, **config)
+    return manager
+
+
+def test_manager_settles_on_the_fastest_candidate():
+    manager = _manager(slow={"delay": 0.05}, fast={})
+
+    replies = [manager.generate("auto", "m", user_text=str(i)).content for i in range(6)]
+
+    # Each candidate is measured once, then the fast one takes every request.
+    assert sorted(replies[:2]) == ["fast", "slow"]
+    assert replies[2:] == ["fast"] * 4
+
+
+def test_manager_fails_over_in_ranking_order():
+    manager = _manager(first={"errors": (ConnectionError("down"),)}, second={"delay": 0.01}, third={"delay": 0.05})
+    for name in ("second", "third"):
+        manager.generate(name, "m", user_text="warm up")
+    router = manager.router
+    _measured(router, "first", 0.001)
+    _measured(router, "second", 0.02)
+    _measured(router, "third", 0.1)
+
+    response = manager.generate("auto", "m", user_text="hi")
+
+    assert response.content == "second"
+    assert router.decisions[-1].chosen == ("first", "m")
+    assert manager.get_provider("first").calls == 1
+    assert manager.get_provider("third").calls == 1
+    assert router.stats()[("first", "m")].error_rate > 0
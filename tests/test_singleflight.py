@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from multi_ai_handler.singleflight import SingleFlight
+
+
+def _counting(chunks: list[str], calls: list):
+    def fn():
+        calls.append(1)
+        return iter(chunks)
+    return fn
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.call("k", fn))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    started.wait(5)
+    # Let the other callers join before the leader's call returns.
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+
+
+def test_errors_are_shared_and_key_released():
+    flight = SingleFlight()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.call("k", fail)
+    assert flight.call("k", lambda: "ok") == "ok"
+
+
+def test_stream_subscribers_get_every_chunk():
+    flight = SingleFlight()
+    calls = []
+    first = flight.stream("k", _counting(["a", "b", "c"], calls))
+    second = flight.stream("k", _counting(["x"], calls))
+
+    assert next(first) == "a"
+    assert list(second) == ["a", "b", "c"]
+    assert list(first) == ["b", "c"]
+    assert len(calls) == 1
+
+
+def test_abandoned_stream_is_not_joined(monkeypatch):
+    flight = SingleFlight()
+    # Keep finished entries registered, as in the window before their on_finish removes them.
+    monkeypatch.setattr(flight, "_discard", lambda key, entry: None)
+    calls = []
+
+    abandoned = flight.stream("k", _counting(["a", "b", "c"], calls))
+    next(abandoned)
+    abandoned.close()
+
+    assert list(flight.stream("k", _counting(["a", "b", "c"], calls))) == ["a", "b", "c"]
+    assert len(calls) == 2
+
+
+def test_abandoned_async_stream_is_not_joined(monkeypatch):
+    flight = SingleFlight()
+    monkeypatch.setattr(flight, "_discard", lambda key, entry: None)
+    calls = []
+
+    def fn():
+        calls.append(1)
+
+        async def chunks():
+            for chunk in ("a", "b", "c"):
+                yield chunk
+        return chunks()
+
+    async def main():
+        abandoned = flight.astream("k", fn)
+        await anext(abandoned)
+        await abandoned.aclose()
+        return [chunk async for chunk in flight.astream("k", fn)]
+
+    assert asyncio.run(main()) == ["a", "b", "c"]
+    assert len(calls) == 2
+
+
+def test_cancelled_sole_subscriber_closes_upstream():
+    flight = SingleFlight()
+    closed = []
+
+    async def slow():
+        try:
+            yield "a"
+            await asyncio.sleep(5)
+            yield "b"
+        finally:
+            closed.append(1)
+
+    async def main():
+        chunks = []
+
+        async def consume():
+            async for chunk in flight.astream("k", slow):
+                chunks.append(chunk)
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return chunks
+
+    assert asyncio.run(main()) == ["a"]
+    assert closed == [1]